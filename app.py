@@ -33,10 +33,59 @@ def make_shell_context():
 @app.cli.command()
 def init_db():
     """Initialize the database"""
+    from app.utils.search import create_search_schema
+    
     db.create_all()
+    create_search_schema()
+    db.session.commit()
     print('Database initialized!')
 
 
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Create and rebuild the event full-text search index"""
+    from app.utils.search import rebuild_search_index as rebuild
+    
+    count = rebuild()
+    print(f'Search index rebuilt for {count} events!')
+
+
+@app.cli.command('reconcile-category-counts')
+def reconcile_category_counts():
+    """Recompute denormalized category event counts now (for cron when the sweeper thread is off)"""
+    from app.utils.category_counts import reconcile_category_counts as reconcile
+    
+    drifted = reconcile()
+    print(f'Category counts reconciled ({len(drifted)} corrected)')
+
+
+@app.cli.command('flush-view-counts')
+def flush_view_counts():
+    """Write buffered event views to the database now"""
+    from app.utils.view_counter import flush_views
+    
+    count = flush_views()
+    print(f'Flushed {count} buffered views')
+
+
+@app.cli.command('sweep-reservations')
+def sweep_reservations():
+    """Release expired ticket holds now (for cron when the sweeper thread is off)"""
+    from app.utils.reservation_sweeper import sweep_expired
+    
+    count = sweep_expired()
+    print(f'Released {count} expired ticket holds')
+
+
+@app.cli.command('purge-idempotency-keys')
+def purge_idempotency_keys():
+    """Delete expired Idempotency-Key records now (for cron when the sweeper thread is off)"""
+    from app.utils.idempotency import purge_expired_keys
+    
+    count = purge_expired_keys(limit=None)
+    print(f'Purged {count} expired idempotency keys')
+
+
 @app.cli.command()
 def seed_db():
     """Seed the database with initial data"""
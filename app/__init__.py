@@ -191,6 +191,34 @@ def create_app(config_name='default'):
     
     limiter.init_app(app)
     
+    # Cache for public event listings
+    from app.utils.cache import init_cache
+    init_cache(app)
+    
+    # Autocomplete index versioning
+    from app.utils.autocomplete import register_autocomplete_tracking
+    register_autocomplete_tracking()
+    
+    # Denormalized per-category event counters
+    from app.utils.category_counts import register_category_count_tracking
+    register_category_count_tracking()
+    
+    # Geohash spatial index for nearby events
+    from app.utils.geo import register_geohash_tracking
+    register_geohash_tracking()
+    
+    # Buffered event view counter
+    from app.utils.view_counter import init_view_counter
+    init_view_counter(app)
+    
+    # Background expiry of unpaid ticket holds
+    from app.utils.reservation_sweeper import init_reservation_sweeper
+    init_reservation_sweeper(app)
+    
+    # Virtual waiting room for high-demand on-sales
+    from app.utils.waiting_room import init_waiting_room
+    init_waiting_room(app)
+    
     # Register blueprints
     from app.routes import auth, users, partners, admin, events, tickets, payments, notifications, seo, messages
     
@@ -342,6 +370,52 @@ def create_app(config_name='default'):
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response
     
+    # Diagnostic endpoint for the public listing cache
+    @app.route('/api/diagnostics/cache', methods=['GET'])
+    def check_listing_cache():
+        """Diagnostic endpoint with listing cache backend and hit/miss counts"""
+        from app.utils.cache import get_cache, metrics
+        cache = get_cache()
+        
+        result = {
+            'backend': cache.name,
+            'version': None,
+            'namespaces': metrics.snapshot()
+        }
+        try:
+            result['version'] = cache.get_version()
+        except Exception as e:
+            result['error'] = str(e)
+        
+        response = make_response(jsonify(result))
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    # Diagnostic endpoint for ticket hold expiry
+    @app.route('/api/diagnostics/reservations', methods=['GET'])
+    def check_reservation_sweeper():
+        """Diagnostic endpoint with hold lifecycle counts and the reservation ledger"""
+        from app.utils.reservation_sweeper import sweeper_status
+        
+        try:
+            result = sweeper_status()
+        except Exception as e:
+            result = {'error': str(e)}
+        
+        response = make_response(jsonify(result))
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    # Diagnostic endpoint for outbound integrations
+    @app.route('/api/diagnostics/upstreams', methods=['GET'])
+    def check_upstreams():
+        """Diagnostic endpoint with circuit state, latency and error counts per upstream"""
+        from app.utils.http_client import upstream_status
+        
+        response = make_response(jsonify({'upstreams': upstream_status()}))
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
     # Block direct access to database files - prevents CORS issues
     @app.route('/nikofree.db', methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
     @app.route('/<path:path>.db', methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
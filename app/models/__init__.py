@@ -1,7 +1,7 @@
 from app.models.user import User
 from app.models.partner import Partner
-from app.models.event import Event, EventHost, EventInterest, EventPromotion
-from app.models.ticket import Ticket, TicketType, Booking, PromoCode
+from app.models.event import Event, EventHost, EventInterest, EventPromotion, EventViewBucket
+from app.models.ticket import Ticket, TicketType, Booking, BookingItem, PromoCode, PromoCodeRedemption, TicketReservation
 from app.models.payment import Payment, PartnerPayout
 from app.models.category import Category, Location
 from app.models.notification import Notification
@@ -9,6 +9,8 @@ from app.models.admin import AdminLog
 from app.models.review import Review
 from app.models.message import Feedback, ContactMessage
 from app.models.rejection_reason import RejectionReason
+from app.models.scheduler import SchedulerLock
+from app.models.idempotency import IdempotencyKey
 
 __all__ = [
     'User',
@@ -17,10 +19,14 @@ __all__ = [
     'EventHost',
     'EventInterest',
     'EventPromotion',
+    'EventViewBucket',
     'Ticket',
     'TicketType',
     'Booking',
+    'BookingItem',
     'PromoCode',
+    'PromoCodeRedemption',
+    'TicketReservation',
     'Payment',
     'PartnerPayout',
     'Category',
@@ -30,6 +36,8 @@ __all__ = [
     'Review',
     'Feedback',
     'ContactMessage',
-    'RejectionReason'
+    'RejectionReason',
+    'SchedulerLock',
+    'IdempotencyKey'
 ]
 
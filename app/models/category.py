@@ -16,6 +16,10 @@ class Category(db.Model):
     display_order = db.Column(db.Integer, default=0)
     is_active = db.Column(db.Boolean, default=True)
     
+    # Denormalized count of upcoming approved events (see app/utils/category_counts.py)
+    upcoming_event_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    event_count_updated_at = db.Column(db.DateTime, nullable=True)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
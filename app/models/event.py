@@ -6,6 +6,11 @@ from app import db
 class Event(db.Model):
     """Event model"""
     __tablename__ = 'events'
+    __table_args__ = (
+        # Keyset pagination seeks
+        db.Index('ix_events_start_date_id', 'start_date', 'id'),
+        db.Index('ix_events_created_at_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -31,6 +36,7 @@ class Event(db.Model):
     venue_address = db.Column(db.String(500), nullable=True)
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
+    geohash = db.Column(db.String(12), nullable=True, index=True)  # Set from latitude/longitude by app.utils.geo
     online_link = db.Column(db.String(500), nullable=True)
     location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=True)
     
@@ -50,6 +56,7 @@ class Event(db.Model):
     # Statistics
     view_count = db.Column(db.Integer, default=0)
     attendee_count = db.Column(db.Integer, default=0)
+    seats_held = db.Column(db.Integer, default=0, nullable=False, server_default='0')  # Seats held by unpaid bookings (app/utils/inventory.py)
     total_tickets_sold = db.Column(db.Integer, default=0)
     revenue = db.Column(db.Numeric(10, 2), default=0.00)
     
@@ -70,6 +77,32 @@ class Event(db.Model):
     
     def to_dict(self, include_stats=False):
         """Convert event to dictionary"""
+        stats = None
+        if include_stats:
+            # Add bucketlist count (likes) - query the bucketlist table directly
+            from app.utils.bucketlist import get_bucketlist_counts
+            bucketlist_count = get_bucketlist_counts([self.id]).get(self.id, 0)
+            # Add actual bookings count (people going) - kept for backward compatibility
+            bookings_count = self.bookings.filter_by(status='confirmed').count()
+            stats = {'bucketlist_count': bucketlist_count, 'bookings_count': bookings_count}
+        
+        return self.serialize(
+            organizer=self.organizer,
+            category=self.category,
+            location=self.location,
+            hosts=list(self.hosts),
+            interests=list(self.interests),
+            ticket_types=list(self.ticket_types),
+            promo_codes=list(self.promo_codes),
+            stats=stats
+        )
+    
+    def serialize(self, organizer, category, location, hosts, interests, ticket_types, promo_codes, stats=None):
+        """Build the event dictionary from already-loaded related rows
+        
+        Used by to_dict() for single events and by serialize_events() for lists,
+        so both produce identical JSON.
+        """
         # Filter out base64 data URIs from poster_image (they shouldn't be in DB, but handle if they are)
         poster_image = self.poster_image
         if poster_image and poster_image.startswith('data:image'):
@@ -81,7 +114,7 @@ class Event(db.Model):
         total_tickets_available = 0
         has_limited_tickets = False
         
-        for ticket_type in self.ticket_types:
+        for ticket_type in ticket_types:
             if ticket_type.quantity_available is not None:
                 has_limited_tickets = True
                 total_tickets_available += ticket_type.quantity_available
@@ -94,8 +127,8 @@ class Event(db.Model):
             'title': self.title,
             'description': self.description,
             'poster_image': poster_image,
-            'partner': self.organizer.to_dict() if self.organizer else None,
-            'category': self.category.to_dict() if self.category else None,
+            'partner': organizer.to_dict() if organizer else None,
+            'category': category.to_dict() if category else None,
             'start_date': self.start_date.isoformat(),
             'end_date': self.end_date.isoformat() if self.end_date else None,
             'attendee_capacity': self.attendee_capacity,
@@ -105,36 +138,28 @@ class Event(db.Model):
             'latitude': self.latitude,
             'longitude': self.longitude,
             'online_link': self.online_link,
-            'location': self.location.to_dict() if self.location else None,
+            'location': location.to_dict() if location else None,
             'is_free': self.is_free,
             'status': self.status,
             'is_published': self.is_published,
             'is_featured': self.is_featured,
             'created_at': self.created_at.isoformat(),
             'published_at': self.published_at.isoformat() if self.published_at else None,
-            'hosts': [host.to_dict() for host in self.hosts],
-            'interests': [interest.name for interest in self.interests],
-            'ticket_types': [tt.to_dict() for tt in self.ticket_types],
-            'promo_codes': [pc.to_dict() for pc in self.promo_codes],
+            'hosts': [host.to_dict() for host in hosts],
+            'interests': [interest.name for interest in interests],
+            'ticket_types': [tt.to_dict() for tt in ticket_types],
+            'promo_codes': [pc.to_dict() for pc in promo_codes],
             # Always include attendee_count (total tickets sold, not number of bookings)
             'attendee_count': self.attendee_count,
             'tickets_left': tickets_left  # None means unlimited tickets
         }
         
-        if include_stats:
+        if stats is not None:
             data['view_count'] = self.view_count
             data['total_tickets_sold'] = self.total_tickets_sold
             data['revenue'] = float(self.revenue)
-            # Add bucketlist count (likes) - query the bucketlist table directly
-            from app.models.user import bucketlist
-            from sqlalchemy import func
-            bucketlist_count = db.session.query(func.count(bucketlist.c.user_id)).filter(
-                bucketlist.c.event_id == self.id
-            ).scalar() or 0
-            data['bucketlist_count'] = bucketlist_count
-            # Add actual bookings count (people going) - kept for backward compatibility
-            bookings_count = self.bookings.filter_by(status='confirmed').count()
-            data['bookings_count'] = bookings_count
+            data['bucketlist_count'] = stats.get('bucketlist_count', 0)
+            data['bookings_count'] = stats.get('bookings_count', 0)
             
         return data
     
@@ -218,3 +243,23 @@ class EventPromotion(db.Model):
         
         return data
 
+
+
+class EventViewBucket(db.Model):
+    """Hourly event page views, written in batches by the view counter"""
+    __tablename__ = 'event_view_buckets'
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'bucket_start', name='unique_event_view_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id', ondelete='CASCADE'), nullable=False, index=True)
+    bucket_start = db.Column(db.DateTime, nullable=False, index=True)  # Start of the UTC hour
+    views = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'event_id': self.event_id,
+            'bucket_start': self.bucket_start.isoformat(),
+            'views': self.views
+        }
@@ -0,0 +1,27 @@
+from datetime import datetime
+from app import db
+
+
+class IdempotencyKey(db.Model):
+    """A client's Idempotency-Key for one endpoint, with the response it got"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', name='uq_idempotency_keys_scope_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(150), nullable=False)  # '<user id>:<endpoint>'
+    key = db.Column(db.String(255), nullable=False)  # Client-chosen Idempotency-Key header
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 of method, path and body
+    
+    # Status
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, completed
+    locked_until = db.Column(db.DateTime, nullable=True)  # Another request may take over a stalled one after this
+    
+    # Stored response, replayed for retries
+    response_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    response_mimetype = db.Column(db.String(100), nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # Purged after this
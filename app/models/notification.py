@@ -5,6 +5,9 @@ from app import db
 class Notification(db.Model):
     """User notifications"""
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_created_at_id', 'user_id', 'created_at', 'id'),  # Keyset pagination
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -5,6 +5,9 @@ from app import db
 class Payment(db.Model):
     """Payment transactions"""
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_user_created_at_id', 'user_id', 'created_at', 'id'),  # Keyset pagination
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     transaction_id = db.Column(db.String(100), unique=True, nullable=False, index=True)
@@ -29,6 +32,9 @@ class Payment(db.Model):
     # MPesa Details
     mpesa_receipt_number = db.Column(db.String(100), nullable=True)
     phone_number = db.Column(db.String(20), nullable=True)
+    # STK push identifiers returned by Daraja - indexed so callbacks resolve in one lookup
+    checkout_request_id = db.Column(db.String(100), unique=True, nullable=True, index=True)
+    merchant_request_id = db.Column(db.String(100), nullable=True, index=True)
     
     # Status
     status = db.Column(db.String(20), default='pending')  # pending, completed, failed, refunded
@@ -47,6 +53,22 @@ class Payment(db.Model):
     completed_at = db.Column(db.DateTime, nullable=True)
     failed_at = db.Column(db.DateTime, nullable=True)
     
+    def record_stk_push(self, response):
+        """Store the STK push identifiers from a successful Daraja response"""
+        self.checkout_request_id = response.get('CheckoutRequestID')
+        self.merchant_request_id = response.get('MerchantRequestID')
+        self.payment_metadata = {
+            'CheckoutRequestID': self.checkout_request_id,
+            'MerchantRequestID': self.merchant_request_id
+        }
+    
+    @classmethod
+    def find_by_checkout_request_id(cls, checkout_request_id):
+        """Resolve a payment from its CheckoutRequestID (single indexed lookup)"""
+        if not checkout_request_id:
+            return None
+        return cls.query.filter_by(checkout_request_id=checkout_request_id).first()
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -0,0 +1,20 @@
+from datetime import datetime
+from app import db
+
+
+class SchedulerLock(db.Model):
+    """Lease on a background job, so one worker runs it at a time"""
+    __tablename__ = 'scheduler_locks'
+    
+    name = db.Column(db.String(100), primary_key=True)  # e.g. 'reservation-sweeper'
+    owner = db.Column(db.String(200), nullable=False)  # host:pid:nonce of the worker holding the lease
+    expires_at = db.Column(db.DateTime, nullable=False)  # Other workers may take over after this
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'owner': self.owner,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'acquired_at': self.acquired_at.isoformat() if self.acquired_at else None
+        }
@@ -1,8 +1,14 @@
 from datetime import datetime
+from sqlalchemy.orm import validates
 from app import db
 import uuid
 
 
+def normalize_promo_code(code):
+    """Promo codes are stored and looked up trimmed and upper-cased"""
+    return (code or '').strip().upper()
+
+
 class TicketType(db.Model):
     """Ticket types for events"""
     __tablename__ = 'ticket_types'
@@ -18,6 +24,7 @@ class TicketType(db.Model):
     quantity_total = db.Column(db.Integer, nullable=True)  # None = unlimited
     quantity_sold = db.Column(db.Integer, default=0)
     quantity_available = db.Column(db.Integer, nullable=True)
+    quantity_held = db.Column(db.Integer, default=0, nullable=False, server_default='0')  # Held by unpaid bookings (ticket_reservations)
     
     # Sales Period
     sales_start = db.Column(db.DateTime, nullable=True)
@@ -40,6 +47,7 @@ class TicketType(db.Model):
             'quantity_total': self.quantity_total,
             'quantity_sold': self.quantity_sold,
             'quantity_available': self.quantity_available,
+            'quantity_held': self.quantity_held,
             'sales_start': self.sales_start.isoformat() if self.sales_start else None,
             'sales_end': self.sales_end.isoformat() if self.sales_end else None,
             'is_active': self.is_active,
@@ -52,6 +60,9 @@ class TicketType(db.Model):
 class Booking(db.Model):
     """Booking/Registration for events"""
     __tablename__ = 'bookings'
+    __table_args__ = (
+        db.Index('ix_bookings_user_created_at_id', 'user_id', 'created_at', 'id'),  # Keyset pagination
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     booking_number = db.Column(db.String(50), unique=True, nullable=False, index=True)
@@ -59,6 +70,7 @@ class Booking(db.Model):
     # References
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     event_id = db.Column(db.Integer, db.ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
+    ticket_type_id = db.Column(db.Integer, db.ForeignKey('ticket_types.id'), nullable=True, index=True)  # None for bookings made before it was recorded
     
     # Booking Details
     quantity = db.Column(db.Integer, default=1)
@@ -84,10 +96,11 @@ class Booking(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     confirmed_at = db.Column(db.DateTime, nullable=True)
     cancelled_at = db.Column(db.DateTime, nullable=True)
-    reserved_until = db.Column(db.DateTime, nullable=True, index=True)  # When reservation expires (5 minutes for payment)
+    reserved_until = db.Column(db.DateTime, nullable=True, index=True)  # When reservation expires (BOOKING_HOLD_MINUTES for payment)
     
     # Relationships
     tickets = db.relationship('Ticket', backref='booking', lazy='dynamic', cascade='all, delete-orphan')
+    items = db.relationship('BookingItem', backref='booking', lazy='dynamic', cascade='all, delete-orphan')
     payment = db.relationship('Payment', backref='booking', foreign_keys=[payment_id])
     promo_code = db.relationship('PromoCode', backref='bookings')
     
@@ -101,6 +114,18 @@ class Booking(db.Model):
         """Generate unique booking number"""
         return f"NF-{datetime.utcnow().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
     
+    def lines(self):
+        """(ticket_type_id, quantity) per ticket type booked
+
+        Cart bookings list their ticket types in booking_items; single-type
+        bookings use ticket_type_id and quantity (ticket_type_id is None for
+        bookings made before it was recorded).
+        """
+        items = self.items.order_by(BookingItem.id).all()
+        if items:
+            return [(item.ticket_type_id, item.quantity) for item in items]
+        return [(self.ticket_type_id, self.quantity)]
+    
     def to_dict(self, include_event_stats=False):
         try:
             user_dict = None
@@ -152,6 +177,56 @@ class Booking(db.Model):
             }
 
 
+class BookingItem(db.Model):
+    """One ticket type in a cart booking"""
+    __tablename__ = 'booking_items'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id', ondelete='CASCADE'), nullable=False, index=True)
+    ticket_type_id = db.Column(db.Integer, db.ForeignKey('ticket_types.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column(db.Numeric(10, 2), nullable=False, default=0.00)
+    
+    ticket_type = db.relationship('TicketType')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'ticket_type_id': self.ticket_type_id,
+            'ticket_type': self.ticket_type.name if self.ticket_type else None,
+            'quantity': self.quantity,
+            'unit_price': float(self.unit_price) if self.unit_price is not None else 0.0
+        }
+
+
+class TicketReservation(db.Model):
+    """Tickets of one type held by an unpaid booking until it is paid or expires_at passes"""
+    __tablename__ = 'ticket_reservations'
+    __table_args__ = (
+        db.Index('ix_ticket_reservations_event_expires_at', 'event_id', 'expires_at'),
+        db.UniqueConstraint('booking_id', 'ticket_type_id', name='uq_ticket_reservations_booking_ticket_type'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id', ondelete='CASCADE'), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
+    ticket_type_id = db.Column(db.Integer, db.ForeignKey('ticket_types.id', ondelete='CASCADE'), nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'booking_id': self.booking_id,
+            'event_id': self.event_id,
+            'ticket_type_id': self.ticket_type_id,
+            'quantity': self.quantity,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
 class Ticket(db.Model):
     """Individual tickets"""
     __tablename__ = 'tickets'
@@ -170,6 +245,7 @@ class Ticket(db.Model):
     scanned_at = db.Column(db.DateTime, nullable=True)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # Change cursor for check-in manifests
     
     ticket_type = db.relationship('TicketType', backref='tickets')
     
@@ -201,7 +277,7 @@ class PromoCode(db.Model):
     __tablename__ = 'promo_codes'
     
     id = db.Column(db.Integer, primary_key=True)
-    code = db.Column(db.String(50), unique=True, nullable=False, index=True)
+    code = db.Column(db.String(50), unique=True, nullable=False, index=True)  # Always normalized, so lookups use the index
     
     # References
     event_id = db.Column(db.Integer, db.ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
@@ -225,6 +301,10 @@ class PromoCode(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('partners.id'), nullable=False)
     
+    @validates('code')
+    def _normalize_code(self, key, code):
+        return normalize_promo_code(code)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -239,3 +319,15 @@ class PromoCode(db.Model):
             'is_active': self.is_active
         }
 
+
+class PromoCodeRedemption(db.Model):
+    """Uses of a promo code by one user, counted against max_uses_per_user"""
+    __tablename__ = 'promo_code_redemptions'
+    __table_args__ = (
+        db.UniqueConstraint('promo_code_id', 'user_id', name='uq_promo_code_redemptions_code_user'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    promo_code_id = db.Column(db.Integer, db.ForeignKey('promo_codes.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    uses = db.Column(db.Integer, nullable=False, default=0)
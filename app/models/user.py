@@ -6,6 +6,9 @@ from werkzeug.security import generate_password_hash, check_password_hash
 class User(db.Model):
     """User model for attendees"""
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),  # Keyset pagination
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
@@ -11,6 +11,8 @@ from app.models.category import Category, Location
 from app.models.admin import AdminLog
 from app.models.message import Feedback, ContactMessage
 from app.utils.decorators import admin_required
+from app.utils.event_serializer import serialize_events
+from app.utils.pagination import paginate_query, cursor_fields
 from app.utils.email import send_partner_approval_email, send_event_approval_email, send_partner_suspension_email, send_partner_activation_email, send_payout_approval_email, send_email
 from app.routes.notifications import notify_event_approved, notify_event_rejected, notify_partner_approved, notify_partner_rejected
 from app.utils.sms import send_partner_suspension_sms, send_partner_activation_sms, send_payout_approval_sms
@@ -821,33 +823,38 @@ def get_event_stats(current_admin):
 def get_events(current_admin):
     """Get all events"""
     status = request.args.get('status')
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
     
     query = Event.query
     
     if status:
         query = query.filter_by(status=status)
     
-    events = query.order_by(Event.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        events = paginate_query(query, Event.created_at, Event.id)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     
     # Check if events are promoted
     from app.models.event import EventPromotion
     from datetime import datetime
     now = datetime.utcnow()
     
-    events_data = []
-    for event in events.items:
-        event_dict = event.to_dict(include_stats=True)
-        # Check if event has an active promotion
-        active_promotion = EventPromotion.query.filter(
-            EventPromotion.event_id == event.id,
+    # Active promotions for the whole page in one query
+    event_ids = [event.id for event in events.items]
+    active_promotions = {}
+    if event_ids:
+        for promotion in EventPromotion.query.filter(
+            EventPromotion.event_id.in_(event_ids),
             EventPromotion.is_active == True,
             EventPromotion.start_date <= now,
             EventPromotion.end_date >= now
-        ).first()
+        ).order_by(EventPromotion.id).all():
+            active_promotions.setdefault(promotion.event_id, promotion)
+    
+    events_data = []
+    for event, event_dict in zip(events.items, serialize_events(events.items, include_stats=True)):
+        # Check if event has an active promotion
+        active_promotion = active_promotions.get(event.id)
         
         event_dict['is_promoted'] = active_promotion is not None
         if active_promotion:
@@ -858,7 +865,8 @@ def get_events(current_admin):
         'events': events_data,
         'total': events.total,
         'page': events.page,
-        'pages': events.pages
+        'pages': events.pages,
+        **cursor_fields(events)
     }), 200
 
 
@@ -1147,8 +1155,6 @@ def get_promoted_events(current_admin):
 @admin_required
 def get_users(current_admin):
     """Get all users"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
     search = request.args.get('search', '').strip()
     
     query = User.query
@@ -1162,15 +1168,17 @@ def get_users(current_admin):
             )
         )
     
-    users = query.order_by(User.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        users = paginate_query(query, User.created_at, User.id)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     
     return jsonify({
         'users': [user.to_dict() for user in users.items],
         'total': users.total,
         'page': users.page,
-        'pages': users.pages
+        'pages': users.pages,
+        **cursor_fields(users)
     }), 200
 
 
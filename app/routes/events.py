@@ -1,29 +1,34 @@
-from flask import Blueprint, request, jsonify
-from datetime import datetime
-from sqlalchemy import or_, and_
+from flask import Blueprint, request, jsonify, current_app
+from datetime import datetime, timedelta
+from sqlalchemy import and_
 from app import db, limiter
 from app.models.event import Event, EventHost, EventInterest, EventPromotion
 from app.models.category import Category, Location
 from app.models.user import User
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from app.utils.decorators import optional_user, user_required
 from app.utils.file_upload import upload_file
+from app.utils.event_serializer import serialize_events
+from app.utils.bucketlist import get_bucketlist_event_ids, mark_in_bucketlist
+from app.utils.search import apply_search
+from app.utils.pagination import paginate_query, cursor_fields
+from app.utils.cache import cached_listing
+from app.utils.category_counts import get_category_event_counts
+from app.utils.view_counter import record_view
+from app.utils.geo import find_nearby_events
+from app.utils.autocomplete import get_autocomplete_index
 
 bp = Blueprint('events', __name__)
 
 
-@bp.route('/', methods=['GET'])
-@bp.route('', methods=['GET'])  # Also handle without trailing slash
-@optional_user
-@limiter.exempt
-def get_events(current_user):
-    """Get all events with filters"""
-    # Query parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
+def _filtered_events_query():
+    """Upcoming published events narrowed by the shared listing filters in request.args
+    
+    Filters: category (slug), location (slug), is_free, featured, this_weekend.
+    """
     category = request.args.get('category')
     location = request.args.get('location')
-    search = request.args.get('search', '').strip()
     is_free = request.args.get('is_free')
     featured = request.args.get('featured', 'false').lower() == 'true'
     this_weekend = request.args.get('this_weekend', 'false').lower() == 'true'
@@ -58,7 +63,6 @@ def get_events(current_user):
     
     # Filter this weekend
     if this_weekend:
-        from datetime import timedelta
         today = datetime.utcnow()
         # Find next Saturday and Sunday
         days_until_saturday = (5 - today.weekday()) % 7
@@ -71,38 +75,102 @@ def get_events(current_user):
             Event.start_date < monday
         )
     
-    # Search by keyword
-    if search:
-        query = query.filter(
-            or_(
-                Event.title.ilike(f'%{search}%'),
-                Event.description.ilike(f'%{search}%')
-            )
-        )
+    return query
+
+
+@bp.route('/', methods=['GET'])
+@bp.route('', methods=['GET'])  # Also handle without trailing slash
+@cached_listing('events', anonymous_only=True)
+@optional_user
+@limiter.exempt
+def get_events(current_user):
+    """Get all events with filters"""
+    # Query parameters
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 20, type=int)
+    search = request.args.get('search', '').strip()
     
-    # Order by date
-    query = query.order_by(Event.start_date.asc())
+    query = _filtered_events_query()
     
-    # Paginate
-    events = query.paginate(page=page, per_page=per_page, error_out=False)
+    # Search by keyword - ranked by relevance, then by date (relevance order always uses offset pages)
+    if search:
+        events = apply_search(query, search).order_by(Event.start_date.asc()).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        if events.total == 0:
+            # Nothing matched exactly - retry with typo-tolerant matching
+            events = apply_search(query, search, fuzzy=True).order_by(Event.start_date.asc()).paginate(
+                page=page, per_page=per_page, error_out=False
+            )
+    else:
+        # Order by date - offset pages by default, keyset pages with ?cursor=
+        try:
+            events = paginate_query(query, Event.start_date, Event.id, descending=False)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
     
     # Build events list with bucketlist status
-    events_list = []
-    for event in events.items:
-        event_dict = event.to_dict()
-        # Check if event is in user's bucketlist
-        if current_user:
-            event_dict['in_bucketlist'] = event in current_user.bucketlist
-        else:
-            event_dict['in_bucketlist'] = False
-        events_list.append(event_dict)
+    events_list = mark_in_bucketlist(serialize_events(events.items), current_user)
     
     return jsonify({
         'events': events_list,
         'total': events.total,
         'page': events.page,
         'pages': events.pages,
-        'per_page': events.per_page
+        'per_page': events.per_page,
+        **cursor_fields(events)
+    }), 200
+
+
+@bp.route('/nearby', methods=['GET'])
+@cached_listing('events_nearby', anonymous_only=True)
+@optional_user
+@limiter.exempt
+def get_nearby_events(current_user):
+    """Get upcoming events within radius_km of a point, nearest first
+    
+    Accepts the same category, location, is_free, featured and this_weekend
+    filters as the events listing.
+    """
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius_km = request.args.get('radius_km', 10, type=float)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', 20, type=int)
+    per_page = max(1, min(per_page, current_app.config.get('MAX_ITEMS_PER_PAGE', 100)))
+    
+    if lat is None or lng is None:
+        return jsonify({'error': 'lat and lng are required'}), 400
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        return jsonify({'error': 'lat must be between -90 and 90 and lng between -180 and 180'}), 400
+    max_radius_km = current_app.config.get('NEARBY_MAX_RADIUS_KM', 200)
+    if not 0 < radius_km <= max_radius_km:
+        return jsonify({'error': f'radius_km must be greater than 0 and at most {max_radius_km:g}'}), 400
+    
+    nearby = find_nearby_events(_filtered_events_query(), lat, lng, radius_km)
+    total = len(nearby)
+    page_results = nearby[(page - 1) * per_page:page * per_page]
+    
+    events_by_id = {}
+    if page_results:
+        events_by_id = {
+            event.id: event
+            for event in Event.query.filter(Event.id.in_([event_id for event_id, _ in page_results])).all()
+        }
+    page_events = [events_by_id[event_id] for event_id, _ in page_results if event_id in events_by_id]
+    
+    events_list = mark_in_bucketlist(serialize_events(page_events), current_user)
+    distances = dict(page_results)
+    for event_data in events_list:
+        event_data['distance_km'] = round(distances[event_data['id']], 2)
+    
+    return jsonify({
+        'events': events_list,
+        'total': total,
+        'page': page,
+        'pages': (total + per_page - 1) // per_page,
+        'per_page': per_page,
+        'radius_km': radius_km
     }), 200
 
 
@@ -124,14 +192,11 @@ def get_event(current_user, event_id):
         # For logged-in users, allow viewing unpublished events
         # This helps with testing and allows users to see events they're interested in
     
-    # Increment view count
-    event.view_count += 1
-    db.session.commit()
+    # Buffered and flushed in batches; repeat views by the same viewer are ignored
+    record_view(event.id, current_user)
     
     # Check if user has bookmarked this event
-    in_bucketlist = False
-    if current_user:
-        in_bucketlist = event in current_user.bucketlist
+    in_bucketlist = event.id in get_bucketlist_event_ids(current_user, [event.id])
     
     event_data = event.to_dict(include_stats=True)
     event_data['in_bucketlist'] = in_bucketlist
@@ -144,7 +209,9 @@ def get_event(current_user, event_id):
 
 
 @bp.route('/promoted', methods=['GET'])
-def get_promoted_events():
+@cached_listing('events_promoted', anonymous_only=True)
+@optional_user
+def get_promoted_events(current_user):
     """Get promoted events (Can't Miss banner)"""
     # Get active promotions (both free and paid)
     now = datetime.utcnow()
@@ -158,9 +225,9 @@ def get_promoted_events():
     ).order_by(
         EventPromotion.is_paid.desc(),  # Paid promotions first
         EventPromotion.start_date.asc()  # Then by start date (earliest first)
-    ).limit(10).all()
+    ).options(joinedload(EventPromotion.event)).limit(10).all()
     
-    events = []
+    visible_promotions = []
     for promo in promotions:
         if promo.event and promo.event.is_published and promo.event.status == 'approved':
             # Check if event is past - use end_date if available, otherwise start_date
@@ -168,37 +235,41 @@ def get_promoted_events():
             if event_end_date < now:
                 # Event is past, skip it
                 continue
-            
-            event_dict = promo.event.to_dict()
-            
-            # Calculate promotion status
-            time_until_start = None
-            time_until_end = None
-            is_active_now = promo.start_date <= now <= promo.end_date
-            
-            if now < promo.start_date:
-                # Promotion hasn't started yet
-                time_until_start = (promo.start_date - now).total_seconds()
-            elif now > promo.end_date:
-                # Promotion has ended
-                time_until_end = 0
-            else:
-                # Promotion is active
-                time_until_end = (promo.end_date - now).total_seconds()
-            
-            # Include promotion info with status
-            event_dict['promotion'] = {
-                'id': promo.id,
-                'is_paid': promo.is_paid,
-                'days_count': promo.days_count,
-                'start_date': promo.start_date.isoformat(),
-                'end_date': promo.end_date.isoformat(),
-                'is_active_now': is_active_now,
-                'time_until_start': time_until_start,  # seconds until start (None if already started)
-                'time_until_end': time_until_end,  # seconds until end (None if not started or already ended)
-                'total_cost': float(promo.total_cost)
-            }
-            events.append(event_dict)
+            visible_promotions.append(promo)
+    
+    events = []
+    event_dicts = mark_in_bucketlist(
+        serialize_events([promo.event for promo in visible_promotions]), current_user
+    )
+    for promo, event_dict in zip(visible_promotions, event_dicts):
+        # Calculate promotion status
+        time_until_start = None
+        time_until_end = None
+        is_active_now = promo.start_date <= now <= promo.end_date
+        
+        if now < promo.start_date:
+            # Promotion hasn't started yet
+            time_until_start = (promo.start_date - now).total_seconds()
+        elif now > promo.end_date:
+            # Promotion has ended
+            time_until_end = 0
+        else:
+            # Promotion is active
+            time_until_end = (promo.end_date - now).total_seconds()
+        
+        # Include promotion info with status
+        event_dict['promotion'] = {
+            'id': promo.id,
+            'is_paid': promo.is_paid,
+            'days_count': promo.days_count,
+            'start_date': promo.start_date.isoformat(),
+            'end_date': promo.end_date.isoformat(),
+            'is_active_now': is_active_now,
+            'time_until_start': time_until_start,  # seconds until start (None if already started)
+            'time_until_end': time_until_end,  # seconds until end (None if not started or already ended)
+            'total_cost': float(promo.total_cost)
+        }
+        events.append(event_dict)
     
     return jsonify({
         'events': events,
@@ -208,6 +279,7 @@ def get_promoted_events():
 
 @bp.route('/categories', methods=['GET', 'OPTIONS'])
 @bp.route('/categories/', methods=['GET', 'OPTIONS'])
+@cached_listing('categories')
 @limiter.exempt
 def get_categories():
     """Get all event categories"""
@@ -221,21 +293,29 @@ def get_categories():
         response.headers.add('Access-Control-Max-Age', '3600')
         return response, 200
     
-    from sqlalchemy import func
     categories = Category.query.filter_by(is_active=True).order_by(Category.display_order).all()
     
+    # Optional freshness bound: stored counters no older than max_age seconds are acceptable
+    max_age = request.args.get('max_age', type=int)
+    use_stored_counts = False
+    if max_age is not None and max_age >= 0:
+        oldest_allowed = datetime.utcnow() - timedelta(seconds=max_age)
+        use_stored_counts = all(
+            cat.event_count_updated_at and cat.event_count_updated_at >= oldest_allowed
+            for cat in categories
+        )
+    
+    # Count upcoming approved events in every category with one grouped query
+    event_counts = None if use_stored_counts else get_category_event_counts()
+    
     # Add event count for each category
     categories_data = []
     for cat in categories:
         cat_dict = cat.to_dict()
-        # Count upcoming approved events in this category
-        event_count = Event.query.filter(
-            Event.category_id == cat.id,
-            Event.is_published == True,
-            Event.status == 'approved',
-            Event.start_date > datetime.utcnow()
-        ).count()
-        cat_dict['event_count'] = event_count
+        if use_stored_counts:
+            cat_dict['event_count'] = cat.upcoming_event_count
+        else:
+            cat_dict['event_count'] = event_counts.get(cat.id, 0)
         categories_data.append(cat_dict)
     
     response = jsonify({
@@ -249,7 +329,8 @@ def get_categories():
 
 
 @bp.route('/categories/<int:category_id>/events', methods=['GET'])
-def get_category_events(category_id):
+@optional_user
+def get_category_events(current_user, category_id):
     """Get events by category with preview"""
     category = Category.query.get(category_id)
     
@@ -266,12 +347,13 @@ def get_category_events(category_id):
     
     return jsonify({
         'category': category.to_dict(),
-        'events': [event.to_dict() for event in events],
+        'events': mark_in_bucketlist(serialize_events(events), current_user),
         'count': len(events)
     }), 200
 
 
 @bp.route('/locations', methods=['GET'])
+@cached_listing('locations')
 @limiter.exempt
 def get_locations():
     """Get all locations"""
@@ -352,7 +434,9 @@ def get_calendar_events():
 
 
 @bp.route('/this-weekend', methods=['GET'])
-def get_this_weekend_events():
+@cached_listing('events_this_weekend', anonymous_only=True)
+@optional_user
+def get_this_weekend_events(current_user):
     """Get events happening this weekend"""
     from datetime import timedelta
     
@@ -375,7 +459,7 @@ def get_this_weekend_events():
     ).order_by(Event.start_date).all()
     
     return jsonify({
-        'events': [event.to_dict() for event in events],
+        'events': mark_in_bucketlist(serialize_events(events), current_user),
         'count': len(events),
         'weekend_start': saturday.isoformat(),
         'weekend_end': sunday.isoformat()
@@ -390,12 +474,33 @@ def autocomplete_search():
     if not query or len(query) < 2:
         return jsonify({'suggestions': []}), 200
     
-    # Search events
-    events = Event.query.filter(
+    # Served from the worker's in-memory prefix index once it is warm
+    index = get_autocomplete_index()
+    if index is not None:
+        suggestions = index.search(query)
+        if suggestions:
+            return jsonify({'suggestions': suggestions}), 200
+    
+    return jsonify({
+        'suggestions': _autocomplete_from_database(query, fuzzy_only=index is not None)
+    }), 200
+
+
+def _autocomplete_from_database(query, fuzzy_only=False):
+    """Suggestions straight from the database - used while the prefix index is cold,
+    and for typo-tolerant event matches when the index finds nothing"""
+    base_query = Event.query.filter(
         Event.is_published == True,
         Event.status == 'approved',
-        Event.title.ilike(f'%{query}%')
-    ).limit(5).all()
+        Event.start_date > datetime.utcnow()
+    ).options(joinedload(Event.category))
+    
+    # Search events - prefix match on titles, falling back to typo-tolerant matching
+    events = []
+    if not fuzzy_only:
+        events = apply_search(base_query, query, title_only=True).limit(5).all()
+    if not events:
+        events = apply_search(base_query, query, fuzzy=True).limit(5).all()
     
     suggestions = []
     for event in events:
@@ -406,6 +511,9 @@ def autocomplete_search():
             'subtitle': event.category.name if event.category else None
         })
     
+    if fuzzy_only:
+        return suggestions
+    
     # Search categories
     categories = Category.query.filter(
         Category.is_active == True,
@@ -420,9 +528,21 @@ def autocomplete_search():
             'subtitle': 'Category'
         })
     
-    return jsonify({
-        'suggestions': suggestions
-    }), 200
+    # Search locations
+    locations = Location.query.filter(
+        Location.is_active == True,
+        Location.name.ilike(f'%{query}%')
+    ).limit(3).all()
+    
+    for loc in locations:
+        suggestions.append({
+            'type': 'location',
+            'id': loc.id,
+            'title': loc.name,
+            'subtitle': 'Location'
+        })
+    
+    return suggestions
 
 
 # ============ REVIEWS ============
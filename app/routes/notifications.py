@@ -5,6 +5,7 @@ from app.models.notification import Notification
 from app.models.user import User
 from app.models.partner import Partner
 from app.utils.decorators import user_required, partner_required, admin_required
+from app.utils.pagination import paginate_query, cursor_fields
 from app.utils.sms import (
     send_partner_approval_sms, 
     send_event_approval_sms, 
@@ -57,8 +58,6 @@ def get_user_notifications(current_user):
         response.headers.add('Access-Control-Max-Age', '3600')
         return response, 200
     
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
     unread_only = request.args.get('unread_only', 'false').lower() == 'true'
     
     # Check if user is admin
@@ -76,9 +75,10 @@ def get_user_notifications(current_user):
     if unread_only:
         query = query.filter_by(is_read=False)
     
-    notifications = query.order_by(Notification.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        notifications = paginate_query(query, Notification.created_at, Notification.id, scope=current_user.id)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     
     # Calculate unread count for both user and admin notifications if admin
     if is_admin:
@@ -97,7 +97,8 @@ def get_user_notifications(current_user):
         'total': notifications.total,
         'unread_count': unread_count,
         'page': notifications.page,
-        'pages': notifications.pages
+        'pages': notifications.pages,
+        **cursor_fields(notifications)
     })
     # Ensure CORS headers are set
     response.headers.add('Access-Control-Allow-Origin', '*')
@@ -5,11 +5,15 @@ import json
 from app import db, limiter
 from app.models.partner import Partner, PartnerSupportRequest, PartnerTeamMember
 from app.models.event import Event, EventHost, EventInterest, EventPromotion
-from app.models.ticket import TicketType, PromoCode, Booking
+from app.models.ticket import TicketType, PromoCode, Booking, normalize_promo_code
 from app.models.payment import PartnerPayout, Payment
 from app.models.user import User
 from app.utils.decorators import partner_required
 from app.utils.file_upload import upload_file
+from app.utils.event_serializer import serialize_events
+from app.utils.pagination import paginate_query, cursor_fields
+from app.utils.inventory import resize_ticket_type
+from app.utils.promo_codes import invalidate_promo_codes
 
 bp = Blueprint('partners', __name__)
 
@@ -501,7 +505,7 @@ def get_partner_events(current_partner):
     )
     
     return jsonify({
-        'events': [event.to_dict(include_stats=True) for event in events.items],
+        'events': serialize_events(events.items, include_stats=True),
         'total': events.total,
         'page': events.page,
         'pages': events.pages
@@ -927,16 +931,9 @@ def update_event(current_partner, event_id):
                     
                     # Only update if the value is actually different
                     if quantity_value_int != ticket_type.quantity_total:
-                        if quantity_value_int is None or quantity_value_int == 0:
-                            # Unlimited tickets
-                            ticket_type.quantity_total = None
-                            ticket_type.quantity_available = None
-                        else:
-                            # Limited tickets - recalculate available based on current sold count
-                            current_sold = ticket_type.quantity_sold or 0
-                            ticket_type.quantity_total = quantity_value_int
-                            # Don't increase available - calculate from total minus sold
-                            ticket_type.quantity_available = max(0, quantity_value_int - current_sold)
+                        # None or 0 = unlimited; otherwise stock shifts by the change in total,
+                        # in SQL so bookings made meanwhile are kept
+                        resize_ticket_type(ticket_type, quantity_value_int)
                 # If quantity is not provided, keep existing values (don't change)
             else:
                 # Create new ticket type only if it doesn't exist
@@ -970,6 +967,7 @@ def update_event(current_partner, event_id):
                         db.session.add(ticket_type)
     
     # Update promo codes
+    stale_promo_codes = []
     if 'promo_codes' in data:
         existing_promo_ids = data.get('existing_promo_ids', [])
         if isinstance(existing_promo_ids, str):
@@ -983,6 +981,7 @@ def update_event(current_partner, event_id):
         existing_promo_codes = PromoCode.query.filter_by(event_id=event.id).all()
         existing_promo_codes_by_id = {pc.id: pc for pc in existing_promo_codes}
         existing_promo_codes_by_code = {pc.code.upper(): pc for pc in existing_promo_codes}
+        stale_promo_codes = [pc.code for pc in existing_promo_codes]
         
         # Extract IDs from promo_data (handle both 'id' and 'existingId' fields from frontend)
         promo_ids_to_keep = []
@@ -1154,6 +1153,7 @@ def update_event(current_partner, event_id):
         current_app.logger.error(f'Error creating admin notification for event edit: {str(e)}')
     
     db.session.commit()
+    invalidate_promo_codes(*stale_promo_codes)
     
     return jsonify({
         'message': 'Event updated successfully',
@@ -1423,12 +1423,12 @@ def create_promo_code(current_partner, event_id):
             return jsonify({'error': f'{field} is required'}), 400
     
     # Check if code already exists
-    existing = PromoCode.query.filter_by(code=data['code'].upper()).first()
+    existing = PromoCode.query.filter_by(code=normalize_promo_code(data['code'])).first()
     if existing:
         return jsonify({'error': 'Promo code already exists'}), 409
     
     promo_code = PromoCode(
-        code=data['code'].upper().strip(),
+        code=data['code'],
         event_id=event_id,
         discount_type=data['discount_type'],
         discount_value=data['discount_value'],
@@ -1479,10 +1479,11 @@ def update_promo_code(current_partner, event_id, promo_code_id):
         return jsonify({'error': 'Promo code not found'}), 404
     
     data = request.get_json()
+    previous_code = promo_code.code
     
     # Validate required fields
     if 'code' in data:
-        new_code = data['code'].upper().strip()
+        new_code = normalize_promo_code(data['code'])
         # Check if new code already exists (for a different promo code)
         existing = PromoCode.query.filter_by(code=new_code).first()
         if existing and existing.id != promo_code_id:
@@ -1523,6 +1524,7 @@ def update_promo_code(current_partner, event_id, promo_code_id):
         promo_code.is_active = bool(data['is_active'])
     
     db.session.commit()
+    invalidate_promo_codes(previous_code)
     
     return jsonify({
         'message': 'Promo code updated successfully',
@@ -1550,8 +1552,10 @@ def delete_promo_code(current_partner, event_id, promo_code_id):
     if not promo_code:
         return jsonify({'error': 'Promo code not found'}), 404
     
+    code = promo_code.code
     db.session.delete(promo_code)
     db.session.commit()
+    invalidate_promo_codes(code)
     
     return jsonify({
         'message': 'Promo code deleted successfully'
@@ -1564,8 +1568,6 @@ def delete_promo_code(current_partner, event_id, promo_code_id):
 @partner_required
 def get_all_attendees(current_partner):
     """Get all attendees across all partner events"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 50, type=int)
     event_id = request.args.get('event_id', type=int)
     
     # Get all bookings for partner's events
@@ -1577,9 +1579,11 @@ def get_all_attendees(current_partner):
     if event_id:
         query = query.filter(Booking.event_id == event_id)
     
-    bookings = query.order_by(Booking.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        bookings = paginate_query(query, Booking.created_at, Booking.id,
+                                  default_per_page=50, scope=current_partner.id)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     
     # Format attendees data
     attendees = []
@@ -1649,7 +1653,8 @@ def get_all_attendees(current_partner):
         'page': bookings.page,
         'pages': bookings.pages,
         'past_events_count': past_events_count,
-        'current_events_count': current_events_count
+        'current_events_count': current_events_count,
+        **cursor_fields(bookings)
     }), 200
 
 
@@ -2158,10 +2163,7 @@ def promote_event(current_partner, event_id):
         
         if response.get('ResponseCode') == '0':
             # Success - STK push sent
-            payment.payment_metadata = {
-                'CheckoutRequestID': response.get('CheckoutRequestID'),
-                'MerchantRequestID': response.get('MerchantRequestID')
-            }
+            payment.record_stk_push(response)
             db.session.commit()
             
             return jsonify({
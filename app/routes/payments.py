@@ -1,16 +1,16 @@
 from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime
 import re
-from sqlalchemy import func, or_, cast, String
 from app import db
 from app.models.payment import Payment
 from app.models.ticket import Booking
-from app.models.ticket import Ticket
 from app.models.event import EventPromotion
 from app.models.partner import Partner
 from app.utils.decorators import user_required
+from app.utils.pagination import paginate_query, cursor_fields
 from app.utils.mpesa import MPesaClient, format_phone_number
-from app.utils.qrcode_generator import generate_qr_code
+from app.utils.ticket_issuance import issue_tickets
+from app.utils.ticket_pdf import prerender_ticket_pdf
 from app.utils.email import send_booking_confirmation_email, send_payment_confirmation_email, send_payment_failed_email, send_promotion_payment_success_email, send_payment_failed_email
 from app.utils.sms import (
     send_payment_confirmation_sms, 
@@ -19,11 +19,14 @@ from app.utils.sms import (
     send_promotion_payment_success_sms
 )
 from app.routes.notifications import notify_new_booking, notify_payment_completed, create_notification
+from app.utils.inventory import confirm_booking
+from app.utils.idempotency import idempotent
 
 bp = Blueprint('payments', __name__)
 
 
 @bp.route('/initiate', methods=['POST'])
+@idempotent
 @user_required
 def initiate_payment(current_user):
     """Initiate payment for booking"""
@@ -45,24 +48,33 @@ def initiate_payment(current_user):
     if booking.payment_status == 'paid':
         return jsonify({'error': 'Booking already paid'}), 400
     
+    result, status = start_booking_payment(booking, current_user, data['phone_number'])
+    return jsonify(result), status
+
+
+def start_booking_payment(booking, user, phone_number):
+    """Create a pending Payment for an unpaid booking and send one STK push for its total
+
+    Returns (response body, HTTP status); 200 once the push is sent.
+    """
     # Validate amount (minimum 1 KES for MPesa)
     if float(booking.total_amount) < 1:
-        return jsonify({'error': 'Payment amount must be at least KES 1'}), 400
+        return {'error': 'Payment amount must be at least KES 1'}, 400
     
     # Format phone number
-    phone = format_phone_number(data['phone_number'])
+    phone = format_phone_number(phone_number)
     
     # Validate phone number format (must be 12 digits starting with 254)
     if not phone or len(phone) != 12 or not phone.startswith('254'):
-        return jsonify({
+        return {
             'error': 'Invalid phone number format. Please use a valid Kenyan phone number (e.g., 0708419386 or 254708419386)'
-        }), 400
+        }, 400
     
     # Validate phone number is numeric after 254
     if not phone[3:].isdigit():
-        return jsonify({
+        return {
             'error': 'Invalid phone number. Phone number must contain only digits after country code'
-        }), 400
+        }, 400
     
     # Generate transaction ID
     import uuid
@@ -71,7 +83,7 @@ def initiate_payment(current_user):
     # Create payment record
     payment = Payment(
         transaction_id=transaction_id,
-        user_id=current_user.id,
+        user_id=user.id,
         event_id=booking.event_id,
         partner_id=booking.event.partner_id,
         amount=booking.total_amount,
@@ -106,10 +118,7 @@ def initiate_payment(current_user):
     
     if response.get('ResponseCode') == '0':
         # Success - STK push sent
-        payment.payment_metadata = {
-            'CheckoutRequestID': response.get('CheckoutRequestID'),
-            'MerchantRequestID': response.get('MerchantRequestID')
-        }
+        payment.record_stk_push(response)
         db.session.commit()
         
         current_app.logger.info(
@@ -117,13 +126,13 @@ def initiate_payment(current_user):
             f'Phone={phone}, Amount={payment.amount}, CheckoutRequestID={response.get("CheckoutRequestID")}'
         )
         
-        return jsonify({
+        return {
             'message': 'Payment initiated. Please check your phone to complete payment.',
             'payment_id': payment.id,
             'transaction_id': transaction_id,
             'checkout_request_id': response.get('CheckoutRequestID'),
             'amount': float(payment.amount)
-        }), 200
+        }, 200
     else:
         # Failed to initiate STK push
         payment.status = 'failed'
@@ -144,7 +153,7 @@ def initiate_payment(current_user):
         elif 'insufficient' in error_message.lower() or 'balance' in error_message.lower():
             error_message = 'Insufficient balance. Please ensure you have enough funds in your M-Pesa account.'
         
-        return jsonify({'error': error_message}), 400
+        return {'error': error_message}, 400
 
 
 @bp.route('/mpesa/callback', methods=['POST'])
@@ -183,28 +192,8 @@ def mpesa_callback():
             current_app.logger.error(f'MPesa callback: No CheckoutRequestID in callback: {callback_data}')
             return jsonify({'error': 'CheckoutRequestID missing'}), 400
         
-        # Find payment by CheckoutRequestID
-        # Use a database-agnostic approach that works with SQLite and PostgreSQL
-        # SQLite stores JSON as TEXT, so we can use json_extract or filter in Python
-        payment = None
-        try:
-            # Try SQLite JSON1 extension (most efficient for SQLite)
-            payment = Payment.query.filter(
-                func.json_extract(Payment.payment_metadata, '$.CheckoutRequestID') == checkout_request_id
-            ).first()
-        except Exception as e:
-            current_app.logger.debug(f'JSON1 query failed, using Python filter: {str(e)}')
-        
-        # Fallback: if JSON1 didn't work or returned None, filter in Python
-        if not payment:
-            all_payments = Payment.query.filter(
-                Payment.payment_metadata.isnot(None)
-            ).all()
-            payment = next(
-                (p for p in all_payments 
-                 if p.payment_metadata and p.payment_metadata.get('CheckoutRequestID') == checkout_request_id),
-                None
-            )
+        # Find payment by CheckoutRequestID (indexed column, works on SQLite and PostgreSQL)
+        payment = Payment.find_by_checkout_request_id(checkout_request_id)
         
         if not payment:
             current_app.logger.error(f'MPesa callback: Payment not found for CheckoutRequestID: {checkout_request_id}')
@@ -267,51 +256,18 @@ def mpesa_callback():
             if payment.payment_type == 'ticket':
                 booking = Booking.query.filter_by(payment_id=payment.id).first()
             
+            if booking and not confirm_booking(booking):
+                # Repeated callback for a booking that is already confirmed
+                db.session.commit()
+                return jsonify({'message': 'Callback processed'}), 200
+            
             if booking:
-                booking.payment_status = 'paid'
-                booking.status = 'confirmed'
-                booking.confirmed_at = datetime.utcnow()
-                booking.reserved_until = None  # Clear reservation timer on payment
-                
-                # Create tickets
-                tickets = []
-                for i in range(booking.quantity):
-                    ticket = Ticket(
-                        booking_id=booking.id,
-                        ticket_type_id=booking.event.ticket_types.first().id  # TODO: Handle multiple ticket types
-                    )
-                    db.session.add(ticket)
-                    db.session.flush()
-                    
-                    # Generate QR code
-                    qr_data = ticket.ticket_number
-                    qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-                    ticket.qr_code = qr_path
-                    
-                    tickets.append(ticket)
+                # Create tickets in one INSERT; QR images are rendered after commit
+                tickets = issue_tickets(booking)
                 
-                # Update event stats
                 event = booking.event
-                event.attendee_count += booking.quantity
-                event.total_tickets_sold += booking.quantity
-                event.revenue += booking.total_amount
-                
-                # Update partner earnings
-                partner = event.organizer
-                partner.pending_earnings += booking.partner_amount
-                partner.total_earnings += booking.partner_amount
-                
-                # Update ticket type availability
-                ticket_type = booking.event.ticket_types.first()
-                if ticket_type and ticket_type.quantity_available is not None:
-                    ticket_type.quantity_available -= booking.quantity
-                    ticket_type.quantity_sold += booking.quantity
-                
-                # Update promo code usage
-                if booking.promo_code:
-                    booking.promo_code.current_uses += 1
-                
                 db.session.commit()
+                prerender_ticket_pdf(booking, tickets)
                 
                 # Send payment confirmation email to user
                 send_payment_confirmation_email(booking, payment, tickets)
@@ -442,8 +398,11 @@ def check_payment_status(current_user, payment_id):
     # This prevents querying too early before MPesa has processed the request
     time_since_creation = (datetime.utcnow() - payment.created_at).total_seconds()
     
-    if payment.status == 'pending' and payment.payment_metadata and time_since_creation > 30:
-        checkout_request_id = payment.payment_metadata.get('CheckoutRequestID')
+    if payment.status == 'pending' and time_since_creation > 30:
+        checkout_request_id = payment.checkout_request_id
+        if not checkout_request_id and payment.payment_metadata:
+            # Rows created before the column was backfilled
+            checkout_request_id = payment.payment_metadata.get('CheckoutRequestID')
         
         if checkout_request_id:
             current_app.logger.info(f'Querying MPesa for payment {payment.id} with CheckoutRequestID: {checkout_request_id}')
@@ -491,51 +450,13 @@ def check_payment_status(current_user, payment_id):
                     booking = Booking.query.filter_by(payment_id=payment.id).first()
                 
                 if booking:
-                    booking.payment_status = 'paid'
-                    booking.status = 'confirmed'
-                    booking.confirmed_at = datetime.utcnow()
-                    
-                    # Create tickets if they don't exist
-                    if booking.tickets.count() == 0:
-                        tickets = []
-                        for i in range(booking.quantity):
-                            ticket = Ticket(
-                                booking_id=booking.id,
-                                ticket_type_id=booking.event.ticket_types.first().id
-                            )
-                            db.session.add(ticket)
-                            db.session.flush()
-                            
-                            # Generate QR code
-                            qr_data = ticket.ticket_number
-                            qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-                            ticket.qr_code = qr_path
-                            
-                            tickets.append(ticket)
+                    # Create tickets unless the callback already confirmed this booking
+                    if confirm_booking(booking):
+                        tickets = issue_tickets(booking)
                         
-                        # Update event stats
                         event = booking.event
-                        event.attendee_count += booking.quantity
-                        event.total_tickets_sold += booking.quantity
-                        event.revenue += booking.total_amount
-                        
-                        # Update partner earnings
-                        partner = event.organizer
-                        if partner:
-                            partner.pending_earnings += booking.partner_amount
-                            partner.total_earnings += booking.partner_amount
-                        
-                        # Update ticket type availability
-                        ticket_type = booking.event.ticket_types.first()
-                        if ticket_type and ticket_type.quantity_available is not None:
-                            ticket_type.quantity_available -= booking.quantity
-                            ticket_type.quantity_sold += booking.quantity
-                        
-                        # Update promo code usage
-                        if booking.promo_code:
-                            booking.promo_code.current_uses += 1
-                        
                         db.session.commit()
+                        prerender_ticket_pdf(booking, tickets)
                         
                         # Send notifications
                         send_payment_confirmation_email(booking, payment, tickets)
@@ -598,20 +519,18 @@ def check_payment_status(current_user, payment_id):
 @user_required
 def payment_history(current_user):
     """Get user's payment history"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
-    
-    payments = Payment.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Payment.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    query = Payment.query.filter_by(user_id=current_user.id)
+    try:
+        payments = paginate_query(query, Payment.created_at, Payment.id, scope=current_user.id)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     
     return jsonify({
         'payments': [payment.to_dict() for payment in payments.items],
         'total': payments.total,
         'page': payments.page,
-        'pages': payments.pages
+        'pages': payments.pages,
+        **cursor_fields(payments)
     }), 200
 
 
@@ -693,10 +612,7 @@ def initiate_promotion_payment():
     payment.provider_response = response
     
     if response.get('ResponseCode') == '0':
-        payment.payment_metadata = {
-            'CheckoutRequestID': response.get('CheckoutRequestID'),
-            'MerchantRequestID': response.get('MerchantRequestID')
-        }
+        payment.record_stk_push(response)
         db.session.commit()
         
         return jsonify({
@@ -1,20 +1,38 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+import json
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from app import db
+from sqlalchemy.orm import joinedload
+from app import db, limiter
 from app.models.event import Event
-from app.models.ticket import TicketType, Booking, Ticket, PromoCode
+from app.models.ticket import TicketType, Booking, BookingItem, Ticket
 from app.models.payment import Payment
 from app.utils.decorators import user_required, partner_required
-from app.utils.qrcode_generator import generate_qr_code
+from app.utils.ticket_issuance import issue_tickets
+from app.utils.qrcode_generator import (
+    QR_FORMATS, get_qr_code, cached_qr_code, qr_code_etag, qr_code_url, absolute_qr_code_url,
+    sign_ticket, verify_qr_code, is_signed_qr_code
+)
 from app.utils.email import send_booking_confirmation_email, send_booking_cancellation_email, send_booking_cancellation_to_partner_email
-from app.utils.ticket_pdf import generate_ticket_pdf
+from app.utils.ticket_pdf import generate_ticket_pdf, prerender_ticket_pdf, invalidate_ticket_pdf
 from app.utils.sms import (
     send_booking_confirmation_sms,
     send_booking_cancellation_sms,
     send_booking_cancellation_to_partner_sms
 )
 from app.routes.notifications import notify_new_booking, create_notification
+from app.routes.payments import start_booking_payment
+from app.utils.inventory import InventoryError, reserve, release_booking
+from app.utils.checkin import (
+    check_in_ticket, gate_ticket, gate_ticket_dict, gate_booking_dict, gate_attendee_dict,
+    iter_manifest, apply_scans, MAX_SCAN_BATCH
+)
+from app.utils.reservation_sweeper import sweep_expired
+from app.utils.idempotency import idempotent
+from app.utils.promo_codes import get_promo_code, promo_code_error, user_promo_code_uses, apply_discount
+from app.utils.waiting_room import (
+    waiting_room_pass_required, open_waiting_room, close_waiting_room, waiting_room_state, join_queue, queue_status
+)
 
 bp = Blueprint('tickets', __name__)
 
@@ -41,51 +59,19 @@ def validate_promo_code(current_user):
         except (ValueError, TypeError):
             return jsonify({'error': 'Invalid event_id format'}), 400
         
-        # Normalize code to uppercase
-        code = code.upper().strip()
-        
-        # Find promo code (case-insensitive search for safety)
-        from sqlalchemy import func
-        promo = PromoCode.query.filter(
-            func.upper(PromoCode.code) == code,
-            PromoCode.event_id == event_id,
-            PromoCode.is_active == True
-        ).first()
-        
-        if not promo:
-            # Check if code exists but for different event (case-insensitive)
-            promo_exists = PromoCode.query.filter(
-                func.upper(PromoCode.code) == code,
-                PromoCode.is_active == True
-            ).first()
-            if promo_exists:
-                return jsonify({'error': 'Promo code exists but is not valid for this event'}), 404
-            return jsonify({'error': 'Invalid promo code'}), 404
-        
-        # Check validity period
-        now = datetime.utcnow()
-        if promo.valid_from and now < promo.valid_from:
-            return jsonify({'error': 'Promo code not yet valid'}), 400
-        
-        if promo.valid_until and now > promo.valid_until:
-            return jsonify({'error': 'Promo code expired'}), 400
-        
-        # Check usage limits
-        if promo.max_uses is not None and promo.current_uses >= promo.max_uses:
-            return jsonify({'error': 'Promo code usage limit reached'}), 400
+        promo = get_promo_code(code)
+        error = promo_code_error(promo, event_id)
+        if error:
+            message, status = error
+            return jsonify({'error': message}), status
         
         # Check per-user usage
-        user_usage = Booking.query.filter_by(
-            user_id=current_user.id,
-            promo_code_id=promo.id
-        ).count()
-        
-        if user_usage >= promo.max_uses_per_user:
+        if user_promo_code_uses(promo['id'], current_user.id) >= (promo['max_uses_per_user'] or 1):
             return jsonify({'error': 'You have already used this promo code'}), 400
         
         return jsonify({
             'valid': True,
-            'promo_code': promo.to_dict()
+            'promo_code': promo
         }), 200
         
     except Exception as e:
@@ -94,6 +80,8 @@ def validate_promo_code(current_user):
 
 
 @bp.route('/book', methods=['POST'])
+@waiting_room_pass_required
+@idempotent
 @user_required
 def book_event(current_user):
     """Book tickets for an event"""
@@ -190,22 +178,10 @@ def book_event(current_user):
     if quantity > ticket_type.max_per_order:
         return jsonify({'error': f'Maximum {ticket_type.max_per_order} tickets allowed'}), 400
     
-    # Check availability (accounting for reserved but not expired tickets)
-    if ticket_type.quantity_available is not None:
-        # Count tickets reserved by pending bookings that haven't expired
-        reserved_count = db.session.query(func.sum(Booking.quantity)).filter(
-            Booking.event_id == event.id,
-            Booking.status == 'pending',
-            Booking.payment_status == 'unpaid',
-            Booking.reserved_until.isnot(None),
-            Booking.reserved_until >= datetime.utcnow()
-        ).scalar() or 0
-        
-        # Available tickets = total available - reserved (non-expired) tickets
-        actually_available = ticket_type.quantity_available - reserved_count
-        
-        if quantity > actually_available:
-            return jsonify({'error': 'Not enough tickets available'}), 400
+    # Fail fast when sold out even counting held tickets, which may have expired;
+    # the reservation below is the authoritative check
+    if ticket_type.quantity_available is not None and quantity > ticket_type.quantity_available + (ticket_type.quantity_held or 0):
+        return jsonify({'error': 'Not enough tickets available'}), 400
     
     # Check sales period
     now = datetime.utcnow()
@@ -223,21 +199,10 @@ def book_event(current_user):
     # Apply promo code if provided
     promo_code = None
     if data.get('promo_code'):
-        promo = PromoCode.query.filter_by(
-            code=data['promo_code'].upper(),
-            event_id=event.id,
-            is_active=True
-        ).first()
-        
-        if promo:
-            # Calculate discount
-            if promo.discount_type == 'percentage':
-                discount_amount = total_amount * (float(promo.discount_value) / 100)
-            else:  # fixed
-                discount_amount = float(promo.discount_value)
-            
-            # Ensure discount doesn't exceed total
-            discount_amount = min(discount_amount, total_amount)
+        promo = get_promo_code(data['promo_code'])
+        # Unusable codes are ignored; usage limits are enforced when reserve() claims the code
+        if promo_code_error(promo, event.id, check_usage=False) is None:
+            discount_amount = apply_discount(promo, total_amount)
             promo_code = promo
     
     final_amount = total_amount - discount_amount
@@ -264,20 +229,21 @@ def book_event(current_user):
                 # Commit phone number update immediately so it's available for SMS
                 db.session.commit()
     
-    # Create booking with 5-minute reservation timer for paid events
+    # Create booking with a reservation timer for paid events
     reserved_until = None
     if not event.is_free:
-        reserved_until = datetime.utcnow() + timedelta(minutes=5)
+        reserved_until = datetime.utcnow() + timedelta(minutes=current_app.config.get('BOOKING_HOLD_MINUTES', 5))
     
     booking = Booking(
         user_id=current_user.id,
         event_id=event.id,
+        ticket_type_id=ticket_type.id,
         quantity=quantity,
         total_amount=final_amount,
         platform_fee=platform_fee,
         partner_amount=partner_amount,
         discount_amount=discount_amount,
-        promo_code_id=promo_code.id if promo_code else None,
+        promo_code_id=promo_code['id'] if promo_code else None,
         status='pending',
         payment_status='unpaid' if not event.is_free else 'paid',
         reserved_until=reserved_until
@@ -286,69 +252,16 @@ def book_event(current_user):
     db.session.add(booking)
     db.session.flush()  # Get booking ID
     
+    # Take tickets, seats and promo usage atomically - free bookings are sold now, paid ones held
+    try:
+        reserve(booking, hold=not event.is_free)
+    except InventoryError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
     # For free events, auto-confirm
     if event.is_free:
-        booking.status = 'confirmed'
-        booking.confirmed_at = datetime.utcnow()
-        
-        # Create tickets
-        tickets = []
-        for i in range(quantity):
-            ticket = Ticket(
-                booking_id=booking.id,
-                ticket_type_id=ticket_type.id
-            )
-            db.session.add(ticket)
-            db.session.flush()
-            
-            # Generate QR code
-            qr_data = ticket.ticket_number
-            qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-            ticket.qr_code = qr_path
-            
-            tickets.append(ticket)
-        
-        # Update ticket availability
-        if ticket_type.quantity_available is not None:
-            ticket_type.quantity_available -= quantity
-            ticket_type.quantity_sold += quantity
-        
-        # Update event stats
-        event.attendee_count += quantity
-        event.total_tickets_sold += quantity
-        
-        # Update promo code usage
-        if promo_code:
-            promo_code.current_uses += 1
-        
-        db.session.commit()
-        
-        # Send confirmation email
-        send_booking_confirmation_email(booking, tickets)
-        
-        # Send confirmation SMS
-        # Use phone number from request if provided, or from user profile
-        phone_for_sms = data.get('phone_number') or current_user.phone_number
-        print(f"📱 [TICKETS] About to send booking confirmation SMS for booking {booking.id}")
-        print(f"📱 [TICKETS] Phone number for SMS: {phone_for_sms}")
-        send_booking_confirmation_sms(booking, tickets, phone_number_override=phone_for_sms)
-        print(f"📱 [TICKETS] Booking confirmation SMS call completed for booking {booking.id}")
-        
-        # Notify user of successful booking
-        create_notification(
-            user_id=current_user.id,
-            title='Booking Confirmed! 🎉',
-            message=f'Your booking for "{event.title}" has been confirmed. {quantity} ticket(s) reserved.',
-            notification_type='booking',
-            event_id=event.id,
-            booking_id=booking.id,
-            action_url=f'/bookings/{booking.id}',
-            action_text='View Booking',
-            send_email=False  # Email already sent above
-        )
-        
-        # Notify partner of new booking
-        notify_new_booking(event, booking)
+        _confirm_free_booking(booking, event, current_user, data.get('phone_number'), ticket_type.id)
         
         return jsonify({
             'message': 'Booking confirmed!',
@@ -367,6 +280,225 @@ def book_event(current_user):
     }), 201
 
 
+def _confirm_free_booking(booking, event, current_user, phone_number=None, ticket_type_id=None):
+    """Confirm a free booking whose tickets are reserved, issue its tickets and notify everyone"""
+    booking.status = 'confirmed'
+    booking.confirmed_at = datetime.utcnow()
+    
+    # Create tickets in one INSERT; QR images are rendered after commit
+    tickets = issue_tickets(booking, ticket_type_id)
+    
+    db.session.commit()
+    prerender_ticket_pdf(booking, tickets)
+    
+    # Send confirmation email
+    send_booking_confirmation_email(booking, tickets)
+    
+    # Send confirmation SMS
+    # Use phone number from request if provided, or from user profile
+    phone_for_sms = phone_number or current_user.phone_number
+    print(f"📱 [TICKETS] About to send booking confirmation SMS for booking {booking.id}")
+    print(f"📱 [TICKETS] Phone number for SMS: {phone_for_sms}")
+    send_booking_confirmation_sms(booking, tickets, phone_number_override=phone_for_sms)
+    print(f"📱 [TICKETS] Booking confirmation SMS call completed for booking {booking.id}")
+    
+    # Notify user of successful booking
+    create_notification(
+        user_id=current_user.id,
+        title='Booking Confirmed! 🎉',
+        message=f'Your booking for "{event.title}" has been confirmed. {booking.quantity} ticket(s) reserved.',
+        notification_type='booking',
+        event_id=event.id,
+        booking_id=booking.id,
+        action_url=f'/bookings/{booking.id}',
+        action_text='View Booking',
+        send_email=False  # Email already sent above
+    )
+    
+    # Notify partner of new booking
+    notify_new_booking(event, booking)
+    return tickets
+
+
+@bp.route('/checkout', methods=['POST'])
+@waiting_room_pass_required
+@idempotent
+@user_required
+def checkout_cart(current_user):
+    """Book several ticket types for one event in one transaction
+
+    Body: {event_id, items: [{ticket_type_id, quantity}], promo_code,
+    phone_number}. Every ticket type is reserved or none is; the promo code
+    applies to the cart total. For paid events a phone_number sends one STK
+    push for the total straight away.
+    """
+    data = request.get_json() or {}
+    
+    if not data.get('event_id'):
+        return jsonify({'error': 'event_id is required'}), 400
+    
+    # Merge repeated ticket types, keeping the order they were added in
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list of {ticket_type_id, quantity}'}), 400
+    quantities = {}
+    for item in items:
+        try:
+            ticket_type_id = int(item['ticket_type_id'])
+            quantity = int(item.get('quantity', 1))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            return jsonify({'error': 'Each item needs a ticket_type_id and a quantity'}), 400
+        if quantity < 1:
+            return jsonify({'error': 'Quantity must be at least 1'}), 400
+        quantities[ticket_type_id] = quantities.get(ticket_type_id, 0) + quantity
+    if len(quantities) > current_app.config.get('CART_MAX_TICKET_TYPES', 10):
+        return jsonify({'error': 'Too many ticket types in one order'}), 400
+    
+    event = db.session.get(Event, data['event_id'])
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
+    
+    if event.status != 'approved' or not event.is_published:
+        return jsonify({'error': 'Event is not available for booking'}), 400
+    
+    now = datetime.utcnow()
+    if event.start_date < now:
+        return jsonify({'error': 'Cannot book past events'}), 400
+    
+    # One booking per user and event, as with single-type bookings
+    existing_booking = Booking.query.filter_by(
+        user_id=current_user.id,
+        event_id=event.id
+    ).filter(
+        Booking.status != 'cancelled'
+    ).first()
+    
+    if existing_booking:
+        if existing_booking.status == 'confirmed':
+            error = 'You have already booked tickets for this event'
+        else:
+            error = 'You have a pending booking for this event. Please complete the payment or cancel the existing booking.'
+        return jsonify({
+            'error': error,
+            'booking_id': existing_booking.id,
+            'booking_number': existing_booking.booking_number
+        }), 409
+    
+    # All ticket types in one query
+    ticket_types = {
+        ticket_type.id: ticket_type
+        for ticket_type in TicketType.query.filter(
+            TicketType.id.in_(list(quantities)),
+            TicketType.event_id == event.id,
+            TicketType.is_active == True
+        )
+    }
+    
+    total_amount = 0
+    for ticket_type_id, quantity in quantities.items():
+        ticket_type = ticket_types.get(ticket_type_id)
+        if not ticket_type:
+            return jsonify({'error': f'Ticket type {ticket_type_id} not found'}), 404
+        
+        if quantity < ticket_type.min_per_order:
+            return jsonify({'error': f'Minimum {ticket_type.min_per_order} {ticket_type.name} tickets required'}), 400
+        
+        if quantity > ticket_type.max_per_order:
+            return jsonify({'error': f'Maximum {ticket_type.max_per_order} {ticket_type.name} tickets allowed'}), 400
+        
+        # Fail fast when sold out even counting held tickets; reserve() is the authoritative check
+        if ticket_type.quantity_available is not None and quantity > ticket_type.quantity_available + (ticket_type.quantity_held or 0):
+            return jsonify({'error': f'Not enough {ticket_type.name} tickets available'}), 400
+        
+        if ticket_type.sales_start and now < ticket_type.sales_start:
+            return jsonify({'error': f'{ticket_type.name} ticket sales have not started yet'}), 400
+        
+        if ticket_type.sales_end and now > ticket_type.sales_end:
+            return jsonify({'error': f'{ticket_type.name} ticket sales have ended'}), 400
+        
+        total_amount += float(ticket_type.price) * quantity
+    
+    # One promo code for the whole cart
+    discount_amount = 0
+    promo_code = None
+    if data.get('promo_code'):
+        promo = get_promo_code(data['promo_code'])
+        error = promo_code_error(promo, event.id, check_usage=False)
+        if error:
+            message, status = error
+            return jsonify({'error': message}), status
+        discount_amount = apply_discount(promo, total_amount)
+        promo_code = promo
+    
+    final_amount = total_amount - discount_amount
+    commission_rate = current_app.config.get('PLATFORM_COMMISSION_RATE', 0.07)
+    platform_fee = final_amount * commission_rate
+    partner_amount = final_amount - platform_fee
+    
+    reserved_until = None
+    if not event.is_free:
+        reserved_until = now + timedelta(minutes=current_app.config.get('BOOKING_HOLD_MINUTES', 5))
+    
+    booking = Booking(
+        user_id=current_user.id,
+        event_id=event.id,
+        ticket_type_id=next(iter(quantities)) if len(quantities) == 1 else None,
+        quantity=sum(quantities.values()),
+        total_amount=final_amount,
+        platform_fee=platform_fee,
+        partner_amount=partner_amount,
+        discount_amount=discount_amount,
+        promo_code_id=promo_code['id'] if promo_code else None,
+        status='pending',
+        payment_status='unpaid' if not event.is_free else 'paid',
+        reserved_until=reserved_until
+    )
+    db.session.add(booking)
+    db.session.flush()
+    db.session.add_all([
+        BookingItem(
+            booking_id=booking.id,
+            ticket_type_id=ticket_type_id,
+            quantity=quantity,
+            unit_price=ticket_types[ticket_type_id].price
+        )
+        for ticket_type_id, quantity in quantities.items()
+    ])
+    db.session.flush()
+    
+    # Take every ticket type, the seats and the promo use, or nothing
+    try:
+        reserve(booking, hold=not event.is_free)
+    except InventoryError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    if event.is_free:
+        _confirm_free_booking(booking, event, current_user, data.get('phone_number'))
+        return jsonify({
+            'message': 'Booking confirmed!',
+            'booking': dict(booking.to_dict(), items=[item.to_dict() for item in booking.items]),
+            'requires_payment': False
+        }), 201
+    
+    db.session.commit()
+    result = {
+        'message': 'Booking created. Please proceed to payment.',
+        'booking': dict(booking.to_dict(), items=[item.to_dict() for item in booking.items]),
+        'requires_payment': True,
+        'amount': float(final_amount)
+    }
+    
+    # One STK push for the whole cart
+    if data.get('phone_number'):
+        payment, payment_status = start_booking_payment(booking, current_user, data['phone_number'])
+        result['payment'] = payment
+        if payment_status == 200:
+            result['message'] = payment['message']
+    
+    return jsonify(result), 201
+
+
 # Cancel booking route - support both /cancel/<id> and /bookings/<id>/cancel
 @bp.route('/cancel/<int:booking_id>', methods=['POST'])
 @bp.route('/bookings/<int:booking_id>/cancel', methods=['POST'])
@@ -400,31 +532,18 @@ def cancel_booking(current_user, booking_id):
         if booking.event.start_date < datetime.utcnow():
             return jsonify({'msg': 'Cannot cancel booking for past events'}), 400
         
-        # Store original status before cancelling
-        was_confirmed = booking.status == 'confirmed'
-        
-        # Cancel booking
-        booking.status = 'cancelled'
-        booking.cancelled_at = datetime.utcnow()
-        
-        # Restore ticket availability if booking was confirmed
-        if was_confirmed:
-            for ticket in booking.tickets:
-                ticket.is_valid = False
-            
-            ticket_type = booking.tickets.first().ticket_type if booking.tickets.first() else None
-            if ticket_type and ticket_type.quantity_available is not None:
-                ticket_type.quantity_available += booking.quantity
-                ticket_type.quantity_sold -= booking.quantity
-            
-            # Update event stats
-            if booking.event:
-                booking.event.attendee_count -= booking.quantity
-                booking.event.total_tickets_sold -= booking.quantity
+        # Cancel booking and return its tickets to stock
+        if not release_booking(booking):
+            db.session.rollback()
+            return jsonify({'msg': 'Booking already cancelled'}), 400
+        
+        for ticket in booking.tickets:
+            ticket.is_valid = False
         
         # TODO: Process refund if paid
         
         db.session.commit()
+        invalidate_ticket_pdf(booking.id)
         
         # Send cancellation SMS and email to user
         try:
@@ -467,31 +586,31 @@ def cancel_booking(current_user, booking_id):
 @partner_required
 def verify_ticket(current_partner, ticket_number):
     """Verify ticket for check-in"""
-    ticket = Ticket.query.filter_by(ticket_number=ticket_number).first()
+    row = gate_ticket(ticket_number=ticket_number)
     
-    if not ticket:
+    if not row:
         return jsonify({'error': 'Ticket not found'}), 404
     
     # Check if ticket belongs to partner's event
-    if ticket.booking.event.partner_id != current_partner.id:
+    if row.partner_id != current_partner.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
     # Check if ticket is valid
-    if not ticket.is_valid:
+    if not row.is_valid:
         return jsonify({
             'valid': False,
             'error': 'Ticket is not valid'
         }), 200
     
-    if ticket.is_scanned:
+    if row.is_scanned:
         return jsonify({
             'valid': False,
             'error': 'Ticket already scanned',
-            'scanned_at': ticket.scanned_at.isoformat() if ticket.scanned_at else None
+            'scanned_at': row.scanned_at.isoformat() if row.scanned_at else None
         }), 200
     
     # Check if booking is confirmed
-    if ticket.booking.status != 'confirmed':
+    if row.booking_status != 'confirmed':
         return jsonify({
             'valid': False,
             'error': 'Booking not confirmed'
@@ -499,9 +618,9 @@ def verify_ticket(current_partner, ticket_number):
     
     return jsonify({
         'valid': True,
-        'ticket': ticket.to_dict(),
-        'booking': ticket.booking.to_dict(),
-        'attendee': ticket.booking.user.to_dict()
+        'ticket': gate_ticket_dict(row),
+        'booking': gate_booking_dict(row),
+        'attendee': gate_attendee_dict(row)
     }), 200
 
 
@@ -509,99 +628,237 @@ def verify_ticket(current_partner, ticket_number):
 @partner_required
 def checkin_ticket(current_partner, ticket_number):
     """Check-in ticket"""
-    ticket = Ticket.query.filter_by(ticket_number=ticket_number).first()
+    row = gate_ticket(ticket_number=ticket_number)
     
-    if not ticket:
+    if not row:
         return jsonify({'error': 'Ticket not found'}), 404
     
     # Check if ticket belongs to partner's event
-    if ticket.booking.event.partner_id != current_partner.id:
+    if row.partner_id != current_partner.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
     # Check if already scanned
-    if ticket.is_scanned:
+    if row.is_scanned:
         return jsonify({'error': 'Ticket already scanned'}), 400
     
     # Check if valid
-    if not ticket.is_valid:
+    if not row.is_valid or row.booking_status != 'confirmed':
         return jsonify({'error': 'Ticket is not valid'}), 400
     
-    # Check-in
-    ticket.is_scanned = True
-    ticket.scanned_at = datetime.utcnow()
-    
-    # Update booking check-in status
-    if not ticket.booking.is_checked_in:
-        ticket.booking.is_checked_in = True
-        ticket.booking.checked_in_at = datetime.utcnow()
-        ticket.booking.checked_in_by = current_partner.id
-    
+    # Check-in; another gate may have admitted the ticket since it was read
+    now = datetime.utcnow()
+    if not check_in_ticket(row.id, current_partner.id, row.event_id, now=now):
+        db.session.rollback()
+        return jsonify({'error': 'Ticket already scanned'}), 400
     db.session.commit()
     
     return jsonify({
         'message': 'Ticket checked in successfully',
-        'ticket': ticket.to_dict(),
-        'attendee': ticket.booking.user.to_dict()
+        'ticket': gate_ticket_dict(row, checked_in_at=now),
+        'attendee': gate_attendee_dict(row)
     }), 200
 
 
 @bp.route('/scan', methods=['POST'])
 @partner_required
 def scan_ticket(current_partner):
-    """Scan and check-in ticket by QR code data"""
-    data = request.get_json()
+    """Scan and check-in ticket by QR code data
+    
+    Signed codes are verified, and checked against the scanner's event_id
+    when one is sent, without reading the database; only admissible
+    tickets reach the check-in UPDATE.
+    """
+    data = request.get_json() or {}
     
     if not data.get('qr_data'):
         return jsonify({'error': 'qr_data is required'}), 400
     
-    # QR data should be the ticket number
-    ticket_number = data['qr_data']
-    
-    # Verify and check-in in one step
-    ticket = Ticket.query.filter_by(ticket_number=ticket_number).first()
+    if is_signed_qr_code(data['qr_data']):
+        claims = verify_qr_code(data['qr_data'])
+        if not claims:
+            return jsonify({'success': False, 'error': 'Invalid ticket code'}), 400
+        try:
+            if data.get('event_id') is not None and int(data['event_id']) != claims['event_id']:
+                return jsonify({'success': False, 'error': 'Ticket is for a different event'}), 403
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid event_id'}), 400
+        
+        now = datetime.utcnow()
+        checked_in = check_in_ticket(
+            claims['ticket_id'], current_partner.id, claims['event_id'], claims['ticket_type_id'], now=now
+        )
+        if checked_in:
+            db.session.commit()
+        row = gate_ticket(ticket_id=claims['ticket_id'])
+        if not row or row.event_id != claims['event_id']:
+            return jsonify({'error': 'Ticket not found'}), 404
+    else:
+        if not current_app.config.get('QR_ACCEPT_UNSIGNED', True):
+            return jsonify({'success': False, 'error': 'Invalid ticket code'}), 400
+        
+        # Tickets issued before codes were signed encode the bare ticket number
+        row = gate_ticket(ticket_number=data['qr_data'])
+        if not row:
+            return jsonify({'error': 'Ticket not found'}), 404
+        
+        now = datetime.utcnow()
+        admissible = (
+            row.partner_id == current_partner.id and row.is_valid and not row.is_scanned
+            and row.booking_status == 'confirmed'
+        )
+        checked_in = admissible and check_in_ticket(row.id, current_partner.id, row.event_id, now=now)
+        if checked_in:
+            db.session.commit()
+        elif admissible:
+            row = gate_ticket(ticket_id=row.id)  # Another gate admitted it first
     
-    if not ticket:
-        return jsonify({'error': 'Ticket not found'}), 404
+    if checked_in:
+        return jsonify({
+            'success': True,
+            'message': 'Ticket checked in successfully',
+            'ticket': gate_ticket_dict(row, checked_in_at=now),
+            'attendee': gate_attendee_dict(row)
+        }), 200
     
     # Check if ticket belongs to partner's event
-    if ticket.booking.event.partner_id != current_partner.id:
+    if row.partner_id != current_partner.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
     # Check if already scanned
-    if ticket.is_scanned:
+    if row.is_scanned:
         return jsonify({
             'success': False,
             'error': 'Ticket already scanned',
-            'scanned_at': ticket.scanned_at.isoformat() if ticket.scanned_at else None,
-            'attendee': ticket.booking.user.to_dict()
-        }), 200
-    
-    # Check if valid
-    if not ticket.is_valid or ticket.booking.status != 'confirmed':
-        return jsonify({
-            'success': False,
-            'error': 'Ticket is not valid'
+            'scanned_at': row.scanned_at.isoformat() if row.scanned_at else None,
+            'attendee': gate_attendee_dict(row)
         }), 200
     
-    # Check-in
-    ticket.is_scanned = True
-    ticket.scanned_at = datetime.utcnow()
+    return jsonify({
+        'success': False,
+        'error': 'Ticket is not valid'
+    }), 200
+
+
+def _partner_event(current_partner, event_id):
+    """The partner's event, or an error response"""
+    event = db.session.get(Event, event_id)
+    if not event:
+        return None, (jsonify({'error': 'Event not found'}), 404)
+    if event.partner_id != current_partner.id:
+        return None, (jsonify({'error': 'Unauthorized'}), 403)
+    return event, None
+
+
+@bp.route('/events/<int:event_id>/manifest', methods=['GET'])
+@partner_required
+def checkin_manifest(current_partner, event_id):
+    """Offline check-in manifest for door devices (NDJSON)
     
-    if not ticket.booking.is_checked_in:
-        ticket.booking.is_checked_in = True
-        ticket.booking.checked_in_at = datetime.utcnow()
-        ticket.booking.checked_in_by = current_partner.id
+    Pass the header's cursor and version back as ?cursor=&version= to get
+    only tickets changed since; a stale version gets a full manifest.
+    """
+    event, error = _partner_event(current_partner, event_id)
+    if error:
+        return error
     
+    rows = iter_manifest(event.id, request.args.get('cursor'), request.args.get('version'))
+    try:
+        header = next(rows)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    def generate():
+        yield json.dumps(header, separators=(',', ':')) + '\n'
+        for row in rows:
+            yield json.dumps(row, separators=(',', ':')) + '\n'
+    
+    response = current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@bp.route('/events/<int:event_id>/scans', methods=['POST'])
+@partner_required
+def sync_scans(current_partner, event_id):
+    """Upload scans recorded offline; returns a result per scan, including conflicts"""
+    event, error = _partner_event(current_partner, event_id)
+    if error:
+        return error
+    
+    data = request.get_json() or {}
+    scans = data.get('scans')
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'error': 'scans is required'}), 400
+    if len(scans) > MAX_SCAN_BATCH:
+        return jsonify({'error': f'At most {MAX_SCAN_BATCH} scans per request'}), 400
+    
+    results = apply_scans(event.id, current_partner.id, scans)
     db.session.commit()
     
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    
     return jsonify({
-        'success': True,
-        'message': 'Ticket checked in successfully',
-        'ticket': ticket.to_dict(),
-        'attendee': ticket.booking.user.to_dict()
+        'results': results,
+        'summary': summary,
+        'conflicts': summary.get('already_scanned', 0) + summary.get('duplicate', 0)
     }), 200
 
 
+@bp.route('/events/<int:event_id>/waiting-room', methods=['GET', 'POST', 'DELETE'])
+@partner_required
+def manage_waiting_room(current_partner, event_id):
+    """Open (or retune), inspect or close an event's waiting room
+    
+    POST takes optional rate_per_second, burst and duration_minutes.
+    """
+    event, error = _partner_event(current_partner, event_id)
+    if error:
+        return error
+    
+    if request.method == 'DELETE':
+        close_waiting_room(event.id)
+        return jsonify({'message': 'Waiting room closed', 'waiting_room': None}), 200
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            rate = float(data['rate_per_second']) if data.get('rate_per_second') is not None else None
+            burst = int(data['burst']) if data.get('burst') is not None else None
+            duration = int(data['duration_minutes']) * 60 if data.get('duration_minutes') is not None else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'rate_per_second, burst and duration_minutes must be numbers'}), 400
+        if (rate is not None and rate <= 0) or (burst is not None and burst < 0) or (duration is not None and duration <= 0):
+            return jsonify({'error': 'rate_per_second and duration_minutes must be positive, burst not negative'}), 400
+        open_waiting_room(event.id, rate, burst, duration)
+    
+    return jsonify({'waiting_room': waiting_room_state(event.id)}), 200
+
+
+@bp.route('/events/<int:event_id>/queue', methods=['POST'])
+@limiter.exempt
+@jwt_required()
+def join_waiting_room(event_id):
+    """Join an event's booking queue; returns a token to poll with"""
+    token = join_queue(event_id, get_jwt_identity())
+    if token is None:
+        return jsonify({'active': False, 'message': 'No waiting room; book directly'}), 200
+    return jsonify(dict(queue_status(event_id, token), token=token)), 200
+
+
+@bp.route('/events/<int:event_id>/queue/<token>', methods=['GET'])
+@limiter.exempt
+def waiting_room_position(event_id, token):
+    """Queue position for a token; includes the booking pass once admitted"""
+    status = queue_status(event_id, token)
+    if status is None:
+        return jsonify({'error': 'Invalid queue token'}), 404
+    response = jsonify(status)
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 200
+
+
 @bp.route('/<int:booking_id>', methods=['GET'])
 @user_required
 def get_ticket(current_user, booking_id):
@@ -619,32 +876,18 @@ def get_ticket(current_user, booking_id):
     if not tickets:
         return jsonify({'error': 'No tickets found for this booking'}), 404
     
-    # Ensure QR codes are generated for all tickets
+    # QR codes are rendered on demand by ticket_qr_image()
     from flask import current_app
     base_url = current_app.config.get('BASE_URL', 'https://niko-free.com')
     
     ticket_data = []
     for ticket in tickets:
-        # Generate QR code if it doesn't exist
-        if not ticket.qr_code:
-            qr_data = ticket.ticket_number
-            qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-            ticket.qr_code = qr_path
-            db.session.commit()
-        
-        # Build QR code URL
-        if ticket.qr_code.startswith('http'):
-            qr_url = ticket.qr_code
-        elif ticket.qr_code.startswith('/'):
-            qr_url = f"{base_url}{ticket.qr_code}"
-        else:
-            qr_url = f"{base_url}/uploads/{ticket.qr_code}"
-        
         ticket_data.append({
             'id': ticket.id,
             'ticket_number': ticket.ticket_number,
-            'qr_code_url': qr_url,
-            'qr_code_path': ticket.qr_code,
+            'qr_code_url': absolute_qr_code_url(ticket),
+            'qr_code_svg_url': absolute_qr_code_url(ticket, 'svg'),
+            'qr_code_path': qr_code_url(ticket.ticket_number),
             'ticket_type': ticket.ticket_type.to_dict() if ticket.ticket_type else None,
             'is_valid': ticket.is_valid,
             'is_scanned': ticket.is_scanned,
@@ -675,31 +918,42 @@ def get_ticket_qr(current_user, booking_id):
     if not ticket:
         return jsonify({'error': 'No tickets found for this booking'}), 404
     
-    # Generate QR code if it doesn't exist
-    if not ticket.qr_code:
-        qr_data = ticket.ticket_number
-        qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-        ticket.qr_code = qr_path
-        db.session.commit()
-    
-    # Return QR code URL
-    from flask import current_app
-    base_url = current_app.config.get('BASE_URL', 'https://niko-free.com')
-    # Handle both relative paths and full URLs
-    if ticket.qr_code.startswith('http'):
-        qr_url = ticket.qr_code
-    elif ticket.qr_code.startswith('/'):
-        qr_url = f"{base_url}{ticket.qr_code}"
-    else:
-        qr_url = f"{base_url}/uploads/{ticket.qr_code}"
-    
+    # Return QR code URL; the image is rendered on demand by ticket_qr_image()
     return jsonify({
-        'qr_code_url': qr_url,
+        'qr_code_url': absolute_qr_code_url(ticket),
         'ticket_number': ticket.ticket_number,
         'booking_number': booking.booking_number
     }), 200
 
 
+@bp.route('/<ticket_number>/qr.<fmt>', methods=['GET'])
+@limiter.exempt
+def ticket_qr_image(ticket_number, fmt):
+    """Ticket QR code image (png or svg), rendered on demand and cached"""
+    mimetype = QR_FORMATS.get(fmt)
+    if not mimetype:
+        return jsonify({'error': 'Unsupported format'}), 404
+    
+    # The image for a ticket never changes, so a matching ETag needs no work at all
+    etag = qr_code_etag(ticket_number, fmt)
+    cache_control = 'public, max-age=31536000, immutable'
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        image = cached_qr_code(ticket_number, fmt)
+        if image is None:
+            row = db.session.query(Ticket.id, Booking.event_id, Ticket.ticket_type_id).join(
+                Booking, Ticket.booking_id == Booking.id
+            ).filter(Ticket.ticket_number == ticket_number).first()
+            if not row:
+                return jsonify({'error': 'Ticket not found'}), 404
+            image = get_qr_code(ticket_number, sign_ticket(*row), fmt)
+        response = current_app.response_class(image, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
 @bp.route('/<int:booking_id>/download', methods=['GET'])
 @user_required
 def download_ticket(current_user, booking_id):
@@ -717,22 +971,12 @@ def download_ticket(current_user, booking_id):
             return jsonify({'error': 'Booking not found'}), 404
         
         # Get all tickets for this booking
-        tickets = list(booking.tickets.all())
+        tickets = list(booking.tickets.options(joinedload(Ticket.ticket_type)).order_by(Ticket.id))
         if not tickets:
             return jsonify({'error': 'No tickets found for this booking'}), 404
         
         print(f"📄 [TICKET DOWNLOAD] Generating PDF for booking {booking_id}, {len(tickets)} tickets")
         
-        # Ensure QR codes are generated for all tickets
-        for ticket in tickets:
-            if not ticket.qr_code:
-                print(f"📄 [TICKET DOWNLOAD] Generating QR code for ticket {ticket.ticket_number}")
-                qr_data = ticket.ticket_number
-                qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-                ticket.qr_code = qr_path
-                db.session.commit()
-                print(f"📄 [TICKET DOWNLOAD] QR code generated: {qr_path}")
-        
         # Generate PDF
         print(f"📄 [TICKET DOWNLOAD] Creating PDF buffer...")
         pdf_buffer = generate_ticket_pdf(booking, tickets)
@@ -777,22 +1021,12 @@ def download_ticket_public(booking_number):
             return jsonify({'error': 'Booking not found'}), 404
         
         # Get all tickets for this booking
-        tickets = list(booking.tickets.all())
+        tickets = list(booking.tickets.options(joinedload(Ticket.ticket_type)).order_by(Ticket.id))
         if not tickets:
             return jsonify({'error': 'No tickets found for this booking'}), 404
         
         print(f"📄 [TICKET DOWNLOAD PUBLIC] Generating PDF for booking {booking_number}, {len(tickets)} tickets")
         
-        # Ensure QR codes are generated for all tickets
-        for ticket in tickets:
-            if not ticket.qr_code:
-                print(f"📄 [TICKET DOWNLOAD PUBLIC] Generating QR code for ticket {ticket.ticket_number}")
-                qr_data = ticket.ticket_number
-                qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-                ticket.qr_code = qr_path
-                db.session.commit()
-                print(f"📄 [TICKET DOWNLOAD PUBLIC] QR code generated: {qr_path}")
-        
         # Generate PDF
         print(f"📄 [TICKET DOWNLOAD PUBLIC] Creating PDF buffer...")
         pdf_buffer = generate_ticket_pdf(booking, tickets)
@@ -827,28 +1061,10 @@ def download_ticket_public(booking_number):
 def release_expired_bookings():
     """Release expired pending bookings (called by background task or frontend)"""
     try:
-        # Find all pending bookings that have expired (reserved_until < now)
-        expired_bookings = Booking.query.filter(
-            Booking.status == 'pending',
-            Booking.payment_status == 'unpaid',
-            Booking.reserved_until.isnot(None),
-            Booking.reserved_until < datetime.utcnow()
-        ).all()
-        
-        released_count = 0
-        for booking in expired_bookings:
-            # Cancel the expired booking
-            booking.status = 'cancelled'
-            booking.cancelled_at = datetime.utcnow()
-            
-            # Restore promo code usage if applicable
-            if booking.promo_code:
-                booking.promo_code.current_uses = max(0, booking.promo_code.current_uses - 1)
-            
-            released_count += 1
+        # Cancel bookings whose holds have expired, returning their tickets and promo usage
+        released_count = sweep_expired()
         
         if released_count > 0:
-            db.session.commit()
             current_app.logger.info(f'Released {released_count} expired bookings')
         
         return jsonify({
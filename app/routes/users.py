@@ -9,6 +9,7 @@ from app.models.ticket import Booking
 from app.models.notification import Notification
 from app.utils.decorators import user_required
 from app.utils.file_upload import upload_file
+from app.utils.pagination import paginate_query, cursor_fields
 
 bp = Blueprint('users', __name__)
 
@@ -112,8 +113,6 @@ def get_bookings(current_user):
     """Get user's bookings"""
     # Get query parameters
     status = request.args.get('status')  # upcoming, past, cancelled
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
     
     # Build query
     query = Booking.query.filter_by(user_id=current_user.id)
@@ -139,18 +138,19 @@ def get_bookings(current_user):
             Booking.payment_status.in_(['unpaid', 'failed'])
         )
     
-    # Order by date
-    query = query.order_by(Booking.created_at.desc())
-    
-    # Paginate
-    bookings = query.paginate(page=page, per_page=per_page, error_out=False)
+    # Order by date and paginate - offset pages by default, keyset pages with ?cursor=
+    try:
+        bookings = paginate_query(query, Booking.created_at, Booking.id, scope=current_user.id)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     
     return jsonify({
         'bookings': [booking.to_dict(include_event_stats=True) for booking in bookings.items],
         'total': bookings.total,
         'page': bookings.page,
         'pages': bookings.pages,
-        'per_page': bookings.per_page
+        'per_page': bookings.per_page,
+        **cursor_fields(bookings)
     }), 200
 
 
@@ -0,0 +1,316 @@
+"""
+In-memory prefix index for autocomplete suggestions
+
+Each worker keeps a sorted array of (word, entry) pairs built from upcoming
+approved event titles, active category names and active location names.
+A query matches entries where every query word is a prefix of some word in
+the name, found with bisect on the sorted array, so suggestions are served
+without touching the database. Entries are stored in ranking order and
+ranked results are memoized per query for the life of the index.
+
+The index is stamped with its own version in the cache backend
+(app/utils/cache.py), bumped after a commit that changes something the
+index shows: an event's title, category, start date, status or publish
+state, or a category's or location's name, active flag or order. Stock,
+views and other event edits never touch it, so holds and sales during an
+on-sale don't cause rebuilds. A request that sees a newer version starts a
+rebuild in a background thread, at most once per
+AUTOCOMPLETE_MIN_REBUILD_SECONDS, and so does an index older than
+AUTOCOMPLETE_INDEX_MAX_AGE seconds (which also refreshes category ranks);
+the current index keeps answering until the rebuild finishes. Until the
+first build completes the index is cold and callers fall back to the
+database.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session
+from app import db
+from app.models.event import Event
+from app.models.category import Category, Location
+from app.utils.cache import get_cache, updated_columns
+from app.utils.search import tokenize
+
+
+# Suggestions returned per type, in response order
+SUGGESTION_LIMITS = (('event', 5), ('category', 3), ('location', 3))
+
+INDEX_VERSION = 'autocomplete_index'
+
+# Attributes the index is built from, per model
+INDEXED_ATTRIBUTES = {
+    Event: {'title', 'category_id', 'start_date', 'status', 'is_published'},
+    Category: {'name', 'is_active'},
+    Location: {'name', 'is_active', 'display_order'},
+}
+
+
+class PrefixIndex:
+    """Immutable word-prefix index over suggestion entries"""
+
+    def __init__(self, entries, version=None, max_cached_queries=2048):
+        # entries: [{'type', 'id', 'title', 'subtitle', 'rank', 'expires_at'}]
+        # Stored in final ranking order so a match's position is its rank
+        type_order = {suggestion_type: i for i, (suggestion_type, _) in enumerate(SUGGESTION_LIMITS)}
+        self.entries = sorted(entries, key=lambda entry: (type_order[entry['type']], entry['rank'], entry['title']))
+        self.version = version
+        self.built_at = time.monotonic()
+        self._names = [' '.join(tokenize(entry['title'])) for entry in self.entries]
+        self._limits = dict(SUGGESTION_LIMITS)
+        # Position just past each type's contiguous run of entries
+        self._type_ends = {entry['type']: position + 1 for position, entry in enumerate(self.entries)}
+        pairs = sorted(
+            (word, position)
+            for position, name in enumerate(self._names)
+            for word in set(name.split())
+        )
+        self._words = [word for word, _ in pairs]
+        self._positions = [position for _, position in pairs]
+        # Keystrokes repeat heavily; results are memoized for the life of the index
+        self._results = OrderedDict()
+        self._max_cached_queries = max_cached_queries
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _prefix_matches(self, prefix):
+        start = bisect_left(self._words, prefix)
+        end = bisect_left(self._words, prefix + '\uffff', lo=start)
+        return self._positions[start:end]
+
+    def _match(self, tokens):
+        """Positions of entries matching every token, in ranking order"""
+        # Longest token first - it usually narrows the candidates the most
+        tokens = sorted(tokens, key=len, reverse=True)
+        matches = self._prefix_matches(tokens[0])
+        if len(tokens) > 1:
+            matches = set(matches)
+            for token in tokens[1:]:
+                if not matches:
+                    break
+                matches.intersection_update(self._prefix_matches(token))
+        return sorted(set(matches))
+
+    def search(self, query, now=None):
+        """Ranked suggestions for query, grouped by type as SUGGESTION_LIMITS orders them
+
+        Names starting with the whole query come first, then other word
+        matches; within each group events are soonest first, categories by
+        upcoming events and locations by display order.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        phrase = ' '.join(tokens)
+
+        with self._lock:
+            cached = self._results.get(phrase)
+            if cached is not None:
+                self._results.move_to_end(phrase)
+        if cached is None:
+            cached = self._rank(phrase, self._match(tokens))
+            with self._lock:
+                self._results[phrase] = cached
+                while len(self._results) > self._max_cached_queries:
+                    self._results.popitem(last=False)
+
+        now = now or datetime.utcnow()
+        counts = {}
+        suggestions = []
+        for entry in cached:
+            if entry['expires_at'] is not None and entry['expires_at'] <= now:
+                continue  # Event has started since the index was built
+            if counts.get(entry['type'], 0) >= self._limits[entry['type']]:
+                continue
+            counts[entry['type']] = counts.get(entry['type'], 0) + 1
+            suggestions.append({
+                'type': entry['type'],
+                'id': entry['id'],
+                'title': entry['title'],
+                'subtitle': entry['subtitle']
+            })
+        return suggestions
+
+    def _rank(self, phrase, positions):
+        """Ranked candidate entries per type, with headroom for entries expiring later"""
+        headroom = 2
+        leading, others = {}, {}
+        i = 0
+        while i < len(positions):
+            position = positions[i]
+            entry = self.entries[position]
+            limit = self._limits[entry['type']] * headroom
+            first = leading.setdefault(entry['type'], [])
+            if len(first) >= limit:
+                # Enough phrase-prefix matches for this type; skip to the next type's entries
+                i = bisect_left(positions, self._type_ends[entry['type']], lo=i)
+                continue
+            if self._names[position].startswith(phrase):
+                first.append(entry)
+            else:
+                rest = others.setdefault(entry['type'], [])
+                if len(rest) < limit:
+                    rest.append(entry)
+            i += 1
+
+        ranked = []
+        for suggestion_type, limit in SUGGESTION_LIMITS:
+            candidates = leading.get(suggestion_type, []) + others.get(suggestion_type, [])
+            ranked.extend(candidates[:limit * headroom])
+        return ranked
+
+
+def build_autocomplete_index(version=None):
+    """Build a PrefixIndex from the database (three column-only queries)"""
+    now = datetime.utcnow()
+    entries = []
+
+    category_names = {}
+    for category_id, name, is_active, event_count in db.session.query(
+        Category.id, Category.name, Category.is_active, Category.upcoming_event_count
+    ):
+        category_names[category_id] = name
+        if is_active:
+            entries.append({
+                'type': 'category', 'id': category_id, 'title': name, 'subtitle': 'Category',
+                'rank': -(event_count or 0), 'expires_at': None
+            })
+
+    for event_id, title, category_id, start_date in db.session.query(
+        Event.id, Event.title, Event.category_id, Event.start_date
+    ).filter(
+        Event.is_published == True,
+        Event.status == 'approved',
+        Event.start_date > now
+    ):
+        # Soonest events first
+        entries.append({
+            'type': 'event', 'id': event_id, 'title': title, 'subtitle': category_names.get(category_id),
+            'rank': start_date.timestamp(), 'expires_at': start_date
+        })
+
+    for location_id, name, display_order in db.session.query(
+        Location.id, Location.name, Location.display_order
+    ).filter(Location.is_active == True):
+        entries.append({
+            'type': 'location', 'id': location_id, 'title': name, 'subtitle': 'Location',
+            'rank': display_order or 0, 'expires_at': None
+        })
+
+    return PrefixIndex(entries, version)
+
+
+# Per-worker index state
+_state = {'index': None, 'building': False}
+_state_lock = threading.Lock()
+
+
+def _current_version():
+    try:
+        return get_cache().get_version(INDEX_VERSION)
+    except Exception:
+        return None
+
+
+def _rebuild(app, version):
+    try:
+        with app.app_context():
+            started = time.perf_counter()
+            index = build_autocomplete_index(version)
+            _state['index'] = index
+            app.logger.info(
+                f'Autocomplete index rebuilt: {len(index)} entries in '
+                f'{(time.perf_counter() - started) * 1000:.0f} ms'
+            )
+    except Exception as e:
+        app.logger.warning(f'Autocomplete index rebuild failed: {str(e)}')
+    finally:
+        _state['building'] = False
+
+
+def get_autocomplete_index():
+    """The worker's current index, or None while cold; schedules a rebuild when stale"""
+    index = _state['index']
+    version = _current_version()
+    config = current_app.config
+    age = time.monotonic() - index.built_at if index is not None else None
+    stale = (
+        index is None
+        or age > config.get('AUTOCOMPLETE_INDEX_MAX_AGE', 300)
+        or (index.version != version and age >= config.get('AUTOCOMPLETE_MIN_REBUILD_SECONDS', 30))
+    )
+    if stale:
+        with _state_lock:
+            if not _state['building']:
+                _state['building'] = True
+                threading.Thread(
+                    target=_rebuild,
+                    args=(current_app._get_current_object(), version),
+                    name='autocomplete-index',
+                    daemon=True
+                ).start()
+    return index
+
+
+def reset_autocomplete_index():
+    """Drop the worker's index so the next request rebuilds it"""
+    _state['index'] = None
+
+
+def _indexed_change(obj):
+    attributes = INDEXED_ATTRIBUTES.get(type(obj))
+    if attributes is None:
+        return False
+    state = sa_inspect(obj)
+    return any(state.attrs[key].history.has_changes() for key in attributes)
+
+
+def _after_flush(session, flush_context):
+    if session.info.get('autocomplete_dirty'):
+        return
+    indexed = tuple(INDEXED_ATTRIBUTES)
+    if any(isinstance(obj, indexed) for obj in list(session.new) + list(session.deleted)) or any(
+        _indexed_change(obj) for obj in session.dirty
+    ):
+        session.info['autocomplete_dirty'] = True
+
+
+def _do_orm_execute(orm_execute_state):
+    # Bulk Query.update()/delete() bypass the flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is None or mapper.class_ not in INDEXED_ATTRIBUTES:
+            return
+        if orm_execute_state.is_update:
+            keys = updated_columns(orm_execute_state.statement)
+            if keys is not None and not keys & INDEXED_ATTRIBUTES[mapper.class_]:
+                return
+        orm_execute_state.session.info['autocomplete_dirty'] = True
+
+
+def _after_commit(session):
+    if session.info.pop('autocomplete_dirty', False) and has_app_context():
+        try:
+            get_cache().bump_version(INDEX_VERSION)
+        except Exception as e:
+            current_app.logger.warning(f'Failed to bump autocomplete index version: {str(e)}')
+
+
+def _after_rollback(session):
+    session.info.pop('autocomplete_dirty', None)
+
+
+def register_autocomplete_tracking():
+    """Bump the index version after commits that change indexed names"""
+    if event.contains(Session, 'after_commit', _after_commit):
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
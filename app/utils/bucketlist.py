@@ -0,0 +1,38 @@
+"""
+Bucketlist lookups shared by event listing endpoints
+
+User.bucketlist is a dynamic relationship, so `event in user.bucketlist`
+costs a query per event. These helpers resolve a whole page at once.
+"""
+from sqlalchemy import func
+from app import db
+from app.models.user import bucketlist
+
+
+def get_bucketlist_event_ids(user, event_ids):
+    """Return the subset of event_ids that are in the user's bucketlist (one query)"""
+    if not user or not event_ids:
+        return set()
+    rows = db.session.query(bucketlist.c.event_id).filter(
+        bucketlist.c.user_id == user.id,
+        bucketlist.c.event_id.in_(event_ids)
+    ).all()
+    return {row.event_id for row in rows}
+
+
+def get_bucketlist_counts(event_ids):
+    """Bucketlist saves per event as an {event_id: count} dict (one grouped query)"""
+    if not event_ids:
+        return {}
+    rows = db.session.query(bucketlist.c.event_id, func.count(bucketlist.c.user_id)).filter(
+        bucketlist.c.event_id.in_(event_ids)
+    ).group_by(bucketlist.c.event_id).all()
+    return {event_id: count for event_id, count in rows}
+
+
+def mark_in_bucketlist(event_dicts, user):
+    """Set 'in_bucketlist' on serialized events for the given user (or False if anonymous)"""
+    saved = get_bucketlist_event_ids(user, [event_dict['id'] for event_dict in event_dicts])
+    for event_dict in event_dicts:
+        event_dict['in_bucketlist'] = event_dict['id'] in saved
+    return event_dicts
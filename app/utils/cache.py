@@ -0,0 +1,402 @@
+"""
+Versioned read-through cache for public event listings
+
+Responses are cached under `<namespace>:v<version>:<normalized query params>`.
+The version is bumped after any commit that changes an Event, TicketType,
+EventPromotion, Category or Location, so stale entries are never read again
+and simply age out. Backends:
+
+- LRUCacheBackend: in-process, bounded (default). Entries are per worker,
+  but versions live in files (FileVersion, in CACHE_VERSION_DIR or the
+  instance folder), so a commit in one worker invalidates every worker on
+  the host. Without fcntl (Windows) versions are per worker too, and other
+  workers serve stale listings for up to LISTING_CACHE_SECONDS.
+- RedisCacheBackend: shared across workers, used when REDIS_URL is reachable
+
+Backends keep any number of named versions; listings use LISTING_VERSION,
+and the autocomplete index (app/utils/autocomplete.py) keeps its own.
+
+Set CACHE_BACKEND to 'auto' (default), 'memory' or 'redis'.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, current_app, make_response, has_app_context
+from sqlalchemy import event
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session
+from app.utils.redis_client import get_redis
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+VERSION_KEY = 'nikofree:{}:version'
+LISTING_VERSION = 'listing_cache'
+
+# Model attributes whose changes never show up in cached listings
+IGNORED_ATTRIBUTES = {'view_count', 'updated_at'}
+
+# Stock counters that every hold, sale and expiry moves (app/utils/inventory.py).
+# Listings do show them, but bulk updates of only these leave the cache alone,
+# or it would be emptied on every hold of an on-sale: cached availability may
+# lag by up to LISTING_CACHE_SECONDS, and reserve() checks stock atomically,
+# so a stale count never oversells.
+INVENTORY_ATTRIBUTES = {
+    'quantity_available', 'quantity_held', 'quantity_sold',
+    'seats_held', 'attendee_count', 'total_tickets_sold', 'revenue'
+}
+
+
+class FileVersion:
+    """Version counter in a file, shared by the workers on one host
+
+    Bumps are serialized by an flock on a lock file next to it, and the new
+    value is renamed into place, so readers never see a partial write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+
+    def get(self):
+        try:
+            with open(self.path) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self):
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            version = self.get() + 1
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as f:
+                f.write(str(version))
+            os.replace(temp_path, self.path)
+            return version
+        finally:
+            os.close(fd)  # Releases the flock
+
+
+class LRUCacheBackend:
+    """Bounded in-process cache with per-entry expiry
+
+    Pass version_dir to share versions with other workers through files;
+    without it they are kept in this process.
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_entries=1024, version_dir=None):
+        self.max_entries = max_entries
+        self.version_dir = version_dir
+        self._data = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _file_version(self, name):
+        with self._lock:
+            version = self._versions.get(name)
+            if version is None:
+                version = self._versions[name] = FileVersion(os.path.join(self.version_dir, f'{name}.version'))
+            return version
+
+    def get_version(self, name=LISTING_VERSION):
+        if self.version_dir:
+            return self._file_version(name).get()
+        return self._versions.get(name, 0)
+
+    def bump_version(self, name=LISTING_VERSION):
+        if self.version_dir:
+            return self._file_version(name).bump()
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            return self._versions[name]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCacheBackend:
+    """Cache shared by all workers through Redis"""
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='nikofree:listing_cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(int(ttl), 1))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def get_version(self, name=LISTING_VERSION):
+        return int(self.client.get(VERSION_KEY.format(name)) or 0)
+
+    def bump_version(self, name=LISTING_VERSION):
+        return self.client.incr(VERSION_KEY.format(name))
+
+    def clear(self):
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+class ByteLRUCache:
+    """In-process LRU of bytes values (rendered images, PDFs), bounded by total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._data[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            value = self._data.pop(key, None)
+            if value is not None:
+                self._size -= len(value)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._data), 'bytes': self._size, 'max_bytes': self.max_bytes}
+
+
+class CacheMetrics:
+    """Hit/miss counters per cache namespace (per worker)"""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, namespace, hit):
+        with self._lock:
+            counts = self._counts.setdefault(namespace, {'hits': 0, 'misses': 0})
+            counts['hits' if hit else 'misses'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for namespace, counts in self._counts.items():
+                total = counts['hits'] + counts['misses']
+                result[namespace] = dict(counts, hit_rate=round(counts['hits'] / total, 3) if total else 0.0)
+            return result
+
+
+metrics = CacheMetrics()
+
+
+def init_cache(app):
+    """Pick the cache backend for this app and register model change tracking"""
+    choice = app.config.get('CACHE_BACKEND', 'auto')
+    backend = None
+
+    if choice in ('auto', 'redis'):
+        client = get_redis(app)
+        if client is not None:
+            backend = RedisCacheBackend(client)
+        elif choice == 'redis':
+            app.logger.warning('CACHE_BACKEND=redis but Redis is unreachable; using in-process cache')
+
+    if backend is None:
+        version_dir = None
+        if fcntl is not None:
+            directory = app.config.get('CACHE_VERSION_DIR') or app.instance_path
+            try:
+                os.makedirs(directory, exist_ok=True)
+                version_dir = directory
+            except OSError as e:
+                app.logger.warning(f'Cache version directory unavailable, versioning per worker: {str(e)}')
+        backend = LRUCacheBackend(app.config.get('CACHE_MAX_ENTRIES', 1024), version_dir)
+
+    app.extensions['listing_cache'] = backend
+    _register_invalidation()
+    return backend
+
+
+def get_cache():
+    return current_app.extensions['listing_cache']
+
+
+def _tracked_models():
+    from app.models.event import Event, EventPromotion
+    from app.models.ticket import TicketType
+    from app.models.category import Category, Location
+    return (Event, TicketType, EventPromotion, Category, Location)
+
+
+def _is_relevant_change(obj, tracked):
+    if not isinstance(obj, tracked):
+        return False
+    state = sa_inspect(obj)
+    if not state.persistent:
+        return True
+    for attr in state.attrs:
+        if attr.key not in IGNORED_ATTRIBUTES and attr.history.has_changes():
+            return True
+    return False
+
+
+def _after_flush(session, flush_context):
+    if session.info.get('listing_cache_dirty'):
+        return
+    tracked = _tracked_models()
+    if any(isinstance(obj, tracked) for obj in list(session.new) + list(session.deleted)) or any(
+        _is_relevant_change(obj, tracked) for obj in session.dirty
+    ):
+        session.info['listing_cache_dirty'] = True
+
+
+def updated_columns(statement):
+    """Names of the columns an UPDATE sets, or None if they can't be told"""
+    values = getattr(statement, '_values', None)
+    if not values:
+        return None
+    return {getattr(key, 'key', key) for key in values}
+
+
+def _do_orm_execute(orm_execute_state):
+    # Bulk Query.update()/delete() bypass the flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is None or not issubclass(mapper.class_, _tracked_models()):
+            return
+        if orm_execute_state.is_update:
+            keys = updated_columns(orm_execute_state.statement)
+            if keys is not None and keys <= INVENTORY_ATTRIBUTES | IGNORED_ATTRIBUTES:
+                return
+        orm_execute_state.session.info['listing_cache_dirty'] = True
+
+
+def _after_commit(session):
+    if session.info.pop('listing_cache_dirty', False) and has_app_context():
+        try:
+            get_cache().bump_version()
+        except Exception as e:
+            current_app.logger.warning(f'Failed to bump listing cache version: {str(e)}')
+
+
+def _after_rollback(session):
+    session.info.pop('listing_cache_dirty', None)
+
+
+def _register_invalidation():
+    if event.contains(Session, 'after_commit', _after_commit):
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+
+
+def invalidate_listings():
+    """Explicitly invalidate every cached listing"""
+    return get_cache().bump_version()
+
+
+def _cache_key(namespace, version):
+    args = '&'.join(
+        f'{key}={value}' for key, value in sorted(request.args.items(multi=True))
+    )
+    return f'{namespace}:v{version}:{request.view_args or {}}:{args}'
+
+
+def cached_listing(namespace, anonymous_only=False):
+    """Cache a GET endpoint's JSON response, keyed on its normalized query params
+
+    With anonymous_only=True requests carrying an Authorization header bypass
+    the cache, for endpoints whose response depends on the user.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or (anonymous_only and request.headers.get('Authorization')):
+                return fn(*args, **kwargs)
+
+            cache = get_cache()
+            try:
+                key = _cache_key(namespace, cache.get_version())
+                cached = cache.get(key)
+            except Exception as e:
+                current_app.logger.warning(f'Listing cache unavailable: {str(e)}')
+                return fn(*args, **kwargs)
+
+            if cached is not None:
+                metrics.record(namespace, hit=True)
+                response = current_app.response_class(
+                    cached['body'], status=cached['status'], mimetype='application/json'
+                )
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            metrics.record(namespace, hit=False)
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code == 200:
+                try:
+                    cache.set(key, {
+                        'body': response.get_data(as_text=True),
+                        'status': response.status_code
+                    }, current_app.config.get('LISTING_CACHE_SECONDS', 60))
+                except Exception as e:
+                    current_app.logger.warning(f'Failed to store listing cache entry: {str(e)}')
+            response.headers['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+    return decorator
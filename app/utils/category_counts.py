@@ -0,0 +1,119 @@
+"""
+Upcoming-event counts per category
+
+get_category_event_counts() computes every category's count of upcoming,
+published, approved events with one GROUP BY. Category also carries a
+denormalized `upcoming_event_count` that is recomputed, in the same
+transaction, for the categories touched by any flush that approves,
+publishes, rejects, cancels, moves or deletes an event. Events passing their
+start date change no rows, so the reservation sweeper's leader runs
+reconcile_category_counts() every CATEGORY_COUNT_RECONCILE_SECONDS to
+correct that drift (`flask reconcile-category-counts` when the sweeper is
+off).
+`event_count_updated_at` tells readers how fresh a stored count is.
+"""
+from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import func, select, update, event
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session
+from app import db
+from app.models.event import Event
+from app.models.category import Category
+
+
+# Event attributes that decide whether (and where) an event is counted
+COUNTED_ATTRIBUTES = ('status', 'is_published', 'category_id', 'start_date')
+
+
+def _upcoming_filter(now):
+    return (
+        Event.is_published == True,
+        Event.status == 'approved',
+        Event.start_date > now
+    )
+
+
+def get_category_event_counts():
+    """Live {category_id: upcoming event count} from a single grouped query"""
+    rows = db.session.query(Event.category_id, func.count(Event.id)).filter(
+        *_upcoming_filter(datetime.utcnow())
+    ).group_by(Event.category_id).all()
+    return {category_id: count for category_id, count in rows}
+
+
+def _refresh_statement(category_ids, now):
+    """UPDATE categories with a correlated count subquery"""
+    count_subquery = select(func.count(Event.id)).where(
+        Event.category_id == Category.id,
+        *_upcoming_filter(now)
+    ).scalar_subquery()
+    statement = update(Category.__table__).values(
+        upcoming_event_count=count_subquery,
+        event_count_updated_at=now
+    )
+    if category_ids is not None:
+        statement = statement.where(Category.__table__.c.id.in_(category_ids))
+    return statement
+
+
+def refresh_category_counts(category_ids=None):
+    """Recompute stored counts for the given categories (all when None); caller commits"""
+    if category_ids is not None and not category_ids:
+        return
+    db.session.execute(_refresh_statement(category_ids, datetime.utcnow()))
+
+
+def reconcile_category_counts():
+    """Recompute every stored count and return {category_id: (stored, actual)} for drifted ones"""
+    live = get_category_event_counts()
+    drifted = {}
+    for category_id, stored in db.session.query(Category.id, Category.upcoming_event_count).all():
+        actual = live.get(category_id, 0)
+        if (stored or 0) != actual:
+            drifted[category_id] = (stored, actual)
+
+    refresh_category_counts()
+    db.session.commit()
+
+    if drifted and has_app_context():
+        current_app.logger.info(f'Reconciled category event counts: {drifted}')
+    return drifted
+
+
+def _affected_categories(obj, deleted=False):
+    """Old and new category ids of an event whose counted attributes changed"""
+    state = sa_inspect(obj)
+    category_ids = set(state.attrs.category_id.history.deleted or ()) | {obj.category_id}
+
+    if deleted or any(state.attrs[key].history.has_changes() for key in COUNTED_ATTRIBUTES):
+        return category_ids
+    return set()
+
+
+def _after_flush(session, flush_context):
+    category_ids = set()
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Event):
+            category_ids |= _affected_categories(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Event):
+            category_ids |= _affected_categories(obj, deleted=True)
+    category_ids.discard(None)
+    if category_ids:
+        session.info.setdefault('category_counts_dirty', set()).update(category_ids)
+
+
+def _after_flush_postexec(session, flush_context):
+    category_ids = session.info.pop('category_counts_dirty', None)
+    if category_ids:
+        # Same connection and transaction as the event change itself
+        session.connection().execute(_refresh_statement(sorted(category_ids), datetime.utcnow()))
+
+
+def register_category_count_tracking():
+    """Keep Category.upcoming_event_count in step with event changes"""
+    if event.contains(Session, 'after_flush', _after_flush):
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_flush_postexec', _after_flush_postexec)
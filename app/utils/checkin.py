@@ -0,0 +1,353 @@
+"""
+Ticket check-in
+
+The verify, check-in and scan routes read a ticket with gate_ticket(): one
+joined query projecting only the ticket, ticket type, booking, event owner
+and attendee columns the gate needs, instead of walking ticket.booking,
+booking.event and booking.user lazily.
+
+check_in_ticket() marks a ticket scanned with one conditional UPDATE, so two
+gates scanning the same ticket at once can't both admit it: the UPDATE only
+matches a valid, unscanned ticket of a confirmed booking for an event the
+scanning partner owns, and whichever gate's UPDATE lands first wins.
+
+Door devices with poor connectivity work offline from a manifest
+(iter_manifest) and upload their scans in batches (apply_scans):
+
+- The manifest is NDJSON: a header line, one [ticket id, ticket type id,
+  state, hashes] line per ticket, then {"end": true, "count": n}. State is
+  'v' (admit), 's' (already scanned) or 'x' (no longer admissible, only
+  sent in deltas). Hashes are qr_payload_hash() of every code the ticket
+  may present: its signed payload under each accepted key, plus the bare
+  ticket number while QR_ACCEPT_UNSIGNED is on.
+- The header's cursor fetches tickets changed since (tickets.updated_at,
+  with CHECKIN_MANIFEST_OVERLAP_SECONDS of overlap for transactions that
+  were still open). Its version covers the key set, so after a key
+  rotation a delta request gets a full manifest instead.
+- apply_scans() admits a batch with chunked conditional UPDATEs, the
+  earliest scan of each ticket winning, and reports every record that
+  lost to an earlier scan.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, select, func, exists, case
+from app import db
+from app.models.event import Event
+from app.models.ticket import Booking, Ticket, TicketType
+from app.models.user import User
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.qrcode_generator import (
+    sign_ticket, signing_key_ids, verify_qr_code, is_signed_qr_code, qr_payload_hash
+)
+
+
+MANIFEST_FORMAT = 1
+MAX_SCAN_BATCH = 1000
+UPDATE_CHUNK_SIZE = 500
+
+
+def gate_ticket(ticket_id=None, ticket_number=None):
+    """A ticket and everything the gate shows about it, in one query (None if not found)"""
+    query = db.session.query(
+        Ticket.id, Ticket.ticket_number, Ticket.qr_code, Ticket.is_valid, Ticket.is_scanned,
+        Ticket.scanned_at, Ticket.created_at, Ticket.ticket_type_id,
+        TicketType.name.label('ticket_type_name'), TicketType.price.label('ticket_type_price'),
+        Booking.id.label('booking_id'), Booking.booking_number, Booking.event_id, Booking.quantity,
+        Booking.status.label('booking_status'), Booking.is_checked_in, Booking.checked_in_at,
+        Event.partner_id, Event.title.label('event_title'),
+        User.id.label('user_id'), User.email, User.phone_number, User.first_name, User.last_name,
+        User.profile_picture
+    ).join(Booking, Ticket.booking_id == Booking.id).join(
+        Event, Booking.event_id == Event.id
+    ).join(User, Booking.user_id == User.id).outerjoin(TicketType, Ticket.ticket_type_id == TicketType.id)
+    if ticket_id is not None:
+        query = query.filter(Ticket.id == ticket_id)
+    else:
+        query = query.filter(Ticket.ticket_number == ticket_number)
+    return query.first()
+
+
+def gate_ticket_dict(row, checked_in_at=None):
+    """Ticket fields for gate responses; checked_in_at marks a check-in made after row was read"""
+    scanned_at = checked_in_at or row.scanned_at
+    return {
+        'id': row.id,
+        'ticket_number': row.ticket_number,
+        'qr_code': row.qr_code,
+        'ticket_type': {
+            'id': row.ticket_type_id,
+            'name': row.ticket_type_name,
+            'price': float(row.ticket_type_price) if row.ticket_type_price is not None else None
+        } if row.ticket_type_name is not None else None,
+        'is_valid': row.is_valid,
+        'is_scanned': bool(checked_in_at or row.is_scanned),
+        'scanned_at': scanned_at.isoformat() if scanned_at else None,
+        'created_at': row.created_at.isoformat() if row.created_at else None
+    }
+
+
+def gate_booking_dict(row):
+    return {
+        'id': row.booking_id,
+        'booking_number': row.booking_number,
+        'event_id': row.event_id,
+        'event_title': row.event_title,
+        'quantity': row.quantity,
+        'status': row.booking_status,
+        'is_checked_in': row.is_checked_in,
+        'checked_in_at': row.checked_in_at.isoformat() if row.checked_in_at else None
+    }
+
+
+def gate_attendee_dict(row):
+    return {
+        'id': row.user_id,
+        'email': row.email,
+        'phone_number': row.phone_number,
+        'first_name': row.first_name,
+        'last_name': row.last_name,
+        'full_name': f"{row.first_name} {row.last_name}",
+        'profile_picture': row.profile_picture
+    }
+
+
+def check_in_ticket(ticket_id, partner_id, event_id, ticket_type_id=None, now=None):
+    """
+    Check a ticket in if it is admissible; caller commits
+    
+    Args:
+        ticket_id: Ticket to check in
+        partner_id: Scanning partner; must own the event
+        event_id: Event the ticket must belong to
+        ticket_type_id: If given, the ticket must be of this type
+        now: Check-in time (defaults to utcnow)
+        
+    Returns:
+        bool: True if this call checked the ticket in, False if it was
+        already scanned, invalid, or not for this partner's event
+    """
+    now = now or datetime.utcnow()
+    criteria = [
+        Ticket.id == ticket_id,
+        Ticket.is_valid == True,
+        func.coalesce(Ticket.is_scanned, False) == False,
+        Ticket.booking_id.in_(
+            select(Booking.id).where(Booking.event_id == event_id, Booking.status == 'confirmed')
+        ),
+        exists().where(Event.id == event_id, Event.partner_id == partner_id)
+    ]
+    if ticket_type_id is not None:
+        criteria.append(Ticket.ticket_type_id == ticket_type_id)
+    checked_in = db.session.execute(
+        update(Ticket).where(*criteria).values(is_scanned=True, scanned_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if checked_in:
+        # First ticket scanned marks the booking as checked in
+        db.session.execute(
+            update(Booking)
+            .where(
+                Booking.id == select(Ticket.booking_id).where(Ticket.id == ticket_id).scalar_subquery(),
+                func.coalesce(Booking.is_checked_in, False) == False
+            )
+            .values(is_checked_in=True, checked_in_at=now, checked_in_by=partner_id)
+            .execution_options(synchronize_session=False)
+        )
+    return bool(checked_in)
+
+
+def manifest_version(event_id):
+    """Changes whenever the codes a manifest lists hashes for change"""
+    accept_unsigned = current_app.config.get('QR_ACCEPT_UNSIGNED', True)
+    key = f"{MANIFEST_FORMAT}:{event_id}:{','.join(signing_key_ids())}:{int(accept_unsigned)}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def _ticket_hashes(ticket_id, event_id, ticket_type_id, ticket_number, key_ids, accept_unsigned):
+    hashes = [qr_payload_hash(sign_ticket(ticket_id, event_id, ticket_type_id, key_id)) for key_id in key_ids]
+    if accept_unsigned:
+        hashes.append(qr_payload_hash(ticket_number))
+    return hashes
+
+
+def iter_manifest(event_id, cursor=None, version=None):
+    """
+    Yield an event's check-in manifest as NDJSON-ready objects
+    
+    Args:
+        event_id: Event to list tickets for
+        cursor: Header cursor from an earlier manifest, for a delta
+        version: Header version from that manifest
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    started_at = datetime.utcnow()
+    since = None
+    if cursor and version == manifest_version(event_id):
+        since, _ = decode_cursor(cursor)
+        if not isinstance(since, datetime):
+            raise ValueError('Invalid cursor')
+    
+    query = db.session.query(
+        Ticket.id, Ticket.ticket_type_id, Ticket.ticket_number, Ticket.is_valid, Ticket.is_scanned, Booking.status
+    ).join(Booking, Ticket.booking_id == Booking.id).filter(Booking.event_id == event_id)
+    if since is None:
+        query = query.filter(Ticket.is_valid == True, Booking.status == 'confirmed')
+    else:
+        overlap = current_app.config.get('CHECKIN_MANIFEST_OVERLAP_SECONDS', 10)
+        query = query.filter(Ticket.updated_at > since - timedelta(seconds=overlap))
+    
+    yield {
+        'event_id': event_id,
+        'version': manifest_version(event_id),
+        'full': since is None,
+        'cursor': encode_cursor(started_at, 0),
+        'generated_at': started_at.isoformat()
+    }
+    
+    key_ids = signing_key_ids()
+    accept_unsigned = current_app.config.get('QR_ACCEPT_UNSIGNED', True)
+    count = 0
+    for ticket_id, ticket_type_id, ticket_number, is_valid, is_scanned, status in query.order_by(Ticket.id).yield_per(1000):
+        if not is_valid or status != 'confirmed':
+            state = 'x'
+        else:
+            state = 's' if is_scanned else 'v'
+        yield [ticket_id, ticket_type_id, state,
+               _ticket_hashes(ticket_id, event_id, ticket_type_id, ticket_number, key_ids, accept_unsigned)]
+        count += 1
+    yield {'end': True, 'count': count}
+
+
+def _scan_time(value, now):
+    """Device scan time, defaulting to and capped at now"""
+    try:
+        scanned_at = datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return now
+    return min(scanned_at, now)
+
+
+def apply_scans(event_id, partner_id, records, now=None):
+    """
+    Check in a batch of offline scan records for one event; caller commits
+    
+    Args:
+        event_id: Event the device was scanning for (ownership already checked)
+        partner_id: Partner uploading the scans
+        records: [{'qr_data' or 'ticket_id', 'scanned_at'}], at most MAX_SCAN_BATCH
+        now: Upload time (defaults to utcnow)
+        
+    Returns:
+        list: One result per record, in order: {'index', 'ticket_id', 'status'}
+        plus 'scanned_at' for conflicts. Status is 'checked_in',
+        'already_scanned' (scanned before this batch), 'duplicate' (scanned
+        earlier in this batch), 'invalid', 'not_found' or 'invalid_code'.
+    """
+    now = now or datetime.utcnow()
+    results = [{'index': index, 'ticket_id': None, 'status': 'invalid_code'} for index in range(len(records))]
+    scans = []  # (scanned_at, index, ticket_id)
+    legacy = {}  # ticket_number -> [(scanned_at, index)]
+    accept_unsigned = current_app.config.get('QR_ACCEPT_UNSIGNED', True)
+    
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            continue
+        scanned_at = _scan_time(record.get('scanned_at'), now)
+        qr_data = record.get('qr_data')
+        if qr_data:
+            if is_signed_qr_code(qr_data):
+                claims = verify_qr_code(qr_data)
+                if claims and claims['event_id'] == event_id:
+                    scans.append((scanned_at, index, claims['ticket_id']))
+            elif accept_unsigned and isinstance(qr_data, str):
+                legacy.setdefault(qr_data.strip(), []).append((scanned_at, index))
+        elif isinstance(record.get('ticket_id'), int):
+            scans.append((scanned_at, index, record['ticket_id']))
+    
+    if legacy:
+        numbers = list(legacy)
+        for start in range(0, len(numbers), UPDATE_CHUNK_SIZE):
+            chunk = numbers[start:start + UPDATE_CHUNK_SIZE]
+            for ticket_id, ticket_number in db.session.query(Ticket.id, Ticket.ticket_number).join(
+                Booking, Ticket.booking_id == Booking.id
+            ).filter(Booking.event_id == event_id, Ticket.ticket_number.in_(chunk)):
+                scans.extend((scanned_at, index, ticket_id) for scanned_at, index in legacy.pop(ticket_number))
+        for unmatched in legacy.values():
+            for _, index in unmatched:
+                results[index]['status'] = 'not_found'
+    
+    # The earliest scan of each ticket is the one that counts
+    first_scans = {}
+    duplicates = []
+    for scanned_at, index, ticket_id in sorted(scans, key=lambda scan: (scan[0], scan[1])):
+        results[index]['ticket_id'] = ticket_id
+        if ticket_id in first_scans:
+            duplicates.append(index)
+        else:
+            first_scans[ticket_id] = (scanned_at, index)
+    
+    admitted = set()
+    ticket_ids = list(first_scans)
+    for start in range(0, len(ticket_ids), UPDATE_CHUNK_SIZE):
+        chunk = ticket_ids[start:start + UPDATE_CHUNK_SIZE]
+        admitted.update(db.session.scalars(
+            update(Ticket)
+            .where(
+                Ticket.id.in_(chunk),
+                Ticket.is_valid == True,
+                func.coalesce(Ticket.is_scanned, False) == False,
+                Ticket.booking_id.in_(
+                    select(Booking.id).where(Booking.event_id == event_id, Booking.status == 'confirmed')
+                )
+            )
+            .values(is_scanned=True, scanned_at=case(
+                {ticket_id: first_scans[ticket_id][0] for ticket_id in chunk}, value=Ticket.id
+            ))
+            .returning(Ticket.id)
+            .execution_options(synchronize_session=False)
+        ).all())
+    
+    if admitted:
+        admitted_ids = list(admitted)
+        for start in range(0, len(admitted_ids), UPDATE_CHUNK_SIZE):
+            db.session.execute(
+                update(Booking)
+                .where(
+                    Booking.id.in_(select(Ticket.booking_id).where(Ticket.id.in_(admitted_ids[start:start + UPDATE_CHUNK_SIZE]))),
+                    func.coalesce(Booking.is_checked_in, False) == False
+                )
+                .values(is_checked_in=True, checked_in_at=now, checked_in_by=partner_id)
+                .execution_options(synchronize_session=False)
+            )
+    
+    # Work out why the rest were turned away
+    rejected = [ticket_id for ticket_id in ticket_ids if ticket_id not in admitted]
+    found = {}
+    for start in range(0, len(rejected), UPDATE_CHUNK_SIZE):
+        for row in db.session.query(
+            Ticket.id, Ticket.is_valid, Ticket.is_scanned, Ticket.scanned_at, Booking.status
+        ).join(Booking, Ticket.booking_id == Booking.id).filter(
+            Ticket.id.in_(rejected[start:start + UPDATE_CHUNK_SIZE]), Booking.event_id == event_id
+        ):
+            found[row.id] = row
+    for ticket_id, (scanned_at, index) in first_scans.items():
+        result = results[index]
+        row = found.get(ticket_id)
+        if ticket_id in admitted:
+            result['status'] = 'checked_in'
+        elif row is None:
+            result['status'] = 'not_found'
+        elif row.is_scanned:
+            result.update(status='already_scanned', scanned_at=row.scanned_at.isoformat() if row.scanned_at else None)
+        else:
+            result['status'] = 'invalid'
+    for index in duplicates:
+        first = results[first_scans[results[index]['ticket_id']][1]]
+        if first['status'] == 'checked_in':
+            results[index].update(status='duplicate', scanned_at=first_scans[first['ticket_id']][0].isoformat())
+        else:
+            results[index].update({key: value for key, value in first.items() if key != 'index'})
+    return results
@@ -1,6 +1,7 @@
 from flask import current_app, render_template_string
 from flask_mail import Message
 from app import mail
+from app.utils.qrcode_generator import absolute_qr_code_url
 from threading import Thread
 from datetime import datetime
 import socket
@@ -387,7 +388,7 @@ def send_booking_confirmation_email(booking, tickets):
         <div style="border: 1px solid #ddd; padding: 15px; margin: 10px 0; border-radius: 5px; background-color: {COMPANY_WHITE};">
             <p style="margin: 0 0 10px 0; color: {COMPANY_BLACK};"><strong>Ticket #{ticket.ticket_number}</strong></p>
             <p style="margin: 0 0 10px 0; color: #555;">Type: {ticket.ticket_type.name}</p>
-            <img src="{ticket.qr_code}" alt="QR Code" style="max-width: 200px; display: block; margin: 10px auto;">
+            <img src="{absolute_qr_code_url(ticket)}" alt="QR Code" style="max-width: 200px; display: block; margin: 10px auto;">
         </div>
         """
     
@@ -773,7 +774,7 @@ def send_payment_confirmation_email(booking, payment, tickets):
     
     tickets_html = ""
     for ticket in tickets:
-        qr_url = ticket.qr_code if ticket.qr_code else ""
+        qr_url = absolute_qr_code_url(ticket)
         tickets_html += f"""
         <div style="border: 1px solid #ddd; padding: 15px; margin: 10px 0; border-radius: 5px; background-color: #f9f9f9;">
             <p><strong>Ticket #{ticket.ticket_number}</strong></p>
@@ -0,0 +1,104 @@
+"""
+Batch serialization for event listings
+
+Event.to_dict() walks every relationship of a single event, which costs a
+separate query per relationship per event. serialize_events() loads the
+related rows for a whole page in a handful of IN (...) queries and then
+builds the same JSON through Event.serialize().
+"""
+from collections import defaultdict
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models.event import EventHost, EventInterest
+from app.models.ticket import TicketType, PromoCode, Booking
+from app.models.partner import Partner
+from app.models.category import Category, Location
+from app.utils.bucketlist import get_bucketlist_counts
+
+
+def _group_by_event(rows):
+    """Group rows by their event_id, preserving query order"""
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.event_id].append(row)
+    return grouped
+
+
+def _load_by_id(model, ids, *options):
+    """Load rows of model for the given primary keys as an {id: row} dict"""
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return {}
+    query = model.query
+    if options:
+        query = query.options(*options)
+    return {row.id: row for row in query.filter(model.id.in_(ids)).all()}
+
+
+def get_bookings_counts(event_ids):
+    """Confirmed bookings per event as an {event_id: count} dict (one grouped query)"""
+    if not event_ids:
+        return {}
+    rows = db.session.query(Booking.event_id, func.count(Booking.id)).filter(
+        Booking.event_id.in_(event_ids),
+        Booking.status == 'confirmed'
+    ).group_by(Booking.event_id).all()
+    return {event_id: count for event_id, count in rows}
+
+
+def serialize_events(events, include_stats=False):
+    """Serialize a list of events, batching all relationship loads
+
+    Returns a list of dicts in the same order as `events`, identical to
+    calling event.to_dict(include_stats) on each one.
+    """
+    events = list(events)
+    if not events:
+        return []
+
+    event_ids = [event.id for event in events]
+
+    ticket_types = _group_by_event(
+        TicketType.query.filter(TicketType.event_id.in_(event_ids)).order_by(TicketType.id).all()
+    )
+    hosts = _group_by_event(
+        EventHost.query.options(joinedload(EventHost.user))
+        .filter(EventHost.event_id.in_(event_ids)).order_by(EventHost.id).all()
+    )
+    interests = _group_by_event(
+        EventInterest.query.filter(EventInterest.event_id.in_(event_ids)).order_by(EventInterest.id).all()
+    )
+    promo_codes = _group_by_event(
+        PromoCode.query.filter(PromoCode.event_id.in_(event_ids)).order_by(PromoCode.id).all()
+    )
+
+    partners = _load_by_id(Partner, [e.partner_id for e in events], joinedload(Partner.category))
+    categories = _load_by_id(Category, [e.category_id for e in events])
+    locations = _load_by_id(Location, [e.location_id for e in events])
+
+    stats = {}
+    if include_stats:
+        bucketlist_counts = get_bucketlist_counts(event_ids)
+        bookings_counts = get_bookings_counts(event_ids)
+        stats = {
+            event_id: {
+                'bucketlist_count': bucketlist_counts.get(event_id, 0),
+                'bookings_count': bookings_counts.get(event_id, 0)
+            }
+            for event_id in event_ids
+        }
+
+    return [
+        event.serialize(
+            organizer=partners.get(event.partner_id),
+            category=categories.get(event.category_id),
+            location=locations.get(event.location_id),
+            hosts=hosts.get(event.id, []),
+            interests=interests.get(event.id, []),
+            ticket_types=ticket_types.get(event.id, []),
+            promo_codes=promo_codes.get(event.id, []),
+            stats=stats.get(event.id) if include_stats else None
+        )
+        for event in events
+    ]
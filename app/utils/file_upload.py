@@ -5,6 +5,7 @@ from werkzeug.utils import secure_filename
 from flask import current_app
 from PIL import Image
 import io
+from app.utils.http_client import get_upstream
 
 
 def allowed_file(filename):
@@ -162,14 +163,15 @@ def download_image_from_url(image_url, folder='profiles'):
         return None
     
     try:
-        # Download image
-        response = requests.get(image_url, timeout=10, stream=True)
+        # Download image - URLs are user-supplied, so one dead host must not open a circuit for all of them
+        response = get_upstream('images', circuit_breaker=False).get(image_url, stream=True)
         response.raise_for_status()
         
         # Check content type
         content_type = response.headers.get('content-type', '')
         if not content_type.startswith('image/'):
             print(f"Warning: URL does not point to an image. Content-Type: {content_type}")
+            response.close()  # Unread stream: hand the connection back to the pool
             return None
         
         # Determine file extension from content type or URL
@@ -0,0 +1,172 @@
+"""
+Geohash spatial index for "events near me"
+
+Every event with coordinates stores its 12-character geohash in the indexed
+`events.geohash` column, kept current by mapper hooks on insert and update.
+A geohash prefix is a lat/lng cell, and every point inside the cell has a
+geohash starting with that prefix, so the events in a cell are one B-tree
+range scan: `geohash BETWEEN prefix AND prefix || 'zzz...'`.
+
+find_nearby_events() covers the search circle's bounding box with at most
+MAX_COVERING_CELLS cells at the finest precision that allows, then keeps only
+candidates within radius_km by haversine distance and sorts them nearest
+first.
+"""
+import math
+from sqlalchemy import or_, and_, event
+from app.models.event import Event
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LNG = 111.320  # At the equator
+# Upper bound on index ranges per search; more cells means a tighter fit around the circle
+MAX_COVERING_CELLS = 16
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a point, `precision` characters long"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Geohash bits alternate longitude, latitude
+
+    while len(chars) < precision:
+        value, interval = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            interval[0] = mid
+        else:
+            bits <<= 1
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(lat_degrees, lng_degrees) spanned by a geohash cell of this precision"""
+    total_bits = precision * 5
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _bounding_box(latitude, longitude, radius_km):
+    """(min_lat, max_lat, min_lng, max_lng) around the search circle, or None if it spans a pole or the globe"""
+    d_lat = radius_km / KM_PER_DEGREE_LAT
+    if abs(latitude) + d_lat >= 90.0:
+        return None
+    # Degrees of longitude shrink away from the equator; size for the circle's widest edge
+    d_lng = radius_km / (KM_PER_DEGREE_LNG * math.cos(math.radians(abs(latitude) + d_lat)))
+    if d_lng >= 180.0:
+        return None
+    return latitude - d_lat, latitude + d_lat, longitude - d_lng, longitude + d_lng
+
+
+def covering_cells(latitude, longitude, radius_km, max_cells=MAX_COVERING_CELLS):
+    """Geohash prefixes whose cells together cover the search circle
+
+    Uses the finest precision at which at most max_cells cells cover the
+    circle's bounding box. Returns an empty list when the circle is too large
+    for any prefix to help.
+    """
+    box = _bounding_box(latitude, longitude, radius_km)
+    if box is None:
+        return []
+    min_lat, max_lat, min_lng, max_lng = box
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_degrees, lng_degrees = cell_size(precision)
+        first_row = math.floor((min_lat + 90.0) / lat_degrees)
+        last_row = math.floor((max_lat + 90.0) / lat_degrees)
+        first_col = math.floor((min_lng + 180.0) / lng_degrees)
+        last_col = math.floor((max_lng + 180.0) / lng_degrees)
+        if (last_row - first_row + 1) * (last_col - first_col + 1) > max_cells:
+            continue
+
+        cells = set()
+        for row in range(first_row, last_row + 1):
+            cell_lat = (row + 0.5) * lat_degrees - 90.0
+            for col in range(first_col, last_col + 1):
+                # Wrap across the antimeridian
+                cell_lng = ((col + 0.5) * lng_degrees) % 360.0 - 180.0
+                cells.add(encode_geohash(cell_lat, cell_lng, precision))
+        return sorted(cells)
+    return []
+
+
+def _cell_ranges(cells):
+    """Merge sorted same-precision cells into contiguous (first, last) geohash ranges"""
+    ranges = []
+    for cell in cells:
+        if ranges:
+            first, last = ranges[-1]
+            if cell[:-1] == last[:-1] and BASE32.index(cell[-1]) == BASE32.index(last[-1]) + 1:
+                ranges[-1] = (first, cell)
+                continue
+        ranges.append((cell, cell))
+    return ranges
+
+
+def geohash_filter(cells):
+    """SQL condition matching events in any of the cells (one index range per run of adjacent cells)"""
+    padding = 'z' * GEOHASH_PRECISION
+    return or_(*[
+        and_(Event.geohash >= first, Event.geohash <= last + padding[len(last):])
+        for first, last in _cell_ranges(cells)
+    ])
+
+
+def find_nearby_events(query, latitude, longitude, radius_km):
+    """[(event_id, distance_km)] of events in query within radius_km, nearest first
+
+    `query` is an Event query carrying the caller's filters; only the id and
+    coordinates of candidate rows are loaded.
+    """
+    query = query.filter(Event.geohash.isnot(None))
+    cells = covering_cells(latitude, longitude, radius_km)
+    if cells:
+        query = query.filter(geohash_filter(cells))
+
+    results = []
+    for event_id, event_lat, event_lng in query.with_entities(Event.id, Event.latitude, Event.longitude):
+        distance = haversine_km(latitude, longitude, event_lat, event_lng)
+        if distance <= radius_km:
+            results.append((event_id, distance))
+    results.sort(key=lambda result: (result[1], result[0]))
+    return results
+
+
+def _set_geohash(mapper, connection, target):
+    try:
+        target.geohash = encode_geohash(float(target.latitude), float(target.longitude))
+    except (TypeError, ValueError):
+        target.geohash = None
+
+
+def register_geohash_tracking():
+    """Keep Event.geohash in step with the event's coordinates"""
+    if event.contains(Event, 'before_insert', _set_geohash):
+        return
+    event.listen(Event, 'before_insert', _set_geohash)
+    event.listen(Event, 'before_update', _set_geohash)
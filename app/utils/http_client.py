@@ -0,0 +1,236 @@
+"""
+Shared HTTP client for outbound integrations (Daraja, Celcom, image hosts)
+
+Each upstream gets one requests.Session per process, so connections are
+kept alive and pooled per host instead of being opened for every call.
+Every request is bounded by a connect and a read timeout
+(HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT), so a slow upstream cannot pin a
+worker.
+
+- Retries: idempotent calls (GET and friends, or retry=True) are retried
+  up to HTTP_RETRIES times on connection errors, timeouts and 429/502/503/504,
+  after a jittered exponential backoff. Other calls are retried only when the
+  connection could not be made, since the request never reached the upstream.
+- Circuit breaker: after HTTP_BREAKER_FAILURES consecutive failures (errors,
+  timeouts, 5xx) calls fail fast with UpstreamUnavailable for
+  HTTP_BREAKER_RESET_SECONDS, then a single trial call decides whether to
+  close the circuit again. Clients of arbitrary hosts (image downloads) run
+  without one.
+- Metrics: per-upstream call, error, retry and short-circuit counts plus
+  latency percentiles (per worker), shown at /api/diagnostics/upstreams.
+
+UpstreamUnavailable subclasses requests' ConnectionError, so existing
+`except requests.RequestException` handlers treat an open circuit like an
+unreachable host.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+LATENCY_SAMPLES = 512
+
+
+class UpstreamUnavailable(requests.exceptions.ConnectionError):
+    """Raised without calling the upstream while its circuit is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker: closed -> open -> half_open -> closed
+
+    A failure_threshold of 0 never opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out now"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True  # Let one trial call through
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if not self.failure_threshold:
+                return
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+
+class UpstreamMetrics:
+    """Call counts and recent latencies for one upstream (per worker)"""
+
+    def __init__(self):
+        self.counts = {'calls': 0, 'errors': 0, 'retries': 0, 'short_circuited': 0}
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms, error):
+        with self._lock:
+            self.counts['calls'] += 1
+            if error:
+                self.counts['errors'] += 1
+            self._latencies.append(elapsed_ms)
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            result = dict(self.counts)
+        result['error_rate'] = round(result['errors'] / result['calls'], 3) if result['calls'] else 0.0
+        for label, fraction in (('p50_ms', 0.50), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+            result[label] = round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))], 1) if latencies else None
+        return result
+
+
+class Upstream:
+    """Pooled, timeout-bounded, retrying client for one upstream service"""
+
+    def __init__(self, name, connect_timeout=3.05, read_timeout=15, pool_size=10, retries=2,
+                 backoff_seconds=0.2, breaker=None):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = UpstreamMetrics()
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Sockets must not be shared with a forked parent, so each process builds its own pools
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session, self._pid = session, os.getpid()
+        return self._session
+
+    def _can_retry(self, attempt):
+        # Once the circuit opens, report the real failure rather than retrying into UpstreamUnavailable
+        return attempt < self.retries and self.breaker.state != 'open'
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retrying workers from hitting a recovering upstream in lockstep
+        time.sleep(random.uniform(0, self.backoff_seconds * (2 ** attempt)))
+
+    def request(self, method, url, retry=None, timeout=None, **kwargs):
+        """Send a request; retry defaults to whether the method is idempotent
+
+        Raises UpstreamUnavailable while the circuit is open, and requests'
+        exceptions once retries are exhausted.
+        """
+        method = method.upper()
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        kwargs['timeout'] = timeout or self.timeout
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.metrics.count('short_circuited')
+                raise UpstreamUnavailable(f'{self.name} is unavailable (circuit open)')
+
+            began = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.metrics.record((time.perf_counter() - began) * 1000, error=True)
+                self.breaker.record_failure()
+                # A failed connect never reached the upstream, so it is safe to repeat any call
+                retryable = retry or isinstance(e, requests.exceptions.ConnectTimeout)
+                if not retryable or not self._can_retry(attempt):
+                    raise
+            else:
+                failed = response.status_code >= 500
+                self.metrics.record((time.perf_counter() - began) * 1000, error=failed)
+                if failed:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if not (retry and response.status_code in RETRY_STATUSES) or not self._can_retry(attempt):
+                    return response
+                response.close()
+
+            self.metrics.count('retries')
+            self._backoff(attempt)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+def get_upstream(name, circuit_breaker=True):
+    """The app's client for a named upstream, created on first use
+
+    Pass circuit_breaker=False for clients that call many unrelated hosts
+    (e.g. user-supplied URLs), where a few dead hosts must not fail calls to
+    the others fast.
+    """
+    upstreams = current_app.extensions.setdefault('http_upstreams', {})
+    upstream = upstreams.get(name)
+    if upstream is None:
+        config = current_app.config
+        upstream = upstreams.setdefault(name, Upstream(
+            name,
+            connect_timeout=config.get('HTTP_CONNECT_TIMEOUT', 3.05),
+            read_timeout=config.get('HTTP_READ_TIMEOUT', 15),
+            pool_size=config.get('HTTP_POOL_SIZE', 10),
+            retries=config.get('HTTP_RETRIES', 2),
+            backoff_seconds=config.get('HTTP_RETRY_BACKOFF_SECONDS', 0.2),
+            breaker=CircuitBreaker(
+                failure_threshold=config.get('HTTP_BREAKER_FAILURES', 5) if circuit_breaker else 0,
+                reset_seconds=config.get('HTTP_BREAKER_RESET_SECONDS', 30)
+            )
+        ))
+    return upstream
+
+
+def upstream_status():
+    """Breaker state and metrics for every upstream this worker has called"""
+    return {
+        name: dict(upstream.metrics.snapshot(), circuit=upstream.breaker.state,
+                   consecutive_failures=upstream.breaker.failures)
+        for name, upstream in current_app.extensions.get('http_upstreams', {}).items()
+    }
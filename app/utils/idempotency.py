@@ -0,0 +1,174 @@
+"""
+Idempotency-Key support for endpoints that must not run twice
+
+Mobile clients on flaky networks retry requests whose responses they never
+saw. With @idempotent, a request carrying an `Idempotency-Key` header is
+recorded in idempotency_keys under (user, endpoint, key) before the handler
+runs, and its response is stored when it finishes:
+
+- A retry with the same key and body gets the stored response back
+  (marked `Idempotent-Replayed: true`) without the handler running again,
+  so no second booking or STK push.
+- A retry that arrives while the first request is still running waits for
+  it, up to IDEMPOTENCY_WAIT_SECONDS, then gets 409.
+- Reusing a key with a different body is rejected with 422.
+- Server errors (5xx) are not stored, so the client can retry them. A
+  request whose worker died is taken over once IDEMPOTENCY_LOCK_SECONDS
+  pass.
+
+Keys expire after IDEMPOTENCY_TTL_HOURS and are purged by the reservation
+sweeper's leader (or `flask purge-idempotency-keys`).
+"""
+import hashlib
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, current_app, jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from sqlalchemy import update, delete, select, or_, and_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.idempotency import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+POLL_SECONDS = 0.05
+
+
+def _fingerprint():
+    body = request.get_data(cache=True) or b''
+    return hashlib.sha256(request.method.encode() + b' ' + request.path.encode() + b'\n' + body).hexdigest()
+
+
+def _replay(record):
+    response = current_app.response_class(
+        record.response_body, status=record.response_code, mimetype=record.response_mimetype
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(scope, key, fingerprint):
+    """Record this request under its key; returns (record id, None) to run
+    the handler or (None, response) to answer without running it"""
+    config = current_app.config
+    deadline = time.monotonic() + config.get('IDEMPOTENCY_WAIT_SECONDS', 10)
+    while True:
+        now = datetime.utcnow()
+        locked_until = now + timedelta(seconds=config.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+        expires_at = now + timedelta(hours=config.get('IDEMPOTENCY_TTL_HOURS', 24))
+        record = IdempotencyKey(scope=scope, key=key, fingerprint=fingerprint, status='in_progress',
+                                locked_until=locked_until, expires_at=expires_at)
+        db.session.add(record)
+        try:
+            db.session.commit()
+            return record.id, None
+        except IntegrityError:
+            db.session.rollback()  # Seen before
+
+        existing = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+        if existing is None:
+            continue  # Purged in between
+
+        expired = existing.expires_at <= now
+        if not expired and existing.fingerprint != fingerprint:
+            db.session.rollback()
+            return None, (jsonify({'error': f'{HEADER} was already used for a different request'}), 422)
+
+        if not expired and existing.status == 'completed':
+            response = _replay(existing)
+            db.session.rollback()
+            return None, response
+
+        stalled = existing.status == 'in_progress' and existing.locked_until and existing.locked_until <= now
+        if expired or stalled:
+            # Take the key over; only one waiting request can win
+            taken = db.session.execute(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.id == existing.id,
+                    or_(
+                        IdempotencyKey.expires_at <= now,
+                        and_(IdempotencyKey.status == 'in_progress', IdempotencyKey.locked_until <= now)
+                    )
+                )
+                .values(fingerprint=fingerprint, status='in_progress', locked_until=locked_until,
+                        expires_at=expires_at, response_code=None, response_body=None, response_mimetype=None)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+            if taken:
+                return existing.id, None
+            continue
+
+        # The first request is still running: wait for its response
+        db.session.rollback()  # Read fresh rows on the next pass
+        if time.monotonic() >= deadline:
+            response = jsonify({'error': f'A request with this {HEADER} is still being processed'})
+            response.headers['Retry-After'] = '1'
+            return None, (response, 409)
+        time.sleep(POLL_SECONDS)
+
+
+def _finish(record_id, response):
+    """Store the response for replays, or forget the key after a server error"""
+    if response.status_code >= 500:
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == record_id))
+    else:
+        db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.id == record_id)
+            .values(status='completed', locked_until=None, response_code=response.status_code,
+                    response_body=response.get_data(as_text=True), response_mimetype=response.mimetype)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+
+def idempotent(fn):
+    """Replay stored responses for requests retried with the same Idempotency-Key
+
+    Put it above the route's authentication decorator; requests without the
+    header, or without a valid token, are passed straight through.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if request.method == 'OPTIONS' or not key:
+            return fn(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({'error': f'{HEADER} must be at most 255 characters'}), 400
+
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except Exception:
+            identity = None
+        if identity is None:
+            return fn(*args, **kwargs)  # The route's own authentication answers
+
+        record_id, response = _claim(f'{identity}:{request.endpoint}'[:150], key, _fingerprint())
+        if response is not None:
+            return response
+
+        try:
+            response = current_app.make_response(fn(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            _finish(record_id, current_app.response_class(status=500))
+            raise
+        db.session.rollback()  # Anything the handler left uncommitted is discarded anyway
+        _finish(record_id, response)
+        return response
+    return wrapper
+
+
+def purge_expired_keys(limit=1000):
+    """Delete up to limit expired keys; returns how many were deleted"""
+    expired = select(IdempotencyKey.id).where(IdempotencyKey.expires_at <= datetime.utcnow()).limit(limit)
+    count = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.id.in_(expired.scalar_subquery()))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return count
@@ -0,0 +1,469 @@
+"""
+Concurrency-safe ticket inventory
+
+Every stock and counter change is a single conditional UPDATE, so two
+workers booking the last tickets at the same moment cannot both succeed:
+
+- `ticket_types.quantity_available` counts tickets that are neither sold nor
+  held. A booking takes its tickets with `SET quantity_available =
+  quantity_available - n WHERE quantity_available >= n`; no row updated
+  means sold out. The row lock taken by the UPDATE serializes concurrent
+  bookings on PostgreSQL (the WHERE is re-checked after the wait), and
+  SQLite serializes all writers.
+- Unpaid bookings hold their tickets in the `ticket_reservations` ledger,
+  one row per booking with its own expiry, mirrored by the
+  `ticket_types.quantity_held` and `events.seats_held` counters. Seats are
+  only taken while `attendee_count + seats_held + n <= attendee_capacity`.
+  Deleting the ledger row is what releases or converts a hold, so a hold is
+  given back exactly once; expired holds are released as soon as a booking
+  needs their tickets, and otherwise by the sweeper thread in
+  app/utils/reservation_sweeper.py.
+- Booking status changes are conditional on the current status, so a payment
+  callback delivered twice, or a cancellation racing a payment, moves
+  inventory exactly once.
+- Promo code usage is claimed with `current_uses + 1 WHERE current_uses <
+  max_uses`, and per user in `promo_code_redemptions` with `uses + 1 WHERE
+  uses < max_uses_per_user` (inserting the user's first use), so neither
+  limit needs a count over bookings.
+
+Cart bookings (several ticket types, listed in booking_items) take and
+hold each type's tickets in the same transaction, with one ledger row per
+type. Bookings made before holds were recorded have no reservation and hold
+nothing. Callers own the transaction: commit on success, roll back on InventoryError.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, delete, insert, func, or_, case, select, true, literal
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.event import Event
+from app.models.partner import Partner
+from app.models.ticket import TicketType, Booking, PromoCode, PromoCodeRedemption, TicketReservation
+from app.utils.reservation_sweeper import record_hold_event
+
+
+class InventoryError(Exception):
+    """A booking could not get its tickets; the message is safe to show users"""
+
+
+def _update(model, *criteria, **values):
+    """Run a conditional UPDATE and return the number of rows it changed"""
+    return db.session.execute(
+        update(model).where(*criteria).values(**values)
+    ).rowcount
+
+
+def _nonnegative(expression):
+    return case((expression < 0, 0), else_=expression)
+
+
+def _take_tickets(ticket_type_id, quantity, sold, force=False):
+    """Take quantity tickets from stock (unlimited types always succeed)
+
+    Tickets that are not sold are counted in quantity_held.
+    """
+    if sold:
+        values = {'quantity_sold': func.coalesce(TicketType.quantity_sold, 0) + quantity}
+    else:
+        values = {'quantity_held': func.coalesce(TicketType.quantity_held, 0) + quantity}
+    limited = _update(
+        TicketType,
+        TicketType.id == ticket_type_id,
+        TicketType.quantity_available.isnot(None),
+        true() if force else TicketType.quantity_available >= quantity,
+        quantity_available=TicketType.quantity_available - quantity,
+        **values
+    )
+    if limited:
+        return True
+    # Unlimited ticket types have no stock to run out of
+    unlimited = _update(TicketType, TicketType.id == ticket_type_id, TicketType.quantity_available.is_(None), **values)
+    return bool(unlimited)
+
+
+def _take_seats(event_id, quantity, hold, force=False):
+    """Take quantity seats within the event's attendee_capacity"""
+    attendee_count = func.coalesce(Event.attendee_count, 0)
+    seats_held = func.coalesce(Event.seats_held, 0)
+    if hold:
+        values = {'seats_held': seats_held + quantity}
+    else:
+        values = {
+            'attendee_count': attendee_count + quantity,
+            'total_tickets_sold': func.coalesce(Event.total_tickets_sold, 0) + quantity
+        }
+    capacity = true() if force else or_(
+        Event.attendee_capacity.is_(None),
+        attendee_count + seats_held + quantity <= Event.attendee_capacity
+    )
+    return bool(_update(Event, Event.id == event_id, capacity, **values))
+
+
+def claim_promo_code(promo_code_id):
+    """Count one use of a promo code unless it has reached max_uses"""
+    return bool(_update(
+        PromoCode,
+        PromoCode.id == promo_code_id,
+        or_(PromoCode.max_uses.is_(None), func.coalesce(PromoCode.current_uses, 0) < PromoCode.max_uses),
+        current_uses=func.coalesce(PromoCode.current_uses, 0) + 1
+    ))
+
+
+def claim_user_promo_code(promo_code_id, user_id, force=False):
+    """Count one use of a promo code by a user unless they have reached max_uses_per_user"""
+    per_user = select(func.coalesce(PromoCode.max_uses_per_user, 1)).where(PromoCode.id == promo_code_id).scalar_subquery()
+    criteria = (
+        PromoCodeRedemption.promo_code_id == promo_code_id,
+        PromoCodeRedemption.user_id == user_id
+    )
+    within_limit = true() if force else PromoCodeRedemption.uses < per_user
+    if _update(PromoCodeRedemption, *criteria, within_limit, uses=PromoCodeRedemption.uses + 1):
+        return True
+
+    # The user's first use
+    try:
+        with db.session.begin_nested():
+            first_use = select(literal(promo_code_id), literal(user_id), literal(1))
+            if not force:
+                first_use = first_use.where(per_user >= 1)
+            inserted = db.session.execute(
+                insert(PromoCodeRedemption).from_select(['promo_code_id', 'user_id', 'uses'], first_use)
+            ).rowcount
+        return bool(inserted)
+    except IntegrityError:
+        # Already counted (or another request got there first)
+        return bool(_update(PromoCodeRedemption, *criteria, within_limit, uses=PromoCodeRedemption.uses + 1))
+
+
+def release_promo_code(promo_code_id, user_id=None, uses=1):
+    _update(
+        PromoCode,
+        PromoCode.id == promo_code_id,
+        current_uses=_nonnegative(func.coalesce(PromoCode.current_uses, 0) - uses)
+    )
+    if user_id is not None:
+        _update(
+            PromoCodeRedemption,
+            PromoCodeRedemption.promo_code_id == promo_code_id,
+            PromoCodeRedemption.user_id == user_id,
+            uses=_nonnegative(PromoCodeRedemption.uses - uses)
+        )
+
+
+def reserve(booking, hold=True):
+    """Take tickets, seats and promo usage for a new booking
+
+    With hold=True (paid bookings awaiting payment) the tickets are held in
+    the reservation ledger until booking.reserved_until, confirm_booking()
+    or release_booking(); with hold=False (free bookings) they are sold
+    immediately. When stock or capacity is short, expired holds on the event
+    are released and the booking tries once more. Raises InventoryError;
+    the caller's rollback undoes any ticket types already taken.
+    """
+    lines = booking.lines()
+    for ticket_type_id, quantity in lines:
+        if not _take_tickets(ticket_type_id, quantity, sold=not hold):
+            if not (release_expired_reservations(event_id=booking.event_id)
+                    and _take_tickets(ticket_type_id, quantity, sold=not hold)):
+                raise InventoryError('Not enough tickets available')
+    if not _take_seats(booking.event_id, booking.quantity, hold):
+        if not (release_expired_reservations(event_id=booking.event_id)
+                and _take_seats(booking.event_id, booking.quantity, hold)):
+            raise InventoryError('This event is fully booked')
+    if booking.promo_code_id:
+        if not claim_promo_code(booking.promo_code_id):
+            raise InventoryError('Promo code usage limit reached')
+        if not claim_user_promo_code(booking.promo_code_id, booking.user_id):
+            raise InventoryError('You have already used this promo code')
+    if hold:
+        hold_minutes = current_app.config.get('BOOKING_HOLD_MINUTES', 5)
+        expires_at = booking.reserved_until or datetime.utcnow() + timedelta(minutes=hold_minutes)
+        db.session.add_all([
+            TicketReservation(
+                booking_id=booking.id,
+                event_id=booking.event_id,
+                ticket_type_id=ticket_type_id,
+                quantity=quantity,
+                expires_at=expires_at
+            )
+            for ticket_type_id, quantity in lines
+        ])
+        db.session.flush()
+        record_hold_event('created', booking_id=booking.id, expires_at=expires_at)
+
+
+def _drop_reservation(booking):
+    """Delete a booking's hold from the ledger; returns the (ticket_type_id, quantity) it held, empty if none"""
+    return db.session.execute(
+        delete(TicketReservation)
+        .where(TicketReservation.booking_id == booking.id)
+        .returning(TicketReservation.ticket_type_id, TicketReservation.quantity)
+    ).all()
+
+
+def _fallback_ticket_type_id(booking):
+    """Ticket type of a booking made before bookings recorded one"""
+    return db.session.execute(
+        select(TicketType.id).where(TicketType.event_id == booking.event_id).order_by(TicketType.id).limit(1)
+    ).scalar()
+
+
+def _credit_sale(booking):
+    """Revenue and partner earnings for a paid booking"""
+    amount = booking.total_amount or 0
+    _update(Event, Event.id == booking.event_id, revenue=func.coalesce(Event.revenue, 0) + amount)
+    partner_amount = booking.partner_amount or 0
+    partner_id = db.session.execute(select(Event.partner_id).where(Event.id == booking.event_id)).scalar()
+    _update(
+        Partner,
+        Partner.id == partner_id,
+        pending_earnings=func.coalesce(Partner.pending_earnings, 0) + partner_amount,
+        total_earnings=func.coalesce(Partner.total_earnings, 0) + partner_amount
+    )
+
+
+def confirm_booking(booking):
+    """Mark a booking paid and turn its hold into a sale
+
+    Returns False, changing nothing, if the booking was already confirmed
+    (e.g. a repeated payment callback) or was paid and then cancelled. A payment that arrives after the
+    hold was released takes the tickets again; if they have been sold in the
+    meantime the sale is still recorded, since the customer has paid, and
+    the oversell is logged.
+    """
+    now = datetime.utcnow()
+    confirmed = {
+        'status': 'confirmed',
+        'payment_status': 'paid',
+        'confirmed_at': now,
+        'reserved_until': None
+    }
+
+    if _update(Booking, Booking.id == booking.id, Booking.status == 'pending', **confirmed):
+        held = _drop_reservation(booking)
+        if held:
+            # Held tickets become sold
+            record_hold_event('converted')
+            for ticket_type_id, quantity in held:
+                _update(
+                    TicketType,
+                    TicketType.id == ticket_type_id,
+                    quantity_held=_nonnegative(func.coalesce(TicketType.quantity_held, 0) - quantity),
+                    quantity_sold=func.coalesce(TicketType.quantity_sold, 0) + quantity
+                )
+            _update(
+                Event,
+                Event.id == booking.event_id,
+                seats_held=_nonnegative(func.coalesce(Event.seats_held, 0) - booking.quantity),
+                attendee_count=func.coalesce(Event.attendee_count, 0) + booking.quantity,
+                total_tickets_sold=func.coalesce(Event.total_tickets_sold, 0) + booking.quantity
+            )
+        else:
+            _sell_without_hold(booking)
+        _credit_sale(booking)
+        return True
+
+    if _update(
+        Booking,
+        Booking.id == booking.id,
+        Booking.status == 'cancelled',
+        func.coalesce(Booking.payment_status, 'unpaid') != 'paid',
+        **confirmed
+    ):
+        # The hold expired and was released before the payment came through
+        _sell_without_hold(booking)
+        if booking.promo_code_id:
+            claim_promo_code(booking.promo_code_id)
+            claim_user_promo_code(booking.promo_code_id, booking.user_id, force=True)
+        _credit_sale(booking)
+        return True
+
+    return False
+
+
+def _sell_without_hold(booking):
+    """Record a sale for a paid booking that holds no inventory"""
+    lines = booking.lines()
+    if lines == [(None, booking.quantity)]:
+        booking.ticket_type_id = _fallback_ticket_type_id(booking)
+        lines = [(booking.ticket_type_id, booking.quantity)]
+    short = [
+        (ticket_type_id, quantity) for ticket_type_id, quantity in lines
+        if ticket_type_id is not None and not _take_tickets(ticket_type_id, quantity, sold=True)
+    ]
+    took_seats = _take_seats(booking.event_id, booking.quantity, hold=False)
+    if short or not took_seats:
+        current_app.logger.error(
+            f'Booking {booking.id} was paid after its tickets were released and sold; '
+            f'recording the sale over capacity'
+        )
+        for ticket_type_id, quantity in short:
+            _take_tickets(ticket_type_id, quantity, sold=True, force=True)
+        if not took_seats:
+            _take_seats(booking.event_id, booking.quantity, hold=False, force=True)
+
+
+def release_booking(booking):
+    """Cancel a booking and return its tickets, seats and promo usage
+
+    Returns False, changing nothing, if the booking was already cancelled or
+    changed status concurrently. Confirmed bookings give their tickets back
+    to stock; promo usage and earnings of confirmed bookings are kept.
+    """
+    previous_status = booking.status
+    if previous_status == 'cancelled':
+        return False
+    if not _update(
+        Booking,
+        Booking.id == booking.id,
+        Booking.status == previous_status,
+        status='cancelled',
+        cancelled_at=datetime.utcnow()
+    ):
+        return False
+
+    quantity = booking.quantity
+    if previous_status == 'pending':
+        held = _drop_reservation(booking)
+        if not held:
+            return True  # Made before holds were recorded; nothing was taken
+        record_hold_event('released')
+        for ticket_type_id, held_quantity in held:
+            _update(
+                TicketType,
+                TicketType.id == ticket_type_id,
+                quantity_available=case(
+                    (TicketType.quantity_available.is_(None), None),
+                    else_=TicketType.quantity_available + held_quantity
+                ),
+                quantity_held=_nonnegative(func.coalesce(TicketType.quantity_held, 0) - held_quantity)
+            )
+        _update(
+            Event,
+            Event.id == booking.event_id,
+            seats_held=_nonnegative(func.coalesce(Event.seats_held, 0) - quantity)
+        )
+        if booking.promo_code_id:
+            release_promo_code(booking.promo_code_id, booking.user_id)
+        return True
+
+    if previous_status == 'confirmed':
+        lines = booking.lines()
+        if lines == [(None, quantity)]:
+            first_ticket = booking.tickets.first()
+            lines = [(first_ticket.ticket_type_id if first_ticket else None, quantity)]
+        for ticket_type_id, sold_quantity in lines:
+            if not ticket_type_id:
+                continue
+            _update(
+                TicketType,
+                TicketType.id == ticket_type_id,
+                quantity_available=case(
+                    (TicketType.quantity_available.is_(None), None),
+                    else_=TicketType.quantity_available + sold_quantity
+                ),
+                quantity_sold=_nonnegative(func.coalesce(TicketType.quantity_sold, 0) - sold_quantity)
+            )
+        _update(
+            Event,
+            Event.id == booking.event_id,
+            attendee_count=_nonnegative(func.coalesce(Event.attendee_count, 0) - quantity),
+            total_tickets_sold=_nonnegative(func.coalesce(Event.total_tickets_sold, 0) - quantity)
+        )
+    return True
+
+
+def release_expired_reservations(event_id=None, now=None, limit=None):
+    """Cancel pending bookings whose holds have expired, returning their tickets in bulk
+
+    Reads expired rows from the ledger's expires_at index, optionally for one
+    event. The bookings are cancelled with one conditional UPDATE, so holds a
+    concurrent payment or cancellation got to first are skipped; stock, seats
+    and promo usage go back with one UPDATE per ticket type, event and promo
+    code. Returns the number of bookings released.
+    """
+    now = now or datetime.utcnow()
+    query = select(TicketReservation.booking_id).where(TicketReservation.expires_at <= now)
+    if event_id is not None:
+        query = query.where(TicketReservation.event_id == event_id)
+    booking_ids = db.session.execute(query.order_by(TicketReservation.expires_at).limit(limit)).scalars().all()
+    if not booking_ids:
+        return 0
+
+    cancelled = db.session.execute(
+        update(Booking)
+        .where(Booking.id.in_(booking_ids), Booking.status == 'pending')
+        .values(status='cancelled', cancelled_at=now)
+        .returning(Booking.id, Booking.promo_code_id, Booking.user_id)
+    ).all()
+    if not cancelled:
+        return 0
+    holds = db.session.execute(
+        delete(TicketReservation)
+        .where(TicketReservation.booking_id.in_([booking_id for booking_id, _, _ in cancelled]))
+        .returning(
+            TicketReservation.booking_id, TicketReservation.event_id,
+            TicketReservation.ticket_type_id, TicketReservation.quantity
+        )
+    ).all()
+
+    tickets, seats = Counter(), Counter()
+    for _, hold_event_id, ticket_type_id, quantity in holds:
+        tickets[ticket_type_id] += quantity
+        seats[hold_event_id] += quantity
+    promo_uses = Counter(promo_code_id for _, promo_code_id, _ in cancelled if promo_code_id)
+    user_promo_uses = Counter((promo_code_id, user_id) for _, promo_code_id, user_id in cancelled if promo_code_id)
+
+    for ticket_type_id, quantity in tickets.items():
+        _update(
+            TicketType,
+            TicketType.id == ticket_type_id,
+            quantity_available=case(
+                (TicketType.quantity_available.is_(None), None),
+                else_=TicketType.quantity_available + quantity
+            ),
+            quantity_held=_nonnegative(func.coalesce(TicketType.quantity_held, 0) - quantity)
+        )
+    for seats_event_id, quantity in seats.items():
+        _update(
+            Event,
+            Event.id == seats_event_id,
+            seats_held=_nonnegative(func.coalesce(Event.seats_held, 0) - quantity)
+        )
+    for promo_code_id, uses in promo_uses.items():
+        release_promo_code(promo_code_id, uses=uses)
+    for (promo_code_id, user_id), uses in user_promo_uses.items():
+        _update(
+            PromoCodeRedemption,
+            PromoCodeRedemption.promo_code_id == promo_code_id,
+            PromoCodeRedemption.user_id == user_id,
+            uses=_nonnegative(PromoCodeRedemption.uses - uses)
+        )
+
+    record_hold_event('expired', len({booking_id for booking_id, _, _, _ in holds}))
+    return len(cancelled)
+
+
+def resize_ticket_type(ticket_type, quantity_total):
+    """Change a ticket type's total, adjusting stock in SQL (None or 0 = unlimited)"""
+    if not quantity_total:
+        _update(TicketType, TicketType.id == ticket_type.id, quantity_total=None, quantity_available=None)
+        return
+
+    if ticket_type.quantity_total is None or ticket_type.quantity_available is None:
+        # Was unlimited: everything not sold or held is available
+        available = (
+            quantity_total
+            - func.coalesce(TicketType.quantity_held, 0)
+            - func.coalesce(TicketType.quantity_sold, 0)
+        )
+    else:
+        # Shift stock by the change in total, so concurrent bookings are not lost
+        available = TicketType.quantity_available + (quantity_total - ticket_type.quantity_total)
+    _update(
+        TicketType,
+        TicketType.id == ticket_type.id,
+        quantity_total=quantity_total,
+        quantity_available=_nonnegative(available)
+    )
@@ -1,8 +1,9 @@
-import requests
 import base64
 from datetime import datetime
 from flask import current_app
 import json
+from app.utils.http_client import get_upstream
+from app.utils.mpesa_token import get_token_cache
 
 
 class MPesaClient:
@@ -16,16 +17,24 @@ class MPesaClient:
         self.passkey = current_app.config.get('MPESA_PASSKEY')
         self.callback_url = current_app.config.get('MPESA_CALLBACK_URL')
         
-        # Set API URLs - Production only
+        # Set API URLs - Production only, unless MPESA_BASE_URL points elsewhere (e.g. daraja_stub.py)
         env = current_app.config.get('MPESA_ENVIRONMENT', 'production')
-        if env == 'production':
+        if current_app.config.get('MPESA_BASE_URL'):
+            self.base_url = current_app.config['MPESA_BASE_URL'].rstrip('/')
+        elif env == 'production':
             self.base_url = 'https://api.safaricom.co.ke'
         else:
             # Fallback to production even if misconfigured
             self.base_url = 'https://api.safaricom.co.ke'
+        self.token_cache = get_token_cache(self.base_url, self.consumer_key)
+        self.http = get_upstream('mpesa')
     
     def get_access_token(self):
-        """Get OAuth access token"""
+        """OAuth access token, shared by all workers until shortly before it expires"""
+        return self.token_cache.get(self._fetch_access_token)
+    
+    def _fetch_access_token(self):
+        """Request a new OAuth access token; returns (token, expires_in seconds) or (None, 0)"""
         url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
         
         # Create basic auth header
@@ -38,12 +47,33 @@ class MPesaClient:
         }
         
         try:
-            response = requests.get(url, headers=headers)
+            response = self.http.get(url, headers=headers)
             response.raise_for_status()
-            return response.json().get('access_token')
+            data = response.json()
+            return data.get('access_token'), int(data.get('expires_in') or 3599)
         except Exception as e:
             print(f"Error getting MPesa access token: {str(e)}")
-            return None
+            return None, 0
+    
+    def _post(self, path, payload, retry=False):
+        """POST to Daraja with the cached token, fetching a new one once if it is rejected
+
+        retry=True lets the shared client retry transient failures; only for
+        calls that are safe to repeat.
+        """
+        for attempt in range(2):
+            access_token = self.get_access_token()
+            if not access_token:
+                return {'error': 'Failed to get access token'}
+            headers = {
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
+            }
+            response = self.http.post(f"{self.base_url}{path}", json=payload, headers=headers, retry=retry)
+            if response.status_code != 401 or attempt:
+                return response.json()
+            # Revoked or expired early: drop it so the next attempt fetches a new one
+            self.token_cache.invalidate(access_token)
     
     def stk_push(self, phone_number, amount, account_reference, transaction_desc):
         """
@@ -58,10 +88,6 @@ class MPesaClient:
         Returns:
             dict: API response
         """
-        access_token = self.get_access_token()
-        if not access_token:
-            return {'error': 'Failed to get access token'}
-        
         # Generate timestamp
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         
@@ -71,13 +97,6 @@ class MPesaClient:
         password = base64.b64encode(password_bytes).decode('ascii')
         
         # Prepare request
-        url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
-        
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         payload = {
             'BusinessShortCode': self.business_shortcode,
             'Password': password,
@@ -93,8 +112,7 @@ class MPesaClient:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            return response.json()
+            return self._post('/mpesa/stkpush/v1/processrequest', payload)
         except Exception as e:
             print(f"Error initiating STK push: {str(e)}")
             return {'error': str(e)}
@@ -109,10 +127,6 @@ class MPesaClient:
         Returns:
             dict: API response
         """
-        access_token = self.get_access_token()
-        if not access_token:
-            return {'error': 'Failed to get access token'}
-        
         # Generate timestamp
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         
@@ -121,13 +135,6 @@ class MPesaClient:
         password_bytes = password_string.encode('ascii')
         password = base64.b64encode(password_bytes).decode('ascii')
         
-        url = f"{self.base_url}/mpesa/stkpushquery/v1/query"
-        
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         payload = {
             'BusinessShortCode': self.business_shortcode,
             'Password': password,
@@ -136,8 +143,7 @@ class MPesaClient:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            return response.json()
+            return self._post('/mpesa/stkpushquery/v1/query', payload, retry=True)
         except Exception as e:
             print(f"Error querying STK push: {str(e)}")
             return {'error': str(e)}
@@ -154,17 +160,6 @@ class MPesaClient:
         Returns:
             dict: API response
         """
-        access_token = self.get_access_token()
-        if not access_token:
-            return {'error': 'Failed to get access token'}
-        
-        url = f"{self.base_url}/mpesa/b2c/v1/paymentrequest"
-        
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         # Security credential - for production, must be encrypted with MPesa public key
         # This should be set in environment variables as MPESA_SECURITY_CREDENTIAL
         from flask import current_app
@@ -188,8 +183,7 @@ class MPesaClient:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            return response.json()
+            return self._post('/mpesa/b2c/v1/paymentrequest', payload)
         except Exception as e:
             print(f"Error initiating B2C payment: {str(e)}")
             return {'error': str(e)}
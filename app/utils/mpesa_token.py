@@ -0,0 +1,265 @@
+"""
+M-Pesa OAuth token cache shared by every worker
+
+Daraja access tokens last an hour (expires_in), so fetching one before each
+STK push doubles the latency of every payment call and, during on-sales,
+risks Daraja's rate limits. get_access_token() in app/utils/mpesa.py goes
+through a TokenCache instead:
+
+- The token is kept with its expiry in a shared store and reused until it is
+  within MPESA_TOKEN_REFRESH_SECONDS of expiring.
+- Refreshes are single-flight: the worker holding the store's lock fetches a
+  new token, and everyone else keeps using the current one while it is still
+  valid (or waits for the new one, up to MPESA_TOKEN_WAIT_SECONDS, once it
+  has expired).
+- Each process also remembers the last token it saw, so the store is only
+  read when that copy needs refreshing.
+
+Stores, picked by MPESA_TOKEN_BACKEND ('auto' uses Redis when reachable,
+else a file):
+
+- RedisTokenStore: shared by all workers and hosts
+- FileTokenStore: a 0600 JSON file plus an flock, shared by workers on one host
+- MemoryTokenStore: per process
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from flask import current_app
+from app.utils.cache import metrics
+from app.utils.redis_client import get_redis
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+LOCK_POLL_SECONDS = 0.05
+
+
+class MemoryTokenStore:
+    """Token held in this process"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def read(self):
+        return self._entry
+
+    def write(self, token, expires_at):
+        self._entry = (token, expires_at)
+
+    def delete(self):
+        self._entry = None
+
+    @contextmanager
+    def lock(self, blocking, timeout):
+        acquired = self._lock.acquire(blocking, timeout if blocking else -1)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._lock.release()
+
+
+class FileTokenStore:
+    """Token in a JSON file, refreshed under an exclusive flock on a lock file next to it"""
+
+    name = 'file'
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)
+            return entry['token'], entry['expires_at']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def write(self, token, expires_at):
+        # Write a private temp file and rename it, so readers never see half a token
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'token': token, 'expires_at': expires_at}, f)
+        os.replace(temp_path, self.path)
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def lock(self, blocking, timeout):
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        acquired = False
+        try:
+            deadline = time.monotonic() + (timeout if blocking else 0)
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    acquired = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        break
+                    time.sleep(LOCK_POLL_SECONDS)
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+class RedisTokenStore:
+    """Token in Redis, refreshed under a SET NX lock that expires on its own if its holder dies"""
+
+    name = 'redis'
+
+    # Delete the lock only if this worker still holds it
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, client, key, lock_seconds=30):
+        self.client = client
+        self.key = key
+        self.lock_key = f'{key}:lock'
+        self.lock_seconds = lock_seconds
+        self._release = client.register_script(self.RELEASE_SCRIPT)
+
+    def read(self):
+        value = self.client.get(self.key)
+        if value is None:
+            return None
+        entry = json.loads(value)
+        return entry['token'], entry['expires_at']
+
+    def write(self, token, expires_at):
+        ttl = max(int(expires_at - time.time()), 1)
+        self.client.set(self.key, json.dumps({'token': token, 'expires_at': expires_at}), ex=ttl)
+
+    def delete(self):
+        self.client.delete(self.key)
+
+    @contextmanager
+    def lock(self, blocking, timeout):
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + (timeout if blocking else 0)
+        acquired = False
+        while True:
+            if self.client.set(self.lock_key, owner, nx=True, ex=self.lock_seconds):
+                acquired = True
+                break
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(LOCK_POLL_SECONDS)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._release(keys=[self.lock_key], args=[owner])
+
+
+class TokenCache:
+    """Expiry-aware, single-flight access token cache over a store"""
+
+    def __init__(self, store, refresh_seconds=300, wait_seconds=10):
+        self.store = store
+        self.refresh_seconds = refresh_seconds
+        self.wait_seconds = wait_seconds
+        self._local = None  # (token, expires_at) last seen by this process
+        self.fetches = 0
+
+    def _fresh(self, entry, now):
+        return entry is not None and entry[1] - now > self.refresh_seconds
+
+    def get(self, fetch):
+        """A valid token, calling fetch() -> (token, expires_in seconds) only when one is due
+
+        Returns None if no token could be obtained.
+        """
+        now = time.time()
+        if self._fresh(self._local, now):
+            metrics.record('mpesa_token', True)
+            return self._local[0]
+
+        entry = self.store.read()
+        if self._fresh(entry, now):
+            self._local = entry
+            metrics.record('mpesa_token', True)
+            return entry[0]
+        metrics.record('mpesa_token', False)
+
+        # Due for refresh. While the current token still works, only the lock
+        # holder refreshes and nobody waits for it.
+        usable = entry if entry is not None and entry[1] > now else None
+        with self.store.lock(blocking=usable is None, timeout=self.wait_seconds) as acquired:
+            if not acquired:
+                return usable[0] if usable else None
+
+            entry = self.store.read()  # Another worker may have refreshed while we waited
+            if self._fresh(entry, time.time()):
+                self._local = entry
+                return entry[0]
+
+            self.fetches += 1
+            token, expires_in = fetch()
+            if not token:
+                return usable[0] if usable else None
+            entry = (token, time.time() + expires_in)
+            self.store.write(*entry)
+            self._local = entry
+            return token
+
+    def invalidate(self, token=None):
+        """Forget the cached token (e.g. Daraja rejected it), unless it has already been replaced"""
+        entry = self.store.read()
+        if token is None or (entry is not None and entry[0] == token):
+            self.store.delete()
+        if token is None or (self._local is not None and self._local[0] == token):
+            self._local = None
+
+
+def get_token_cache(base_url, consumer_key):
+    """The app's token cache for one Daraja host and set of credentials"""
+    caches = current_app.extensions.setdefault('mpesa_token_caches', {})
+    cache_id = hashlib.sha256(f'{base_url}|{consumer_key}'.encode()).hexdigest()[:16]
+    cache = caches.get(cache_id)
+    if cache is None:
+        config = current_app.config
+        choice = config.get('MPESA_TOKEN_BACKEND', 'auto')
+        store = None
+        if choice in ('auto', 'redis'):
+            client = get_redis(current_app)
+            if client is not None:
+                store = RedisTokenStore(client, f'nikofree:mpesa_token:{cache_id}')
+            elif choice == 'redis':
+                current_app.logger.warning('MPESA_TOKEN_BACKEND=redis but Redis is unreachable; using a file')
+        if store is None and choice != 'memory' and fcntl is not None:
+            directory = config.get('MPESA_TOKEN_DIR') or current_app.instance_path
+            os.makedirs(directory, exist_ok=True)
+            store = FileTokenStore(os.path.join(directory, f'mpesa-token-{cache_id}.json'))
+        if store is None:
+            store = MemoryTokenStore()
+        cache = caches.setdefault(cache_id, TokenCache(
+            store,
+            refresh_seconds=config.get('MPESA_TOKEN_REFRESH_SECONDS', 300),
+            wait_seconds=config.get('MPESA_TOKEN_WAIT_SECONDS', 10)
+        ))
+    return cache
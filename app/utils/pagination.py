@@ -0,0 +1,144 @@
+"""
+Keyset (cursor) pagination for list endpoints
+
+Offset pagination runs a COUNT(*) over the whole filtered set and an OFFSET
+scan that grows with the page number. When a request passes `?cursor=`
+(empty for the first page), paginate_query() instead seeks on an indexed
+(sort_column, id) pair and returns an opaque `next_cursor`. Totals are only
+computed when `include_total=true`, and then come from a short-lived cache.
+"""
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from flask import request, current_app
+from sqlalchemy import tuple_
+
+
+# Approximate totals: {cache_key: (expires_at, count)}
+_count_cache = OrderedDict()
+_COUNT_CACHE_MAX_ENTRIES = 1000
+_count_cache_lock = threading.Lock()
+
+
+class KeysetPage:
+    """A page of keyset-paginated results
+
+    Exposes the same attributes as a Flask-SQLAlchemy Pagination so route code
+    can build responses the same way in either mode.
+    """
+
+    def __init__(self, items, per_page, next_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.has_more = next_cursor is not None
+        self.total = total
+        self.page = None
+        self.pages = None
+
+
+def encode_cursor(sort_value, row_id):
+    """Encode the last row's sort key as an opaque URL-safe cursor"""
+    if isinstance(sort_value, datetime):
+        sort_value = {'dt': sort_value.isoformat()}
+    payload = json.dumps([sort_value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor(); raises ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value['dt'])
+        return sort_value, int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def cursor_requested():
+    """Whether the current request opted into cursor mode"""
+    return 'cursor' in request.args
+
+
+def _count_cache_key(scope):
+    """Normalized key for a list request: path, caller scope and filter params"""
+    args = sorted(
+        (key, value) for key, value in request.args.items(multi=True)
+        if key not in ('cursor', 'page', 'per_page', 'include_total')
+    )
+    return (request.path, scope, tuple(args))
+
+
+def approximate_count(query, scope=None):
+    """Total rows for query, cached per request shape for PAGINATION_COUNT_CACHE_SECONDS"""
+    ttl = current_app.config.get('PAGINATION_COUNT_CACHE_SECONDS', 60)
+    key = _count_cache_key(scope)
+    now = time.monotonic()
+
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    count = query.order_by(None).count()
+    with _count_cache_lock:
+        _count_cache[key] = (now + ttl, count)
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > _COUNT_CACHE_MAX_ENTRIES:
+            _count_cache.popitem(last=False)
+    return count
+
+
+def paginate_query(query, sort_column, id_column, descending=True, default_per_page=20, scope=None):
+    """Paginate query by offset (default) or by keyset when ?cursor= is present
+
+    Results are ordered by (sort_column, id_column) in both modes so the two
+    are consistent. `scope` distinguishes cached totals between callers that
+    share a path, e.g. the current user's id. Raises ValueError for a bad cursor.
+    """
+    per_page = request.args.get('per_page', default_per_page, type=int)
+    per_page = max(1, min(per_page, current_app.config.get('MAX_ITEMS_PER_PAGE', 100)))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    if not cursor_requested():
+        page = request.args.get('page', 1, type=int)
+        return query.paginate(page=page, per_page=per_page, error_out=False)
+
+    total = None
+    if request.args.get('include_total', 'false').lower() == 'true':
+        total = approximate_count(query, scope)
+
+    cursor = request.args.get('cursor', '').strip()
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor)
+        key = tuple_(sort_column, id_column)
+        if descending:
+            query = query.filter(key < tuple_(sort_value, last_id))
+        else:
+            query = query.filter(key > tuple_(sort_value, last_id))
+
+    # Fetch one extra row to learn whether there is another page
+    rows = query.limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+    return KeysetPage(items, per_page, next_cursor, total)
+
+
+def cursor_fields(result):
+    """Extra response fields for cursor mode (empty for offset pagination)"""
+    if isinstance(result, KeysetPage):
+        return {'next_cursor': result.next_cursor, 'has_more': result.has_more}
+    return {}
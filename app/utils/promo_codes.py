@@ -0,0 +1,112 @@
+"""
+Promo code lookups for validation and booking
+
+Codes are stored normalized (trimmed, upper-case; see PromoCode), so a
+lookup is an exact match on the unique index. Found codes are cached by
+code for PROMO_CACHE_SECONDS, in Redis when CACHE_BACKEND allows it, and
+dropped from the cache when a partner creates, edits or deletes them; with
+the in-process backend other workers see an edit when their entry expires.
+
+The cached current_uses is only advisory: the limits are enforced when a
+booking claims the code (claim_promo_code / claim_user_promo_code in
+app/utils/inventory.py), with conditional UPDATEs that cannot oversubscribe.
+"""
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select
+from app import db
+from app.models.ticket import PromoCode, PromoCodeRedemption, normalize_promo_code
+from app.utils.cache import LRUCacheBackend, RedisCacheBackend, metrics
+from app.utils.redis_client import get_redis
+
+
+def _promo_cache():
+    cache = current_app.extensions.get('promo_code_cache')
+    if cache is None:
+        choice = current_app.config.get('CACHE_BACKEND', 'auto')
+        client = get_redis(current_app) if choice in ('auto', 'redis') else None
+        if client is not None:
+            cache = RedisCacheBackend(client, prefix='nikofree:promo_code:')
+        else:
+            cache = LRUCacheBackend(current_app.config.get('CACHE_MAX_ENTRIES', 1024))
+        cache = current_app.extensions.setdefault('promo_code_cache', cache)
+    return cache
+
+
+def get_promo_code(code):
+    """A promo code as a dict (PromoCode.to_dict() plus max_uses_per_user), or None"""
+    code = normalize_promo_code(code)
+    if not code:
+        return None
+    cache = _promo_cache()
+    try:
+        promo = cache.get(code)
+    except Exception as e:
+        current_app.logger.warning(f'Promo code cache read failed: {str(e)}')
+        promo = None
+    metrics.record('promo_code', promo is not None)
+    if promo is not None:
+        return promo
+
+    row = PromoCode.query.filter_by(code=code).first()
+    if row is None:
+        return None  # Not cached, so a code created a moment later is found at once
+    promo = dict(row.to_dict(), max_uses_per_user=row.max_uses_per_user)
+    try:
+        cache.set(code, promo, current_app.config.get('PROMO_CACHE_SECONDS', 30))
+    except Exception as e:
+        current_app.logger.warning(f'Promo code cache write failed: {str(e)}')
+    return promo
+
+
+def invalidate_promo_codes(*codes):
+    """Drop codes from the cache after they are created, edited or deleted"""
+    cache = _promo_cache()
+    for code in codes:
+        if not code:
+            continue
+        try:
+            cache.delete(normalize_promo_code(code))
+        except Exception as e:
+            current_app.logger.warning(f'Promo code cache invalidation failed: {str(e)}')
+
+
+def promo_code_error(promo, event_id, now=None, check_usage=True):
+    """(error message, HTTP status) if a promo code from get_promo_code cannot
+    be used for event_id right now, else None
+
+    check_usage=False skips the max_uses check, for callers that claim the
+    code atomically anyway.
+    """
+    if promo is None or not promo['is_active']:
+        return 'Invalid promo code', 404
+    if promo['event_id'] != event_id:
+        return 'Promo code exists but is not valid for this event', 404
+    now = now or datetime.utcnow()
+    if promo['valid_from'] and now < datetime.fromisoformat(promo['valid_from']):
+        return 'Promo code not yet valid', 400
+    if promo['valid_until'] and now > datetime.fromisoformat(promo['valid_until']):
+        return 'Promo code expired', 400
+    if check_usage and promo['max_uses'] is not None and (promo['current_uses'] or 0) >= promo['max_uses']:
+        return 'Promo code usage limit reached', 400
+    return None
+
+
+def user_promo_code_uses(promo_code_id, user_id):
+    """How many times a user has used a promo code"""
+    uses = db.session.execute(
+        select(PromoCodeRedemption.uses).where(
+            PromoCodeRedemption.promo_code_id == promo_code_id,
+            PromoCodeRedemption.user_id == user_id
+        )
+    ).scalar()
+    return uses or 0
+
+
+def apply_discount(promo, total_amount):
+    """Discount a promo code gives on total_amount, never more than the total"""
+    if promo['discount_type'] == 'percentage':
+        discount_amount = total_amount * (promo['discount_value'] / 100)
+    else:  # fixed
+        discount_amount = promo['discount_value']
+    return min(discount_amount, total_amount)
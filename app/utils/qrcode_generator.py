@@ -1,20 +1,99 @@
-import qrcode
-import os
+"""
+Ticket QR codes, rendered on demand
+
+QR images are not stored. GET /api/tickets/<ticket_number>/qr.png (or
+.svg) renders them in memory; the output for a given ticket never changes,
+so each worker keeps recently served images in a byte-bounded LRU
+(QR_CACHE_MAX_BYTES) and responses carry a strong ETag and an immutable
+Cache-Control header. Ticket.qr_code holds the image's URL path.
+
+Codes carry a signed payload rather than the bare ticket number:
+
+    NF1:<key id>:<ticket id>:<event id>:<ticket type id>:<signature>
+
+with ids in base 36 and an HMAC-SHA256 signature truncated to 80 bits in
+base 32, all within the QR alphanumeric charset to keep codes small. The
+scanner checks the signature and the event with no database read
+(verify_qr_code) and only touches the database to check a valid ticket in.
+
+Keys come from QR_SIGNING_KEYS ("K2:secret,K1:older-secret"); the first
+signs, all of them verify. To rotate, put a new key first and drop the old
+one once events with codes signed by it are over. With no keys configured a
+key derived from SECRET_KEY is used.
+"""
+import base64
+import hashlib
+import hmac
 from io import BytesIO
-from PIL import Image
+import qrcode
+import qrcode.image.svg
 from flask import current_app
+from app.utils.cache import ByteLRUCache
+
+
+# Bump when the rendering changes, so clients and caches fetch new images
+QR_RENDER_VERSION = 2
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml'
+}
+QR_PAYLOAD_PREFIX = 'NF1'
+SIGNATURE_BYTES = 10
+BASE36_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def _base36(number):
+    digits = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        digits = BASE36_DIGITS[remainder] + digits
+        if not number:
+            return digits
+
+
+def _signing_keys():
+    """(active key id, {key id: secret}) parsed once per app"""
+    keys = current_app.extensions.get('qr_signing_keys')
+    if keys is None:
+        secrets = {}
+        for entry in (current_app.config.get('QR_SIGNING_KEYS') or '').split(','):
+            key_id, _, secret = entry.strip().partition(':')
+            if key_id and secret:
+                secrets[key_id.upper()] = secret.encode()
+        if not secrets:
+            secrets['K0'] = hmac.new(current_app.config['SECRET_KEY'].encode(), b'ticket-qr', hashlib.sha256).digest()
+        keys = current_app.extensions.setdefault('qr_signing_keys', (next(iter(secrets)), secrets))
+    return keys
 
 
-def generate_qr_code(data, ticket_number):
+def _signature(secret, message):
+    digest = hmac.new(secret, message.encode(), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return base64.b32encode(digest).decode()
+
+
+def signing_key_ids():
+    """Ids of every key codes are accepted from, the active one first"""
+    return list(_signing_keys()[1])
+
+
+def sign_ticket(ticket_id, event_id, ticket_type_id, key_id=None):
+    """Signed QR payload for a ticket, with the active key unless key_id is given"""
+    active_key_id, secrets = _signing_keys()
+    key_id = key_id or active_key_id
+    message = f'{QR_PAYLOAD_PREFIX}:{key_id}:{_base36(ticket_id)}:{_base36(event_id)}:{_base36(ticket_type_id)}'
+    return f'{message}:{_signature(secrets[key_id], message)}'
+
+
+def render_qr_code(data, fmt='png'):
     """
-    Generate QR code for ticket
-    
+    Render a QR code to bytes
+
     Args:
         data: String data to encode in QR code
-        ticket_number: Ticket number for filename
-        
+        fmt: 'png' or 'svg'
+
     Returns:
-        str: Path to saved QR code image
+        bytes: The image; identical input always gives identical bytes
     """
     # Create QR code instance
     qr = qrcode.QRCode(
@@ -22,43 +101,117 @@ def generate_qr_code(data, ticket_number):
         error_correction=qrcode.constants.ERROR_CORRECT_L,
         box_size=10,
         border=4,
+        image_factory=qrcode.image.svg.SvgPathImage if fmt == 'svg' else None
     )
-    
+
     # Add data
     qr.add_data(data)
     qr.make(fit=True)
-    
+
     # Create image
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save to uploads folder
-    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-    qr_folder = os.path.join(upload_folder, 'qrcodes')
-    
-    # Create directory if it doesn't exist
-    os.makedirs(qr_folder, exist_ok=True)
-    
-    # Save image
-    filename = f"{ticket_number}.png"
-    filepath = os.path.join(qr_folder, filename)
-    img.save(filepath)
-    
-    # Return relative path
-    return f"/uploads/qrcodes/{filename}"
+    if fmt == 'svg':
+        img = qr.make_image()
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+
+    buffer = BytesIO()
+    if fmt == 'svg':
+        img.save(buffer)
+    else:
+        img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _cache():
+    cache = current_app.extensions.get('qr_code_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            'qr_code_cache', ByteLRUCache(current_app.config.get('QR_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+        )
+    return cache
+
+
+def cached_qr_code(ticket_number, fmt='png'):
+    """A ticket's rendered QR code if this worker has it cached, else None"""
+    return _cache().get((ticket_number, fmt, _signing_keys()[0]))
+
+
+def get_qr_code(ticket_number, data, fmt='png'):
+    """A ticket's QR code image bytes for its signed payload, rendered and cached on first use"""
+    key = (ticket_number, fmt, _signing_keys()[0])
+    image = _cache().get(key)
+    if image is None:
+        image = render_qr_code(data, fmt)
+        _cache().set(key, image)
+    return image
+
 
+def qr_code_etag(ticket_number, fmt='png'):
+    """Strong ETag for a ticket's QR image, known without rendering it
 
-def verify_qr_code(qr_data, expected_ticket_number):
+    A ticket's payload only changes when the signing key does, so the ETag
+    covers the ticket number and the active key id.
     """
-    Verify QR code data
+    key_id = _signing_keys()[0]
+    digest = hashlib.sha256(f'{QR_RENDER_VERSION}:{fmt}:{key_id}:{ticket_number}'.encode()).hexdigest()
+    return f'qr{QR_RENDER_VERSION}-{digest[:32]}'
+
+
+def qr_code_url(ticket_number, fmt='png'):
+    """URL path of a ticket's QR image, as stored in Ticket.qr_code"""
+    return f"/api/tickets/{ticket_number}/qr.{fmt}"
+
+
+def absolute_qr_code_url(ticket, fmt='png'):
+    """Full URL of a ticket's QR image, for emails and API responses
+
+    Always the on-demand URL, so tickets still holding a path to a PNG file
+    from before images were rendered on demand get a working link.
+    """
+    base_url = current_app.config.get('BASE_URL', 'https://niko-free.com')
+    return f"{base_url}{qr_code_url(ticket.ticket_number, fmt)}"
+
+
+def verify_qr_code(qr_data):
+    """
+    Verify a scanned QR payload without touching the database
     
     Args:
         qr_data: Scanned QR code data
-        expected_ticket_number: Expected ticket number
         
     Returns:
-        bool: True if valid, False otherwise
+        dict: {'ticket_id', 'event_id', 'ticket_type_id', 'key_id'} if the
+        signature is valid, None for forged, malformed or retired-key codes
     """
-    # Simple verification - check if ticket number matches
-    # In production, you might want to add encryption/signing
-    return qr_data == expected_ticket_number
+    if not isinstance(qr_data, str):
+        return None
+    payload = qr_data.strip().upper()
+    parts = payload.split(':')
+    if len(parts) != 6 or parts[0] != QR_PAYLOAD_PREFIX:
+        return None
+    _, key_id, ticket_id, event_id, ticket_type_id, signature = parts
+    secret = _signing_keys()[1].get(key_id)
+    if secret is None:
+        return None  # Unknown or retired key
+    if not hmac.compare_digest(signature, _signature(secret, payload.rpartition(':')[0])):
+        return None
+    try:
+        return {
+            'ticket_id': int(ticket_id, 36),
+            'event_id': int(event_id, 36),
+            'ticket_type_id': int(ticket_type_id, 36),
+            'key_id': key_id
+        }
+    except ValueError:
+        return None
+
+
+def qr_payload_hash(qr_data):
+    """Short hash of scanned QR text, as listed in offline check-in manifests"""
+    digest = hashlib.sha256(qr_data.encode()).digest()[:9]
+    return base64.urlsafe_b64encode(digest).decode()
+
 
+def is_signed_qr_code(qr_data):
+    """Whether scanned data looks like a signed payload (older tickets encode the bare ticket number)"""
+    return isinstance(qr_data, str) and qr_data.strip().upper().startswith(f'{QR_PAYLOAD_PREFIX}:')
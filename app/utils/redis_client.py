@@ -0,0 +1,27 @@
+"""
+Shared Redis connection helper
+
+Redis is optional: features that can share state across gunicorn workers
+through Redis call get_redis() and fall back to in-process state when it
+returns None.
+"""
+
+
+def connect_redis(url, timeout=0.5):
+    """Return a Redis client if the server answers a ping, otherwise None"""
+    if not url:
+        return None
+    try:
+        import redis
+        client = redis.Redis.from_url(url, socket_connect_timeout=timeout, socket_timeout=timeout)
+        client.ping()
+        return client
+    except Exception:
+        return None
+
+
+def get_redis(app):
+    """The app's shared Redis client, connecting once per process (None if unreachable)"""
+    if 'redis_client' not in app.extensions:
+        app.extensions['redis_client'] = connect_redis(app.config.get('REDIS_URL'))
+    return app.extensions['redis_client']
@@ -0,0 +1,321 @@
+"""
+Background expiry of ticket holds
+
+Unpaid bookings hold tickets in the ticket_reservations ledger
+(app/utils/inventory.py) until their expires_at. A sweeper thread in each
+worker gives expired holds back to stock without waiting for a request:
+
+- One worker at a time is the leader, holding a lease row in
+  scheduler_locks that it renews every RESERVATION_SWEEP_SECONDS. When a
+  leader dies its lease runs out after three intervals and another worker
+  takes over.
+- The leader keeps a min-heap of upcoming expiries and wakes up when the
+  earliest one is due, so holds are released within about a second of
+  expiring. Holds created in the leader's own process are pushed onto the
+  heap on commit; holds created by other workers are loaded from the
+  ledger's expires_at index on every renewal, looking two intervals
+  ahead.
+- Every renewal also runs a bulk sweep of anything already expired, as a
+  safety net for holds the heap never saw, and purges expired
+  Idempotency-Key records (app/utils/idempotency.py). Every
+  CATEGORY_COUNT_RECONCILE_SECONDS it also reconciles the stored category
+  event counts (app/utils/category_counts.py).
+
+Hold lifecycle counts (created, converted to a sale, released by
+cancellation, expired) are kept per worker, counted on commit, and shown at
+/api/diagnostics/reservations. Set RESERVATION_SWEEP_SECONDS to 0 to turn
+the thread off and run `flask sweep-reservations` from cron instead.
+"""
+import atexit
+import heapq
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, update, delete, func, select, or_, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import db
+from app.models.scheduler import SchedulerLock
+from app.models.ticket import TicketReservation
+from app.utils.category_counts import reconcile_category_counts
+from app.utils.idempotency import purge_expired_keys
+
+
+LOCK_NAME = 'reservation-sweeper'
+SWEEP_BATCH_SIZE = 500
+HOLD_EVENTS = ('created', 'converted', 'released', 'expired')
+
+
+class ReservationMetrics:
+    """Hold lifecycle counters and sweeper status (per worker)"""
+
+    def __init__(self):
+        self._counts = dict.fromkeys(HOLD_EVENTS, 0)
+        self._sweeps = 0
+        self._last_sweep_at = None
+        self._lock = threading.Lock()
+
+    def record(self, kind, count=1):
+        with self._lock:
+            self._counts[kind] += count
+
+    def record_sweep(self):
+        with self._lock:
+            self._sweeps += 1
+            self._last_sweep_at = datetime.utcnow()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'holds': dict(self._counts),
+                'sweeps': self._sweeps,
+                'last_sweep_at': self._last_sweep_at.isoformat() if self._last_sweep_at else None
+            }
+
+
+metrics = ReservationMetrics()
+
+
+def record_hold_event(kind, count=1, booking_id=None, expires_at=None):
+    """Count a hold change once the current transaction commits
+
+    Called by app/utils/inventory.py. New holds (kind='created') are also
+    scheduled for expiry if this worker is the sweeper leader.
+    """
+    db.session.info.setdefault('reservation_events', []).append((kind, count, booking_id, expires_at))
+
+
+def _after_commit(session):
+    for kind, count, booking_id, expires_at in session.info.pop('reservation_events', ()):
+        metrics.record(kind, count)
+        if kind == 'created' and expires_at is not None:
+            _scheduler.push(expires_at, booking_id)
+
+
+def _after_rollback(session):
+    session.info.pop('reservation_events', None)
+
+
+class ExpiryScheduler:
+    """Min-heap of (expires_at, booking_id) with a condition to wake the sweeper"""
+
+    def __init__(self):
+        self._heap = []
+        self._scheduled = set()
+        self._condition = threading.Condition()
+        self.enabled = False  # Only the leader schedules expiries
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, expires_at, booking_id):
+        with self._condition:
+            if not self.enabled or booking_id in self._scheduled:
+                return
+            self._scheduled.add(booking_id)
+            heapq.heappush(self._heap, (expires_at, booking_id))
+            if self._heap[0][1] == booking_id:
+                self._condition.notify()  # New earliest expiry
+
+    def pop_due(self, now):
+        """Remove and return the booking ids of holds expired by now"""
+        due = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                _, booking_id = heapq.heappop(self._heap)
+                self._scheduled.discard(booking_id)
+                due.append(booking_id)
+        return due
+
+    def wait(self, timeout):
+        """Sleep up to timeout seconds, waking early when the earliest expiry is due or replaced"""
+        with self._condition:
+            if self._heap:
+                timeout = min(timeout, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+            if timeout > 0:
+                self._condition.wait(timeout)
+
+    def clear(self):
+        with self._condition:
+            self._heap.clear()
+            self._scheduled.clear()
+
+
+_scheduler = ExpiryScheduler()
+
+
+def sweep_expired(now=None, batch_size=SWEEP_BATCH_SIZE):
+    """Release every hold expired by now, in batches; returns the number released"""
+    from app.utils.inventory import release_expired_reservations
+
+    released = 0
+    while True:
+        count = release_expired_reservations(now=now or datetime.utcnow(), limit=batch_size)
+        db.session.commit()
+        released += count
+        if count < batch_size:
+            break
+    metrics.record_sweep()
+    return released
+
+
+def _schedule_upcoming(horizon):
+    """Load holds expiring before horizon into the heap"""
+    for booking_id, expires_at in db.session.execute(
+        select(TicketReservation.booking_id, TicketReservation.expires_at)
+        .where(TicketReservation.expires_at <= horizon)
+        .distinct()
+    ):
+        _scheduler.push(expires_at, booking_id)
+
+
+def acquire_lock(name, owner, ttl_seconds):
+    """Take or renew the named lease; True if owner holds it afterwards"""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    renewed = db.session.execute(
+        update(SchedulerLock)
+        .where(SchedulerLock.name == name, or_(SchedulerLock.owner == owner, SchedulerLock.expires_at < now))
+        .values(
+            owner=owner,
+            expires_at=expires_at,
+            acquired_at=case((SchedulerLock.owner == owner, SchedulerLock.acquired_at), else_=now)
+        )
+    ).rowcount
+    if renewed:
+        db.session.commit()
+        return True
+    try:
+        db.session.add(SchedulerLock(name=name, owner=owner, expires_at=expires_at, acquired_at=now))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()  # Another worker holds it
+        return False
+
+
+def release_lock(name, owner):
+    db.session.execute(delete(SchedulerLock).where(SchedulerLock.name == name, SchedulerLock.owner == owner))
+    db.session.commit()
+
+
+# Sweeper thread per process: {'pid', 'thread', 'owner', 'leader', 'reconcile_at'}
+_sweeper = {}
+_sweeper_lock = threading.Lock()
+
+
+def _run_once(app, interval):
+    """Renew leadership and, while leader, sweep and refill the heap"""
+    leader = acquire_lock(LOCK_NAME, _sweeper['owner'], interval * 3)
+    if leader != _sweeper.get('leader'):
+        app.logger.info(f"Reservation sweeper {'leading' if leader else 'standing by'} ({_sweeper['owner']})")
+    _sweeper['leader'] = leader
+    _scheduler.enabled = leader
+    if not leader:
+        _scheduler.clear()
+        return
+    released = sweep_expired()
+    if released:
+        app.logger.info(f'Released {released} expired ticket holds')
+    purge_expired_keys()  # Idempotency keys share the leader's housekeeping
+    _reconcile_if_due(app)
+    _schedule_upcoming(datetime.utcnow() + timedelta(seconds=interval * 2))
+    db.session.commit()  # End the read transaction before sleeping
+
+
+def _reconcile_if_due(app):
+    """Correct category counts that drifted as events passed their start date"""
+    interval = app.config.get('CATEGORY_COUNT_RECONCILE_SECONDS', 300)
+    if interval <= 0 or time.monotonic() < _sweeper.get('reconcile_at', 0):
+        return
+    _sweeper['reconcile_at'] = time.monotonic() + interval
+    reconcile_category_counts()
+
+
+def _sweep_loop(app, interval):
+    next_renewal = 0
+    while True:
+        try:
+            with app.app_context():
+                if time.monotonic() >= next_renewal:
+                    next_renewal = time.monotonic() + interval
+                    _run_once(app, interval)
+                elif _sweeper.get('leader') and _scheduler.pop_due(datetime.utcnow()):
+                    released = sweep_expired()
+                    if released:
+                        app.logger.info(f'Released {released} expired ticket holds')
+        except Exception as e:
+            with app.app_context():
+                db.session.rollback()
+            app.logger.error(f'Reservation sweeper failed, will retry: {str(e)}')
+        _scheduler.wait(max(next_renewal - time.monotonic(), 0))
+
+
+def _release_at_exit(app):
+    try:
+        if _sweeper.get('leader'):
+            with app.app_context():
+                release_lock(LOCK_NAME, _sweeper['owner'])
+    except Exception:
+        pass
+
+
+def _ensure_sweeper(app):
+    """Start the sweeper thread on first use in each process (gunicorn forks after import)"""
+    interval = app.config.get('RESERVATION_SWEEP_SECONDS', 30)
+    if interval <= 0 or (_sweeper.get('pid') == os.getpid() and _sweeper['thread'].is_alive()):
+        return
+    with _sweeper_lock:
+        if _sweeper.get('pid') == os.getpid() and _sweeper['thread'].is_alive():
+            return
+        if _sweeper.get('pid') != os.getpid():
+            _sweeper.clear()
+            _scheduler.clear()
+            _sweeper['owner'] = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+            atexit.register(_release_at_exit, app)
+        thread = threading.Thread(target=_sweep_loop, args=(app, interval), name='reservation-sweeper', daemon=True)
+        thread.start()
+        _sweeper.update(pid=os.getpid(), thread=thread)
+
+
+def init_reservation_sweeper(app):
+    """Count hold changes on commit and start the sweeper with the first request"""
+    if not event.contains(Session, 'after_commit', _after_commit):
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+
+    @app.before_request
+    def start_reservation_sweeper():
+        _ensure_sweeper(app)
+
+
+def sweeper_status():
+    """Metrics plus the ledger's current state, for diagnostics"""
+    now = datetime.utcnow()
+    active, tickets, next_expiry = db.session.query(
+        func.count(func.distinct(TicketReservation.booking_id)),
+        func.coalesce(func.sum(TicketReservation.quantity), 0),
+        func.min(TicketReservation.expires_at)
+    ).one()
+    overdue = db.session.query(func.count(func.distinct(TicketReservation.booking_id))).filter(TicketReservation.expires_at <= now).scalar()
+    lock = db.session.get(SchedulerLock, LOCK_NAME)
+    return dict(
+        metrics.snapshot(),
+        worker={
+            'owner': _sweeper.get('owner'),
+            'leader': bool(_sweeper.get('leader')),
+            'scheduled': len(_scheduler),
+            'interval_seconds': current_app.config.get('RESERVATION_SWEEP_SECONDS', 30)
+        },
+        ledger={
+            'active_holds': active,
+            'held_tickets': int(tickets),
+            'overdue_holds': overdue,
+            'next_expiry': next_expiry.isoformat() if next_expiry else None
+        },
+        lock=lock.to_dict() if lock else None
+    )
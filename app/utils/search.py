@@ -0,0 +1,210 @@
+"""
+Full-text search for event discovery
+
+PostgreSQL: a generated `events.search_vector` tsvector column (title weighted
+A, description weighted B) with a GIN index, ranked with ts_rank, plus a
+pg_trgm GIN index on `events.title` for typo-tolerant matching.
+
+SQLite: FTS5 shadow tables kept in sync with `events` by triggers -
+`events_fts` (porter stemming, ranked with bm25) and `events_trigram`
+(trigram tokenizer, used for typo-tolerant matching).
+
+Neither backend is mapped on the Event model, so db.create_all() keeps working
+on both databases. Run `flask rebuild-search-index` after creating tables.
+"""
+import re
+from flask import current_app
+from sqlalchemy import text, func, literal_column, column, or_, false, bindparam
+from app import db
+from app.models.event import Event
+
+
+# Search availability per database URL, so the catalog is checked once per worker
+_backend_cache = {}
+
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+        title, description, content='events', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS events_trigram USING fts5(
+        title, content='events', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS events_search_ai AFTER INSERT ON events BEGIN
+        INSERT INTO events_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        INSERT INTO events_trigram(rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS events_search_ad AFTER DELETE ON events BEGIN
+        INSERT INTO events_fts(events_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO events_trigram(events_trigram, rowid, title) VALUES ('delete', old.id, old.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS events_search_au AFTER UPDATE OF title, description ON events BEGIN
+        INSERT INTO events_fts(events_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO events_trigram(events_trigram, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO events_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        INSERT INTO events_trigram(rowid, title) VALUES (new.id, new.title);
+    END
+    """
+]
+
+POSTGRESQL_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE events ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_events_search_vector ON events USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_events_title_trgm ON events USING GIN (title gin_trgm_ops)"
+]
+
+
+def tokenize(search):
+    """Split a raw search string into safe lowercase word tokens"""
+    return re.findall(r'\w+', (search or '').lower())
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def create_search_schema(connection=None):
+    """Create the search column/tables, indexes and triggers for the current database"""
+    conn = connection or db.session
+    dialect = connection.dialect.name if connection is not None else _dialect()
+    statements = POSTGRESQL_SCHEMA if dialect == 'postgresql' else SQLITE_SCHEMA
+    for statement in statements:
+        conn.execute(text(statement))
+    _backend_cache.clear()
+
+
+def rebuild_search_index():
+    """Create the search schema if missing and rebuild it from the events table"""
+    create_search_schema()
+    if _dialect() == 'postgresql':
+        # The generated column is always current; rebuild the indexes themselves
+        db.session.execute(text('REINDEX INDEX ix_events_search_vector'))
+        db.session.execute(text('REINDEX INDEX ix_events_title_trgm'))
+    else:
+        db.session.execute(text("INSERT INTO events_fts(events_fts) VALUES ('rebuild')"))
+        db.session.execute(text("INSERT INTO events_trigram(events_trigram) VALUES ('rebuild')"))
+    db.session.commit()
+    return Event.query.count()
+
+
+def search_available():
+    """Whether the full-text search schema exists in the current database"""
+    key = str(db.engine.url)
+    if key not in _backend_cache:
+        if _dialect() == 'postgresql':
+            sql = ("SELECT 1 FROM information_schema.columns "
+                   "WHERE table_name = 'events' AND column_name = 'search_vector'")
+        else:
+            sql = "SELECT 1 FROM sqlite_master WHERE name = 'events_fts'"
+        try:
+            _backend_cache[key] = db.session.execute(text(sql)).first() is not None
+        except Exception as e:
+            current_app.logger.warning(f'Could not check search index: {str(e)}')
+            _backend_cache[key] = False
+    return _backend_cache[key]
+
+
+def _fts5_query(tokens, prefix, column=None):
+    """Build an FTS5 MATCH expression - all terms required, last term as prefix"""
+    terms = [f'"{token}"' for token in tokens]
+    if prefix:
+        terms[-1] += '*'
+    expression = ' '.join(terms)
+    return f'{column} : ({expression})' if column else expression
+
+
+def _tsquery(tokens, prefix, title_only=False):
+    """Build a to_tsquery expression - all terms required, last term as prefix"""
+    weight = 'A' if title_only else ''
+    terms = [f'{token}:{weight}' if weight else token for token in tokens]
+    if prefix:
+        terms[-1] = f'{tokens[-1]}:*{weight}'
+    return ' & '.join(terms)
+
+
+def _trigrams(tokens):
+    """Distinct 3-character substrings of the search terms"""
+    grams = []
+    for token in tokens:
+        for i in range(max(len(token) - 2, 0)):
+            gram = token[i:i + 3]
+            if gram not in grams:
+                grams.append(gram)
+    return grams
+
+
+def _ilike_filter(query, search, title_only):
+    """Fallback when the search schema has not been created, or the search has no words"""
+    if title_only:
+        return query.filter(Event.title.ilike(f'%{search}%'))
+    return query.filter(or_(
+        Event.title.ilike(f'%{search}%'),
+        Event.description.ilike(f'%{search}%')
+    ))
+
+
+def apply_search(query, search, prefix=True, title_only=False, fuzzy=False):
+    """Restrict an Event query to search matches and order it by relevance
+
+    Existing filters on `query` are preserved. With fuzzy=True the match is
+    trigram-based, which tolerates typos but not stemming. Callers should add
+    their own secondary order_by after this.
+    """
+    tokens = tokenize(search)
+    if not tokens:
+        # Punctuation-only searches (e.g. "#") have no words to match; keep filtering on the string
+        return _ilike_filter(query, search.strip(), title_only) if search and search.strip() else query
+    if not search_available():
+        return _ilike_filter(query, search.strip(), title_only)
+
+    if _dialect() == 'postgresql':
+        if fuzzy:
+            raw = ' '.join(tokens)
+            # `%` uses the trigram index with pg_trgm.similarity_threshold (0.3 by default)
+            return query.filter(Event.title.op('%')(raw)).order_by(
+                func.similarity(Event.title, raw).desc()
+            )
+        ts_query = func.to_tsquery('english', _tsquery(tokens, prefix, title_only))
+        search_vector = literal_column('events.search_vector')
+        return query.filter(search_vector.op('@@')(ts_query)).order_by(
+            func.ts_rank(search_vector, ts_query).desc()
+        )
+
+    if fuzzy:
+        grams = _trigrams(tokens)
+        if not grams:
+            return query.filter(false())
+        match = ' OR '.join(f'"{gram}"' for gram in grams)
+        matches = text(
+            'SELECT rowid AS event_id, bm25(events_trigram) AS score '
+            'FROM events_trigram WHERE events_trigram MATCH :match'
+        ).bindparams(bindparam('match', match)).columns(
+            column('event_id'), column('score')
+        ).subquery('search_matches')
+    else:
+        match = _fts5_query(tokens, prefix, 'title' if title_only else None)
+        # bm25 weights: title matches count ten times as much as description matches
+        matches = text(
+            'SELECT rowid AS event_id, bm25(events_fts, 10.0, 1.0) AS score '
+            'FROM events_fts WHERE events_fts MATCH :match'
+        ).bindparams(bindparam('match', match)).columns(
+            column('event_id'), column('score')
+        ).subquery('search_matches')
+
+    # bm25 scores are negative; lower is more relevant
+    return query.join(matches, matches.c.event_id == Event.id).order_by(matches.c.score.asc())
@@ -1,10 +1,10 @@
 """
 SMS Utility using Celcom Africa API
 """
-import requests
 from flask import current_app
 from threading import Thread
 import urllib3
+from app.utils.http_client import get_upstream
 
 # Disable SSL warnings (since we're using verify=False to match PHP example)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -44,11 +44,11 @@ def send_sms_async(app, phone_number, message):
             headers = {
                 'Content-Type': 'application/json'
             }
-            response = requests.post(
+            # Shared pooled client; not retried, since a repeated POST could send the SMS twice
+            response = get_upstream('sms').post(
                 CELCOM_SMS_URL, 
                 json=payload, 
                 headers=headers,
-                timeout=30,
                 verify=False  # SSL verification disabled (matching PHP example)
             )
             
@@ -0,0 +1,41 @@
+"""
+Ticket issuance
+
+issue_tickets() creates all of a booking's tickets with one bulk INSERT, so
+confirming a booking costs the same whatever its quantity. No QR image is
+written: each ticket's qr_code is the URL that renders it on demand
+(app/utils/qrcode_generator.py).
+"""
+from datetime import datetime
+from sqlalchemy import insert
+from app import db
+from app.models.ticket import Ticket
+from app.utils.qrcode_generator import qr_code_url
+
+
+def issue_tickets(booking, ticket_type_id=None):
+    """Create a booking's tickets in one INSERT and return them
+
+    One ticket per unit of each of booking.lines(), or booking.quantity
+    tickets of ticket_type_id if given.
+    """
+    if ticket_type_id:
+        lines = [(ticket_type_id, booking.quantity)]
+    else:
+        lines = booking.lines()
+    now = datetime.utcnow()
+    rows = []
+    for line_ticket_type_id, quantity in lines:
+        for _ in range(quantity or 1):
+            ticket_number = Ticket.generate_ticket_number()
+            rows.append({
+                'ticket_number': ticket_number,
+                'qr_code': qr_code_url(ticket_number),
+                'booking_id': booking.id,
+                'ticket_type_id': line_ticket_type_id,
+                'is_valid': True,
+                'is_scanned': False,
+                'created_at': now,
+                'updated_at': now
+            })
+    return db.session.scalars(insert(Ticket).returning(Ticket), rows).all()
@@ -1,6 +1,38 @@
 """
 Ticket PDF Generator
+
+Rendering is split in two so it can run outside the request thread:
+ticket_pdf_document() snapshots what a booking's PDF shows into a plain
+dict, and render_ticket_pdf() lays that dict out with ReportLab without
+touching Flask or the database. The PDF for a snapshot never changes, so:
+
+- Finished PDFs are cached per booking, tagged with a hash of the snapshot
+  (the content version). A cancelled booking, an invalidated ticket or any
+  other change to what is printed gives a new version, and the stale PDF is
+  never served. The cache is Redis when PDF_CACHE_BACKEND is 'auto' and
+  REDIS_URL is reachable, else a byte-bounded LRU per worker
+  (PDF_CACHE_MAX_BYTES).
+- Cold renders run in a process pool (PDF_RENDER_PROCESSES per worker,
+  0 renders inline), so layout work doesn't hold up other requests.
+  Concurrent downloads of the same booking share one render. The pool
+  starts on the first render, from a fork server. A render that outlasts
+  PDF_RENDER_TIMEOUT is done inline; the pool child ends itself at that
+  limit, so a hung render never holds a process, and a broken pool is
+  replaced.
+- Confirmed bookings are pre-rendered in the pool right after commit
+  (prerender_ticket_pdf), so the first download is usually a cache hit.
+
+Hit/miss counts appear under 'ticket_pdf' at /api/diagnostics/cache.
 """
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as RenderTimeout
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
@@ -9,20 +41,112 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
 from io import BytesIO
-import os
 from flask import current_app
+from app.utils.cache import ByteLRUCache, metrics
+from app.utils.qrcode_generator import sign_ticket, render_qr_code, QR_RENDER_VERSION
+from app.utils.redis_client import get_redis
 
 
-def generate_ticket_pdf(booking, tickets):
+# Bump when the layout changes, so cached PDFs are rendered again
+PDF_LAYOUT_VERSION = 1
+REDIS_KEY_PREFIX = 'nikofree:ticket_pdf:'
+VERSION_LENGTH = 64  # Cached values are <sha256 hex version><pdf bytes>
+
+
+def ticket_pdf_document(booking, tickets):
     """
-    Generate PDF ticket with QR code
+    Snapshot everything a booking's PDF shows
     
     Args:
         booking: Booking object
         tickets: List of Ticket objects
         
     Returns:
-        BytesIO: PDF file as BytesIO object
+        dict: Plain, picklable data for render_ticket_pdf()
+    """
+    event = booking.event
+    
+    # Date and Time
+    time_str = event.start_date.strftime('%I:%M %p')
+    if event.end_date:
+        time_str = f"{time_str} - {event.end_date.strftime('%I:%M %p')}"
+    
+    return {
+        'layout': [PDF_LAYOUT_VERSION, QR_RENDER_VERSION],
+        'event_title': event.title,
+        'date': event.start_date.strftime('%A, %B %d, %Y'),
+        'time': time_str,
+        'venue': event.venue_name or event.venue_address or "Online Event",
+        'booking_number': booking.booking_number,
+        'quantity': booking.quantity,
+        'total_amount': float(booking.total_amount or 0),
+        'status': booking.status,
+        'tickets': [
+            {
+                'ticket_number': ticket.ticket_number,
+                'type_name': ticket.ticket_type.name if ticket.ticket_type else None,
+                'qr_data': sign_ticket(ticket.id, booking.event_id, ticket.ticket_type_id),
+                'is_valid': ticket.is_valid
+            }
+            for ticket in tickets
+        ]
+    }
+
+
+def document_version(document):
+    """Content version of a snapshot: equal snapshots always render identical PDFs"""
+    return hashlib.sha256(json.dumps(document, sort_keys=True).encode()).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def _styles():
+    """Paragraph styles, built once per process"""
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#1a1a1a'),
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold'
+        ),
+        'heading': ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=14,
+            textColor=colors.HexColor('#333333'),
+            spaceAfter=12,
+            fontName='Helvetica-Bold'
+        ),
+        'normal': ParagraphStyle(
+            'CustomNormal',
+            parent=styles['Normal'],
+            fontSize=11,
+            textColor=colors.HexColor('#666666'),
+            spaceAfter=10,
+            alignment=TA_LEFT
+        ),
+        'footer': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=colors.HexColor('#999999'),
+            alignment=TA_CENTER,
+            spaceBefore=20
+        )
+    }
+
+
+def render_ticket_pdf(document):
+    """
+    Lay out a ticket PDF from a ticket_pdf_document() snapshot
+    
+    Runs in the render pool, so it must not use Flask or the database.
+    
+    Returns:
+        bytes: The PDF
     """
     buffer = BytesIO()
     
@@ -40,191 +164,275 @@ def generate_ticket_pdf(booking, tickets):
     elements = []
     
     # Styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1a1a1a'),
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#333333'),
-        spaceAfter=12,
-        fontName='Helvetica-Bold'
-    )
-    
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=11,
-        textColor=colors.HexColor('#666666'),
-        spaceAfter=10,
-        alignment=TA_LEFT
-    )
+    styles = _styles()
+    heading_style = styles['heading']
+    normal_style = styles['normal']
+    footer_style = styles['footer']
     
     # Title
-    elements.append(Paragraph("NIKO FREE", title_style))
+    elements.append(Paragraph("NIKO FREE", styles['title']))
     elements.append(Paragraph("EVENT TICKET", heading_style))
     elements.append(Spacer(1, 0.3*inch))
     
     # Event Information
-    event = booking.event
-    elements.append(Paragraph(f"<b>Event:</b> {event.title}", normal_style))
-    
-    # Date and Time
-    date_str = event.start_date.strftime('%A, %B %d, %Y')
-    time_str = event.start_date.strftime('%I:%M %p')
-    if event.end_date:
-        end_time_str = event.end_date.strftime('%I:%M %p')
-        time_str = f"{time_str} - {end_time_str}"
-    
-    elements.append(Paragraph(f"<b>Date:</b> {date_str}", normal_style))
-    elements.append(Paragraph(f"<b>Time:</b> {time_str}", normal_style))
-    
-    # Venue
-    venue = event.venue_name or event.venue_address or "Online Event"
-    elements.append(Paragraph(f"<b>Venue:</b> {venue}", normal_style))
+    elements.append(Paragraph(f"<b>Event:</b> {document['event_title']}", normal_style))
+    elements.append(Paragraph(f"<b>Date:</b> {document['date']}", normal_style))
+    elements.append(Paragraph(f"<b>Time:</b> {document['time']}", normal_style))
+    elements.append(Paragraph(f"<b>Venue:</b> {document['venue']}", normal_style))
     
     elements.append(Spacer(1, 0.2*inch))
     
     # Booking Information
     elements.append(Paragraph("<b>Booking Details</b>", heading_style))
-    elements.append(Paragraph(f"<b>Booking Number:</b> {booking.booking_number}", normal_style))
-    elements.append(Paragraph(f"<b>Quantity:</b> {booking.quantity} ticket(s)", normal_style))
-    elements.append(Paragraph(f"<b>Total Amount:</b> KES {booking.total_amount:,.2f}", normal_style))
-    elements.append(Paragraph(f"<b>Status:</b> {booking.status.upper()}", normal_style))
+    elements.append(Paragraph(f"<b>Booking Number:</b> {document['booking_number']}", normal_style))
+    elements.append(Paragraph(f"<b>Quantity:</b> {document['quantity']} ticket(s)", normal_style))
+    elements.append(Paragraph(f"<b>Total Amount:</b> KES {document['total_amount']:,.2f}", normal_style))
+    elements.append(Paragraph(f"<b>Status:</b> {document['status'].upper()}", normal_style))
     
     elements.append(Spacer(1, 0.3*inch))
     
     # QR Code for each ticket
-    for idx, ticket in enumerate(tickets, 1):
+    for idx, ticket in enumerate(document['tickets'], 1):
         if idx > 1:
             elements.append(Spacer(1, 0.2*inch))
             elements.append(Paragraph("─" * 50, normal_style))
             elements.append(Spacer(1, 0.2*inch))
         
         elements.append(Paragraph(f"<b>Ticket {idx}</b>", heading_style))
-        elements.append(Paragraph(f"<b>Ticket Number:</b> {ticket.ticket_number}", normal_style))
+        elements.append(Paragraph(f"<b>Ticket Number:</b> {ticket['ticket_number']}", normal_style))
         
-        if ticket.ticket_type:
-            elements.append(Paragraph(f"<b>Type:</b> {ticket.ticket_type.name}", normal_style))
+        if ticket['type_name']:
+            elements.append(Paragraph(f"<b>Type:</b> {ticket['type_name']}", normal_style))
         
-        # QR Code Image
-        if ticket.qr_code:
-            qr_path = ticket.qr_code
-            
-            # Handle different path formats
-            # QR code path is typically: /uploads/qrcodes/TKT-YYYYMMDD-XXXXXXXXXX.png
-            if qr_path.startswith('/uploads/'):
-                # Remove leading slash to make it relative
-                qr_path = qr_path[1:]
-            elif qr_path.startswith('uploads/'):
-                # Already correct format
-                pass
-            elif not qr_path.startswith('http') and not os.path.isabs(qr_path):
-                # Assume it's relative to uploads folder
-                qr_path = f"uploads/{qr_path}"
-            
-            # Build absolute path
-            try:
-                # Get upload folder from Flask config
-                upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-            except RuntimeError:
-                # Not in Flask context, use default
-                upload_folder = 'uploads'
-            
-            # Get project root for alternative paths
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            
-            # Construct full path
-            if os.path.isabs(upload_folder):
-                # Absolute path
-                if qr_path.startswith('uploads/'):
-                    qr_path = os.path.join(upload_folder, qr_path.replace('uploads/', '', 1))
-                else:
-                    qr_path = os.path.join(upload_folder, qr_path)
-            else:
-                # Relative to project root
-                qr_path = os.path.join(project_root, qr_path)
-            
-            # Normalize path (resolve .. and .)
-            qr_path = os.path.normpath(qr_path)
-            
-            # Check if file exists
-            print(f"📄 [PDF] Looking for QR code at: {qr_path}")
-            if os.path.exists(qr_path):
-                try:
-                    qr_image = Image(qr_path, width=2*inch, height=2*inch)
-                    elements.append(Spacer(1, 0.1*inch))
-                    elements.append(qr_image)
-                    elements.append(Spacer(1, 0.1*inch))
-                    elements.append(Paragraph("Scan this QR code at the event entrance", normal_style))
-                    print(f"✅ [PDF] QR code image added successfully")
-                except Exception as e:
-                    print(f"❌ [PDF] Error loading QR code image: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    elements.append(Paragraph("QR Code: Available in app", normal_style))
-            else:
-                print(f"⚠️ [PDF] QR code file not found at: {qr_path}")
-                # Try alternative paths
-                qr_filename = os.path.basename(qr_path)
-                alt_paths = [
-                    os.path.join(project_root, 'uploads', 'qrcodes', qr_filename),
-                    os.path.join(upload_folder, 'qrcodes', qr_filename) if not os.path.isabs(upload_folder) else os.path.join(upload_folder, 'qrcodes', qr_filename),
-                ]
-                found = False
-                for alt_path in alt_paths:
-                    alt_path = os.path.normpath(alt_path)
-                    if os.path.exists(alt_path):
-                        try:
-                            qr_image = Image(alt_path, width=2*inch, height=2*inch)
-                            elements.append(Spacer(1, 0.1*inch))
-                            elements.append(qr_image)
-                            elements.append(Spacer(1, 0.1*inch))
-                            elements.append(Paragraph("Scan this QR code at the event entrance", normal_style))
-                            print(f"✅ [PDF] QR code found at alternative path: {alt_path}")
-                            found = True
-                            break
-                        except Exception as e:
-                            print(f"❌ [PDF] Error loading QR code from alt path {alt_path}: {e}")
-                            continue
-                
-                if not found:
-                    print(f"⚠️ [PDF] QR code not found in any path. Ticket: {ticket.ticket_number}, QR path: {ticket.qr_code}")
-                    elements.append(Paragraph("QR Code: Available in app", normal_style))
-        else:
-            print(f"⚠️ [PDF] No QR code path for ticket {ticket.ticket_number}")
+        if not ticket['is_valid']:
+            elements.append(Paragraph("<b>This ticket is no longer valid</b>", normal_style))
+            continue
+        
+        # QR Code Image, rendered in memory
+        try:
+            qr_image = Image(BytesIO(render_qr_code(ticket['qr_data'])), width=2*inch, height=2*inch)
+            elements.append(Spacer(1, 0.1*inch))
+            elements.append(qr_image)
+            elements.append(Spacer(1, 0.1*inch))
+            elements.append(Paragraph("Scan this QR code at the event entrance", normal_style))
+        except Exception as e:
+            print(f"❌ [PDF] Error rendering QR code for ticket {ticket['ticket_number']}: {e}")
             elements.append(Paragraph("QR Code: Available in app", normal_style))
     
     elements.append(Spacer(1, 0.3*inch))
     
     # Footer
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.HexColor('#999999'),
-        alignment=TA_CENTER,
-        spaceBefore=20
-    )
     elements.append(Paragraph("Thank you for using Niko Free!", footer_style))
     elements.append(Paragraph("Present this ticket or QR code at the event entrance", footer_style))
     elements.append(Paragraph("For support, contact: support@niko-free.com", footer_style))
     
     # Build PDF
     doc.build(elements)
+    return buffer.getvalue()
+
+
+class RedisPDFCache:
+    """Finished PDFs shared by all workers through Redis, expiring after ttl seconds"""
+
+    name = 'redis'
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.client.get(f'{REDIS_KEY_PREFIX}{key}')
+
+    def set(self, key, value):
+        self.client.setex(f'{REDIS_KEY_PREFIX}{key}', self.ttl, value)
+
+    def delete(self, key):
+        self.client.delete(f'{REDIS_KEY_PREFIX}{key}')
+
+
+def _pdf_cache():
+    cache = current_app.extensions.get('ticket_pdf_cache')
+    if cache is None:
+        choice = current_app.config.get('PDF_CACHE_BACKEND', 'auto')
+        client = get_redis(current_app) if choice in ('auto', 'redis') else None
+        if client is not None:
+            cache = RedisPDFCache(client, current_app.config.get('PDF_CACHE_SECONDS', 86400))
+        else:
+            if choice == 'redis':
+                current_app.logger.warning('PDF_CACHE_BACKEND=redis but Redis is unreachable; using in-process cache')
+            cache = ByteLRUCache(current_app.config.get('PDF_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        cache = current_app.extensions.setdefault('ticket_pdf_cache', cache)
+    return cache
+
+
+def _cached_pdf(cache, booking_id, version):
+    try:
+        value = cache.get(booking_id)
+    except Exception as e:
+        current_app.logger.warning(f'Ticket PDF cache read failed: {str(e)}')
+        return None
+    if value is not None and value[:VERSION_LENGTH] == version.encode():
+        return value[VERSION_LENGTH:]
+    return None
+
+
+def _store_pdf(cache, booking_id, version, pdf):
+    try:
+        cache.set(booking_id, version.encode() + pdf)
+    except Exception:
+        pass  # Rendered again on the next download
+
+
+def invalidate_ticket_pdf(booking_id):
+    """Drop a booking's cached PDF (e.g. once it is cancelled)"""
+    try:
+        _pdf_cache().delete(booking_id)
+    except Exception as e:
+        current_app.logger.warning(f'Ticket PDF cache invalidation failed: {str(e)}')
+
+
+# Render pool per process: {'pid', 'executor', 'inflight': {(booking_id, version): future}}
+_pool = {}
+_pool_lock = threading.Lock()
+
+
+def _render_with_time_limit(document, seconds):
+    """Pool entry point: render, ending this child if it runs past seconds"""
+    # SIGALRM's default action kills the process, even inside C code; the pool
+    # then reports itself broken and the parent starts a new one
+    signal.alarm(seconds)
+    try:
+        return render_ticket_pdf(document)
+    finally:
+        signal.alarm(0)
+
+
+def _executor(app):
+    """This process's render pool (None when rendering inline), started on first use
+
+    Children come from a fork server: a single-threaded process that has
+    imported this module once, so they neither inherit locks held by this
+    worker's background threads nor pay for the imports on every start.
+    CLI commands and scripts that never render never start a pool.
+    """
+    processes = app.config.get('PDF_RENDER_PROCESSES', 2)
+    if processes <= 0:
+        return None
+    with _pool_lock:
+        if _pool.get('pid') != os.getpid():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload([__name__])
+            _pool.clear()
+            _pool.update(
+                pid=os.getpid(),
+                executor=ProcessPoolExecutor(max_workers=processes, mp_context=context),
+                inflight={}
+            )
+        return _pool['executor']
+
+
+def _reset_executor():
+    """Drop a pool whose processes died; the next render starts a new one"""
+    with _pool_lock:
+        executor = _pool.get('executor') if _pool.get('pid') == os.getpid() else None
+        _pool.clear()
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(app, cache, booking_id, version, document):
+    """Start rendering in the pool, or join a render of the same content already running"""
+    executor = _executor(app)
+    if executor is None:
+        return None
+    key = (booking_id, version)
+    with _pool_lock:
+        future = _pool['inflight'].get(key)
+        if future is not None:
+            return future
+        future = executor.submit(_render_with_time_limit, document, app.config.get('PDF_RENDER_TIMEOUT', 30))
+        inflight = _pool['inflight']
+        inflight[key] = future
+
+    def finished(done):
+        inflight.pop(key, None)
+        if not done.cancelled() and done.exception() is None:
+            _store_pdf(cache, booking_id, version, done.result())
+
+    future.add_done_callback(finished)
+    return future
+
+
+def get_ticket_pdf(booking, tickets):
+    """
+    A booking's ticket PDF, from the cache or rendered in the pool
     
-    # Get PDF data
-    buffer.seek(0)
-    return buffer
+    Args:
+        booking: Booking object
+        tickets: List of Ticket objects
+        
+    Returns:
+        bytes: The PDF
+    """
+    app = current_app._get_current_object()
+    cache = _pdf_cache()
+    document = ticket_pdf_document(booking, tickets)
+    version = document_version(document)
+    
+    pdf = _cached_pdf(cache, booking.id, version)
+    metrics.record('ticket_pdf', pdf is not None)
+    if pdf is not None:
+        return pdf
+    
+    timeout = app.config.get('PDF_RENDER_TIMEOUT', 30)
+    try:
+        future = _submit(app, cache, booking.id, version, document)
+        if future is not None:
+            return future.result(timeout=timeout)
+    except BrokenProcessPool:
+        app.logger.error('Ticket PDF render pool broke; restarting it and rendering inline')
+        _reset_executor()
+    except RenderTimeout:
+        # A hung child ends itself at the same limit, breaking the pool for the next render
+        app.logger.warning(f'Ticket PDF render for booking {booking.id} timed out in the pool; rendering inline')
+    except CancelledError:
+        pass  # Another request reset the pool; render inline
+    pdf = render_ticket_pdf(document)
+    _store_pdf(cache, booking.id, version, pdf)
+    return pdf
+
+
+def prerender_ticket_pdf(booking, tickets):
+    """Render a newly confirmed booking's PDF in the background so the first download is cached
+    
+    Call after commit. Does nothing when rendering inline (PDF_RENDER_PROCESSES=0),
+    so confirmation requests never pay for the render.
+    """
+    try:
+        app = current_app._get_current_object()
+        if app.config.get('PDF_RENDER_PROCESSES', 2) <= 0:
+            return
+        cache = _pdf_cache()
+        document = ticket_pdf_document(booking, tickets)
+        version = document_version(document)
+        if _cached_pdf(cache, booking.id, version) is None:
+            _submit(app, cache, booking.id, version, document)
+    except Exception as e:
+        print(f"⚠️ [PDF] Could not pre-render tickets for booking {booking.id}: {e}")
+
+
+def generate_ticket_pdf(booking, tickets):
+    """
+    Generate PDF ticket with QR code
+    
+    Args:
+        booking: Booking object
+        tickets: List of Ticket objects
+        
+    Returns:
+        BytesIO: PDF file as BytesIO object
+    """
+    return BytesIO(get_ticket_pdf(booking, tickets))
 
 
 def generate_ticket_pdf_file(booking, tickets, output_path):
@@ -246,4 +454,3 @@ def generate_ticket_pdf_file(booking, tickets, output_path):
         f.write(pdf_buffer.read())
     
     return output_path
-
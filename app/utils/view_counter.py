@@ -0,0 +1,265 @@
+"""
+Buffered event view counting
+
+Event detail views are not written to the database one by one. record_view()
+drops repeat views from the same viewer (user id, or IP for anonymous
+visitors) within VIEW_DEDUP_SECONDS and adds the rest to a buffer keyed by
+(event, UTC hour). flush_views() drains that buffer every VIEW_FLUSH_SECONDS
+from a background thread and applies it in one transaction:
+
+- `UPDATE events SET view_count = view_count + n` per event, as one executemany
+- an upsert into `event_view_buckets` per (event, hour), for analytics
+
+Buffers:
+
+- MemoryViewBuffer: per worker, flushed on exit as well
+- RedisViewBuffer: shared by all workers, used when REDIS_URL is reachable
+
+Set VIEW_COUNTER_BACKEND to 'auto' (default), 'memory' or 'redis'. Views
+buffered since the last flush are lost if a worker is killed without a
+clean shutdown.
+"""
+import atexit
+import os
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+from flask import current_app
+from flask_limiter.util import get_remote_address
+from sqlalchemy import update, bindparam, select, func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models.event import Event, EventViewBucket
+from app.utils.redis_client import get_redis
+
+
+PENDING_KEY = 'nikofree:views:pending'
+SEEN_PREFIX = 'nikofree:views:seen:'
+
+
+def _hour_start(timestamp):
+    """Unix timestamp of the start of the UTC hour containing timestamp"""
+    return int(timestamp // 3600 * 3600)
+
+
+class MemoryViewBuffer:
+    """Pending view counts and recently seen viewers held in this process"""
+
+    name = 'memory'
+
+    def __init__(self, max_seen=100000):
+        self.max_seen = max_seen
+        self._pending = Counter()
+        self._seen = OrderedDict()  # {(event_id, viewer): expires_at}
+        self._lock = threading.Lock()
+
+    def add(self, event_id, viewer, hour, dedup_seconds):
+        now = time.monotonic()
+        with self._lock:
+            if viewer is not None and dedup_seconds > 0:
+                key = (event_id, viewer)
+                expires_at = self._seen.get(key)
+                if expires_at is not None and expires_at > now:
+                    return False
+                self._seen[key] = now + dedup_seconds
+                self._seen.move_to_end(key)
+                while len(self._seen) > self.max_seen:
+                    self._seen.popitem(last=False)
+            self._pending[(event_id, hour)] += 1
+            return True
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        return dict(pending)
+
+    def restore(self, counts):
+        with self._lock:
+            self._pending.update(counts)
+
+
+class RedisViewBuffer:
+    """Pending view counts shared by all workers through a Redis hash"""
+
+    name = 'redis'
+
+    def __init__(self, client):
+        self.client = client
+
+    def add(self, event_id, viewer, hour, dedup_seconds):
+        if viewer is not None and dedup_seconds > 0:
+            if not self.client.set(f'{SEEN_PREFIX}{event_id}:{viewer}', 1, nx=True, ex=dedup_seconds):
+                return False
+        self.client.hincrby(PENDING_KEY, f'{event_id}:{hour}', 1)
+        return True
+
+    def drain(self):
+        # RENAME is atomic, so increments after this point land in a fresh hash
+        flushing_key = f'nikofree:views:flushing:{uuid.uuid4().hex}'
+        try:
+            self.client.rename(PENDING_KEY, flushing_key)
+        except Exception:
+            return {}  # Nothing pending
+        raw = self.client.hgetall(flushing_key)
+        self.client.delete(flushing_key)
+
+        counts = {}
+        for field, value in raw.items():
+            event_id, hour = (field.decode() if isinstance(field, bytes) else field).split(':')
+            counts[(int(event_id), int(hour))] = int(value)
+        return counts
+
+    def restore(self, counts):
+        pipe = self.client.pipeline()
+        for (event_id, hour), views in counts.items():
+            pipe.hincrby(PENDING_KEY, f'{event_id}:{hour}', views)
+        pipe.execute()
+
+
+def init_view_counter(app):
+    """Pick the view buffer for this app"""
+    choice = app.config.get('VIEW_COUNTER_BACKEND', 'auto')
+    buffer = None
+
+    if choice in ('auto', 'redis'):
+        client = get_redis(app)
+        if client is not None:
+            buffer = RedisViewBuffer(client)
+        elif choice == 'redis':
+            app.logger.warning('VIEW_COUNTER_BACKEND=redis but Redis is unreachable; buffering views in-process')
+
+    if buffer is None:
+        buffer = MemoryViewBuffer(app.config.get('VIEW_DEDUP_MAX_ENTRIES', 100000))
+
+    app.extensions['view_counter'] = buffer
+    return buffer
+
+
+def viewer_key(user=None):
+    """Identify a viewer for deduplication: user id when logged in, else IP"""
+    if user is not None:
+        return f'u:{user.id}'
+    address = get_remote_address()
+    return f'ip:{address}' if address else None
+
+
+def record_view(event_id, user=None):
+    """Count a view of event_id unless this viewer was counted recently
+
+    Returns True if the view was counted. Never raises - a lost view is
+    preferable to a failed page load.
+    """
+    app = current_app._get_current_object()
+    buffer = app.extensions['view_counter']
+    try:
+        counted = buffer.add(
+            event_id,
+            viewer_key(user),
+            _hour_start(time.time()),
+            app.config.get('VIEW_DEDUP_SECONDS', 1800)
+        )
+    except Exception as e:
+        app.logger.warning(f'Failed to record view for event {event_id}: {str(e)}')
+        return False
+    _ensure_flusher(app)
+    return counted
+
+
+def _bucket_upsert(rows):
+    """INSERT ... ON CONFLICT adding to the existing hourly bucket"""
+    insert = postgresql_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    statement = insert(EventViewBucket.__table__).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=['event_id', 'bucket_start'],
+        set_={'views': EventViewBucket.__table__.c.views + statement.excluded.views}
+    )
+
+
+def _apply_counts(counts):
+    """Write drained counts in one transaction; returns the number of views applied"""
+    event_ids = {event_id for event_id, _ in counts}
+    # Skip events deleted since they were viewed
+    existing = set(db.session.execute(
+        select(Event.id).where(Event.id.in_(event_ids))
+    ).scalars())
+
+    totals = Counter()
+    buckets = []
+    for (event_id, hour), views in counts.items():
+        if event_id not in existing:
+            continue
+        totals[event_id] += views
+        buckets.append({
+            'event_id': event_id,
+            'bucket_start': datetime.utcfromtimestamp(hour),
+            'views': views
+        })
+    if not totals:
+        return 0
+
+    # Core statements on the session's connection: no ORM events, so the
+    # listing cache is not invalidated by view counts
+    connection = db.session.connection()
+    events = Event.__table__
+    connection.execute(
+        update(events)
+        .where(events.c.id == bindparam('event_id'))
+        .values(view_count=func.coalesce(events.c.view_count, 0) + bindparam('views')),
+        [{'event_id': event_id, 'views': views} for event_id, views in sorted(totals.items())]
+    )
+    connection.execute(_bucket_upsert(buckets))
+    db.session.commit()
+    return sum(totals.values())
+
+
+def flush_views():
+    """Apply all buffered views to the database; returns the number applied"""
+    buffer = current_app.extensions['view_counter']
+    counts = buffer.drain()
+    if not counts:
+        return 0
+    try:
+        return _apply_counts(counts)
+    except Exception as e:
+        db.session.rollback()
+        buffer.restore(counts)
+        current_app.logger.error(f'Failed to flush view counts, will retry: {str(e)}')
+        return 0
+
+
+# Flusher thread per process: {'pid': ..., 'thread': ...}
+_flusher = {}
+_flusher_lock = threading.Lock()
+
+
+def _flush_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            flush_views()
+
+
+def _flush_at_exit(app):
+    try:
+        with app.app_context():
+            flush_views()
+    except Exception:
+        pass
+
+
+def _ensure_flusher(app):
+    """Start the flush thread on first use in each process (gunicorn forks after import)"""
+    interval = app.config.get('VIEW_FLUSH_SECONDS', 10)
+    if interval <= 0 or (_flusher.get('pid') == os.getpid() and _flusher['thread'].is_alive()):
+        return
+    with _flusher_lock:
+        if _flusher.get('pid') == os.getpid() and _flusher['thread'].is_alive():
+            return
+        thread = threading.Thread(target=_flush_loop, args=(app, interval), name='view-counter-flush', daemon=True)
+        thread.start()
+        if _flusher.get('pid') != os.getpid():
+            atexit.register(_flush_at_exit, app)
+        _flusher.update(pid=os.getpid(), thread=thread)
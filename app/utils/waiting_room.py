@@ -0,0 +1,363 @@
+"""
+Virtual waiting room for high-demand on-sales
+
+While an event's waiting room is open, POST /api/tickets/book needs a
+booking pass. Buyers join a FIFO queue and poll their position until they
+are admitted:
+
+- Joining gives each user one sequence number per event (joining again
+  returns the same one) in a signed queue token.
+- An admission cursor moves forward at `rate` passes per second. It may run
+  at most `burst` places past the last person in the queue, so a quiet spell
+  can't bank enough admissions to let a later spike straight through.
+- Once the cursor passes a sequence number, polling returns a signed booking
+  pass for that user and event, valid for WAITING_ROOM_PASS_SECONDS from
+  the moment of admission.
+
+Joining, polling and checking a pass never touch the database, so queued
+buyers cost little while bookings reach the database and M-Pesa at the
+admission rate. Queue state lives in Redis when WAITING_ROOM_BACKEND is
+'auto' (default) and REDIS_URL is reachable, else in-process (one queue per
+worker, for development and tests).
+"""
+import math
+import threading
+import time
+from functools import wraps
+from flask import current_app, request, jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from itsdangerous import URLSafeSerializer, BadSignature
+from app.utils.redis_client import get_redis
+
+
+KEY_PREFIX = 'nikofree:waiting_room:'
+TOKEN_SALT = 'waiting-room-token'
+PASS_SALT = 'waiting-room-pass'
+PASS_HEADER = 'X-Queue-Pass'
+
+
+def _advance(state, now):
+    """Move the admission cursor forward to now; returns it"""
+    elapsed = max(now - state['last'], 0)
+    state['cursor'] = min(state['cursor'] + elapsed * state['rate'], state['seq'] + state['burst'])
+    state['last'] = now
+    return state['cursor']
+
+
+class MemoryWaitingRoom:
+    """Queues held in this process"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._rooms = {}  # {event_id: state}
+        self._members = {}  # {(event_id, user): seq}
+        self._admitted = {}  # {(event_id, seq): admitted_at}
+        self._lock = threading.Lock()
+
+    def _room(self, event_id, now):
+        state = self._rooms.get(event_id)
+        if state is not None and state['until'] <= now:
+            self._close(event_id)
+            state = None
+        return state
+
+    def _close(self, event_id):
+        self._rooms.pop(event_id, None)
+        for key in [key for key in self._members if key[0] == event_id]:
+            del self._members[key]
+        for key in [key for key in self._admitted if key[0] == event_id]:
+            del self._admitted[key]
+
+    def open(self, event_id, rate, burst, until, now):
+        with self._lock:
+            state = self._room(event_id, now)
+            if state is None:
+                self._rooms[event_id] = {'rate': rate, 'burst': burst, 'until': until, 'cursor': burst,
+                                         'last': now, 'seq': 0}
+            else:
+                _advance(state, now)
+                state.update(rate=rate, burst=burst, until=until)
+
+    def close(self, event_id):
+        with self._lock:
+            self._close(event_id)
+
+    def state(self, event_id, now):
+        with self._lock:
+            state = self._room(event_id, now)
+            if state is None:
+                return None
+            _advance(state, now)
+            return dict(state)
+
+    def join(self, event_id, user, now):
+        with self._lock:
+            state = self._room(event_id, now)
+            if state is None:
+                return None
+            seq = self._members.get((event_id, user))
+            if seq is None:
+                state['seq'] += 1
+                seq = self._members[(event_id, user)] = state['seq']
+            return seq
+
+    def status(self, event_id, seq, now):
+        """(cursor, rate, admitted_at or None), or None if the room is closed"""
+        with self._lock:
+            state = self._room(event_id, now)
+            if state is None:
+                return None
+            cursor = _advance(state, now)
+            admitted_at = None
+            if seq <= cursor:
+                admitted_at = self._admitted.setdefault((event_id, seq), now)
+            return cursor, state['rate'], admitted_at
+
+
+# Redis scripts keep each queue operation atomic across workers
+_ADVANCE = """
+local s = redis.call('HMGET', KEYS[1], 'rate', 'burst', 'until', 'cursor', 'last', 'seq')
+if not s[1] then return nil end
+local now = tonumber(ARGV[1])
+if tonumber(s[3]) <= now then
+    redis.call('DEL', unpack(KEYS))
+    return nil
+end
+local rate, burst, seq = tonumber(s[1]), tonumber(s[2]), tonumber(s[6])
+local cursor = math.min(tonumber(s[4]) + math.max(now - tonumber(s[5]), 0) * rate, seq + burst)
+redis.call('HSET', KEYS[1], 'cursor', cursor, 'last', now)
+"""
+
+_STATE_SCRIPT = _ADVANCE + """
+return {tostring(cursor), s[1], s[2], s[3], s[6]}
+"""
+
+_JOIN_SCRIPT = _ADVANCE + """
+local existing = redis.call('HGET', KEYS[2], ARGV[2])
+if existing then return tonumber(existing) end
+seq = redis.call('HINCRBY', KEYS[1], 'seq', 1)
+redis.call('HSET', KEYS[2], ARGV[2], seq)
+redis.call('EXPIREAT', KEYS[2], math.ceil(tonumber(s[3])))
+return seq
+"""
+
+_STATUS_SCRIPT = _ADVANCE + """
+local seq = tonumber(ARGV[2])
+local admitted_at = false
+if seq <= cursor then
+    redis.call('HSETNX', KEYS[3], ARGV[2], now)
+    redis.call('EXPIREAT', KEYS[3], math.ceil(tonumber(s[3])))
+    admitted_at = redis.call('HGET', KEYS[3], ARGV[2])
+end
+return {tostring(cursor), s[1], admitted_at}
+"""
+
+
+class RedisWaitingRoom:
+    """Queues shared by all workers through Redis"""
+
+    name = 'redis'
+
+    def __init__(self, client):
+        self.client = client
+        self._state = client.register_script(_STATE_SCRIPT)
+        self._join = client.register_script(_JOIN_SCRIPT)
+        self._status = client.register_script(_STATUS_SCRIPT)
+
+    @staticmethod
+    def _keys(event_id):
+        prefix = f'{KEY_PREFIX}{event_id}:'
+        return [f'{prefix}state', f'{prefix}members', f'{prefix}admitted']
+
+    def open(self, event_id, rate, burst, until, now):
+        state_key = self._keys(event_id)[0]
+        if self.state(event_id, now) is None:
+            self.client.delete(*self._keys(event_id))
+            self.client.hset(state_key, mapping={'cursor': burst, 'last': now, 'seq': 0})
+        self.client.hset(state_key, mapping={'rate': rate, 'burst': burst, 'until': until})
+        self.client.expireat(state_key, math.ceil(until))
+
+    def close(self, event_id):
+        self.client.delete(*self._keys(event_id))
+
+    def state(self, event_id, now):
+        result = self._state(keys=self._keys(event_id), args=[now])
+        if result is None:
+            return None
+        cursor, rate, burst, until, seq = (float(value) for value in result)
+        return {'cursor': cursor, 'rate': rate, 'burst': burst, 'until': until, 'seq': int(seq)}
+
+    def join(self, event_id, user, now):
+        return self._join(keys=self._keys(event_id), args=[now, user])
+
+    def status(self, event_id, seq, now):
+        result = self._status(keys=self._keys(event_id), args=[now, seq])
+        if result is None:
+            return None
+        cursor, rate, admitted_at = result
+        return float(cursor), float(rate), float(admitted_at) if admitted_at else None
+
+
+def init_waiting_room(app):
+    """Pick the waiting room backend for this app"""
+    choice = app.config.get('WAITING_ROOM_BACKEND', 'auto')
+    room = None
+
+    if choice in ('auto', 'redis'):
+        client = get_redis(app)
+        if client is not None:
+            room = RedisWaitingRoom(client)
+        elif choice == 'redis':
+            app.logger.warning('WAITING_ROOM_BACKEND=redis but Redis is unreachable; queueing in-process')
+
+    if room is None:
+        room = MemoryWaitingRoom()
+
+    app.extensions['waiting_room'] = room
+    return room
+
+
+def get_waiting_room():
+    room = current_app.extensions.get('waiting_room')
+    if room is None:
+        room = init_waiting_room(current_app)
+    return room
+
+
+def _serializer(salt):
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt=salt)
+
+
+def open_waiting_room(event_id, rate=None, burst=None, duration_seconds=None):
+    """Start (or retune) an event's waiting room; returns its state"""
+    config = current_app.config
+    rate = float(rate if rate is not None else config.get('WAITING_ROOM_RATE', 10))
+    burst = int(burst if burst is not None else config.get('WAITING_ROOM_BURST', 50))
+    duration_seconds = duration_seconds or config.get('WAITING_ROOM_DURATION_MINUTES', 120) * 60
+    now = time.time()
+    room = get_waiting_room()
+    room.open(event_id, rate, burst, now + duration_seconds, now)
+    return room.state(event_id, now)
+
+
+def close_waiting_room(event_id):
+    get_waiting_room().close(event_id)
+
+
+def waiting_room_state(event_id):
+    """Rate, queue length and admissions so far, or None if the room is closed"""
+    state = get_waiting_room().state(event_id, time.time())
+    if state is None:
+        return None
+    return {
+        'rate_per_second': state['rate'],
+        'burst': int(state['burst']),
+        'open_until': state['until'],
+        'joined': int(state['seq']),
+        'admitted': int(min(state['cursor'], state['seq'])),
+        'waiting': max(int(state['seq'] - math.floor(state['cursor'])), 0)
+    }
+
+
+def join_queue(event_id, user):
+    """A queue token for user, or None if the event has no open waiting room"""
+    seq = get_waiting_room().join(event_id, str(user), time.time())
+    if seq is None:
+        return None
+    return _serializer(TOKEN_SALT).dumps({'e': event_id, 'u': str(user), 's': int(seq)})
+
+
+def queue_status(event_id, token):
+    """
+    Where a queue token stands
+
+    Returns:
+        dict: {'active', 'admitted', 'position', 'estimated_wait_seconds',
+        'poll_after_seconds', 'pass', 'pass_expires_at'}, or None if the
+        token is invalid or for another event
+    """
+    try:
+        claims = _serializer(TOKEN_SALT).loads(token)
+    except BadSignature:
+        return None
+    if claims.get('e') != event_id:
+        return None
+
+    now = time.time()
+    status = get_waiting_room().status(event_id, claims['s'], now)
+    if status is None:
+        # Room closed: everyone may book
+        return {'active': False, 'admitted': True, 'position': 0, 'estimated_wait_seconds': 0,
+                'poll_after_seconds': None, 'pass': None, 'pass_expires_at': None}
+
+    cursor, rate, admitted_at = status
+    if admitted_at is not None:
+        expires_at = admitted_at + current_app.config.get('WAITING_ROOM_PASS_SECONDS', 600)
+        booking_pass = None
+        if expires_at > now:
+            booking_pass = _serializer(PASS_SALT).dumps({'e': event_id, 'u': claims['u'], 'x': int(expires_at)})
+        return {'active': True, 'admitted': True, 'position': 0, 'estimated_wait_seconds': 0,
+                'poll_after_seconds': None, 'pass': booking_pass, 'pass_expires_at': int(expires_at)}
+
+    position = claims['s'] - math.floor(cursor)
+    wait = position / rate if rate > 0 else None
+    return {
+        'active': True,
+        'admitted': False,
+        'position': position,
+        'estimated_wait_seconds': math.ceil(wait) if wait is not None else None,
+        # Poll more often as admission nears, never more than once a second
+        'poll_after_seconds': min(max(math.ceil(wait / 2), 1), 30) if wait is not None else 30,
+        'pass': None,
+        'pass_expires_at': None
+    }
+
+
+def valid_pass(event_id, user, booking_pass):
+    """Whether booking_pass admits user to book event_id right now"""
+    if not booking_pass:
+        return False
+    try:
+        claims = _serializer(PASS_SALT).loads(booking_pass)
+    except BadSignature:
+        return False
+    return claims.get('e') == event_id and claims.get('u') == str(user) and claims.get('x', 0) > time.time()
+
+
+def waiting_room_pass_required(fn):
+    """Turn bookings away without a valid pass while the event's waiting room is open
+
+    Checked before the route's own authentication loads anything from the
+    database. Expects event_id in the JSON body and the pass in the
+    X-Queue-Pass header (or queue_pass in the body).
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if request.method == 'OPTIONS':
+            return fn(*args, **kwargs)
+
+        data = request.get_json(silent=True) or {}
+        try:
+            event_id = int(data.get('event_id'))
+        except (TypeError, ValueError):
+            return fn(*args, **kwargs)  # The route reports the bad request
+
+        try:
+            room_open = get_waiting_room().state(event_id, time.time()) is not None
+        except Exception as e:
+            current_app.logger.error(f'Waiting room unavailable, admitting booking: {str(e)}')
+            room_open = False
+        if not room_open:
+            return fn(*args, **kwargs)
+
+        verify_jwt_in_request()
+        booking_pass = request.headers.get(PASS_HEADER) or data.get('queue_pass')
+        if not valid_pass(event_id, get_jwt_identity(), booking_pass):
+            return jsonify({
+                'error': 'This event has a waiting room. Join the queue to book.',
+                'waiting_room': True,
+                'queue_url': f'/api/tickets/events/{event_id}/queue'
+            }), 403
+        return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark for GET /api/events/search/autocomplete
+
+Seeds a throwaway in-memory SQLite database with upcoming approved events,
+then reports latency percentiles for the in-memory prefix index, the warm
+endpoint, and the database fallback the endpoint uses while the index is
+cold.
+
+Usage: python benchmark_autocomplete.py [--events 100000] [--runs 500]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['VIEW_COUNTER_BACKEND'] = 'memory'
+os.environ.setdefault('MAIL_SUPPRESS_SEND', 'True')
+
+from app import create_app, db, limiter
+from app.models import Category, Location, Partner, Event
+from app.routes.events import _autocomplete_from_database
+from app.utils.autocomplete import build_autocomplete_index, get_autocomplete_index
+from app.utils.search import create_search_schema
+
+
+WORDS = [
+    'jazz', 'night', 'festival', 'nairobi', 'sunset', 'yoga', 'retreat', 'comedy', 'live', 'gospel',
+    'concert', 'hike', 'ngong', 'hills', 'marathon', 'tech', 'meetup', 'startup', 'wine', 'tasting',
+    'art', 'exhibition', 'food', 'market', 'safari', 'rally', 'cycling', 'brunch', 'karaoke', 'party'
+]
+CATEGORIES = ['Music', 'Sports & Fitness', 'Travel', 'Social Activities', 'Food & Drinks', 'Technology']
+LOCATIONS = ['Nairobi', 'Naivasha', 'Nakuru', 'Mombasa', 'Kisumu', 'Eldoret']
+
+
+def seed(count):
+    categories = [Category(name=name, slug=name.lower().replace(' & ', '-').replace(' ', '-')) for name in CATEGORIES]
+    locations = [Location(name=name, slug=name.lower()) for name in LOCATIONS]
+    db.session.add_all(categories + locations)
+    db.session.flush()
+    partner = Partner(email='bench@nikofree.test', phone_number='0700000000', password_hash='x',
+                      business_name='Benchmark', category_id=categories[0].id, status='approved')
+    db.session.add(partner)
+    db.session.flush()
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    db.session.execute(Event.__table__.insert(), [
+        {
+            'title': ' '.join(rng.sample(WORDS, 3)).title() + f' {i}', 'description': 'Benchmark event',
+            'partner_id': partner.id, 'category_id': categories[i % len(categories)].id,
+            'start_date': now + timedelta(days=1 + i % 90), 'status': 'approved', 'is_published': True
+        }
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def percentiles(label, timings):
+    timings = sorted(timings)
+
+    def pick(fraction):
+        return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+    print(f'{label:<24} p50 {pick(0.50):8.3f} ms   p95 {pick(0.95):8.3f} ms   p99 {pick(0.99):8.3f} ms')
+
+
+def timed(fn, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=500)
+    args = parser.parse_args()
+
+    app = create_app('development')
+    limiter.enabled = False
+
+    with app.app_context():
+        db.create_all()
+        create_search_schema()
+        seed(args.events)
+
+        rng = random.Random(7)
+        queries = []
+        for _ in range(args.runs):
+            word = rng.choice(WORDS + [name.lower() for name in LOCATIONS])
+            queries.append(word[:rng.randint(2, len(word))])
+
+        started = time.perf_counter()
+        index = build_autocomplete_index()
+        print(f'Index built over {len(index)} entries in {(time.perf_counter() - started) * 1000:.0f} ms')
+
+        # Warm the endpoint's own index, then time requests against it
+        get_autocomplete_index()
+        while get_autocomplete_index() is None:
+            time.sleep(0.05)
+        client = app.test_client()
+
+        percentiles('prefix index', timed(index.search, queries))
+        percentiles('endpoint (warm index)', timed(
+            lambda query: client.get(f'/api/events/search/autocomplete?q={query}'), queries
+        ))
+        percentiles('database fallback', timed(_autocomplete_from_database, queries[:max(args.runs // 10, 10)]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+STK push latency and OAuth traffic with and without the shared M-Pesa token cache
+
+Starts daraja_stub.py in-process with --latency-ms on every call, then:
+
+1. Sends --pushes STK pushes from --threads threads, first fetching a token
+   before every push (the old behaviour), then through the token cache.
+2. Starts --workers processes sharing one file token store and has them all
+   ask for a token at once, with no token cached: only one of them should
+   reach the OAuth endpoint.
+
+Usage: python benchmark_mpesa_token.py [--pushes 200] [--threads 16] [--latency-ms 40] [--workers 8]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ['MPESA_TOKEN_DIR'] = tempfile.mkdtemp()
+os.environ['MPESA_TOKEN_BACKEND'] = 'file'
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ['RESERVATION_SWEEP_SECONDS'] = '0'
+os.environ.setdefault('MPESA_CONSUMER_KEY', 'benchmark-key')
+os.environ.setdefault('MPESA_CONSUMER_SECRET', 'benchmark-secret')
+
+import requests
+from app import create_app
+from app.utils.mpesa import MPesaClient
+from daraja_stub import start_stub
+
+
+def percentiles(label, timings):
+    timings = sorted(timings)
+
+    def pick(fraction):
+        return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+    print(f'{label:<26} n {len(timings):5d}   p50 {pick(0.50):7.1f} ms   p99 {pick(0.99):7.1f} ms')
+
+
+def push_run(app, pushes, threads, cached):
+    """Latency of each STK push in ms"""
+    def push(_):
+        with app.app_context():
+            client = MPesaClient()
+            began = time.perf_counter()
+            if cached:
+                response = client.stk_push('254712345678', 100, 'BENCH', 'Benchmark')
+            else:
+                # What stk_push did before the cache: a token fetch per call
+                token, _ = client._fetch_access_token()
+                response = requests.post(f'{client.base_url}/mpesa/stkpush/v1/processrequest', json={},
+                                         headers={'Authorization': f'Bearer {token}'}, timeout=10).json()
+            assert response.get('ResponseCode') == '0', response
+            return (time.perf_counter() - began) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(push, range(pushes)))
+
+
+def stampede_worker(base_url, barrier, results):
+    app = create_app('development')
+    app.config['MPESA_BASE_URL'] = base_url
+    with app.app_context():
+        client = MPesaClient()
+        barrier.wait()
+        results.put(client.get_access_token())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pushes', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--latency-ms', type=int, default=40, help='Stub delay on every Daraja call')
+    parser.add_argument('--workers', type=int, default=8, help='Processes in the stampede test')
+    args = parser.parse_args()
+
+    server, base_url, state = start_stub(latency_ms=args.latency_ms)
+    app = create_app('development')
+    app.config['MPESA_BASE_URL'] = base_url
+    print(f'Daraja stub at {base_url}, {args.latency_ms} ms per call; token store {app.config["MPESA_TOKEN_DIR"]}')
+
+    for label, cached in (('token fetched per push', False), ('shared token cache', True)):
+        before = state['counts']['oauth']
+        timings = push_run(app, args.pushes, args.threads, cached)
+        percentiles(label, timings)
+        print(f'{"":<26} OAuth requests: {state["counts"]["oauth"] - before}')
+
+    # Stampede: no token anywhere, every worker asks at the same moment
+    with app.app_context():
+        MPesaClient().token_cache.invalidate()
+    requests.post(f'{base_url}/stub/revoke', timeout=5)
+    before = state['counts']['oauth']
+    context = multiprocessing.get_context('fork')
+    barrier, results = context.Barrier(args.workers), context.Queue()
+    workers = [context.Process(target=stampede_worker, args=(base_url, barrier, results)) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    tokens = {results.get(timeout=60) for _ in workers}
+    for worker in workers:
+        worker.join()
+    fetched = state['counts']['oauth'] - before
+    print(f'{args.workers} workers asking at once: {fetched} OAuth request(s), {len(tokens)} distinct token(s)')
+    server.shutdown()
+    return 0 if fetched == 1 and len(tokens) == 1 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
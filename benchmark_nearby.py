@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark for GET /api/events/nearby
+
+Seeds a throwaway in-memory SQLite database with upcoming approved events
+spread across Kenya and times nearby searches around Nairobi, both the
+geohash lookup alone and the full endpoint (listing cache disabled).
+
+Usage: python benchmark_nearby.py [--events 100000] [--runs 200] [--radius 5]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['VIEW_COUNTER_BACKEND'] = 'memory'
+os.environ.setdefault('MAIL_SUPPRESS_SEND', 'True')
+
+from app import create_app, db
+from app.models import Category, Location, Partner, Event, TicketType
+from app.utils.geo import encode_geohash, find_nearby_events
+
+
+# Rough bounding box of Kenya, with a denser cluster around Nairobi
+LAT_RANGE = (-4.7, 4.6)
+LNG_RANGE = (33.9, 41.9)
+NAIROBI = (-1.2921, 36.8219)
+
+
+def seed(count):
+    category = Category(name='Music', slug='music')
+    location = Location(name='Nairobi', slug='nairobi', latitude=NAIROBI[0], longitude=NAIROBI[1])
+    db.session.add_all([category, location])
+    db.session.flush()
+    partner = Partner(email='bench@nikofree.test', phone_number='0700000000', password_hash='x',
+                      business_name='Benchmark', category_id=category.id, status='approved')
+    db.session.add(partner)
+    db.session.flush()
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    rows = []
+    for i in range(count):
+        if i % 5 == 0:
+            lat = NAIROBI[0] + rng.uniform(-0.3, 0.3)
+            lng = NAIROBI[1] + rng.uniform(-0.3, 0.3)
+        else:
+            lat = rng.uniform(*LAT_RANGE)
+            lng = rng.uniform(*LNG_RANGE)
+        rows.append({
+            'title': f'Benchmark event {i}', 'description': 'Benchmark event',
+            'partner_id': partner.id, 'category_id': category.id, 'location_id': location.id,
+            'start_date': now + timedelta(days=1 + i % 90), 'status': 'approved',
+            'is_published': True, 'is_free': i % 3 == 0,
+            'latitude': lat, 'longitude': lng, 'geohash': encode_geohash(lat, lng)
+        })
+    # Core bulk insert - mapper hooks are bypassed, so geohash is set above
+    db.session.execute(Event.__table__.insert(), rows)
+    db.session.execute(TicketType.__table__.insert(), [
+        {'event_id': event_id, 'name': 'Regular', 'price': 500, 'quantity_total': 100, 'quantity_available': 100}
+        for event_id in range(1, count + 1)
+    ])
+    db.session.commit()
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f'{label:<28} median {statistics.median(timings):7.2f} ms   p95 {p95:7.2f} ms   max {timings[-1]:7.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--radius', type=float, default=5.0)
+    args = parser.parse_args()
+
+    app = create_app('development')
+    app.config['LISTING_CACHE_SECONDS'] = 0  # Time the query, not the listing cache
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        seed(args.events)
+        print(f'Seeded {args.events} events in {time.perf_counter() - started:.1f}s')
+
+        rng = random.Random(7)
+        points = [
+            (NAIROBI[0] + rng.uniform(-0.2, 0.2), NAIROBI[1] + rng.uniform(-0.2, 0.2))
+            for _ in range(args.runs)
+        ]
+        base_query = Event.query.filter(Event.is_published == True, Event.status == 'approved')
+
+        lookups, found = [], []
+        for lat, lng in points:
+            started = time.perf_counter()
+            found.append(len(find_nearby_events(base_query, lat, lng, args.radius)))
+            lookups.append((time.perf_counter() - started) * 1000)
+
+        client = app.test_client()
+        requests_ms = []
+        for lat, lng in points:
+            started = time.perf_counter()
+            response = client.get(f'/api/events/nearby?lat={lat}&lng={lng}&radius_km={args.radius}&is_free=false')
+            requests_ms.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                print(f'Request failed: {response.status_code} {response.get_data(as_text=True)}')
+                return 1
+
+        print(f'{args.runs} searches, radius {args.radius:g} km, {statistics.median(found):.0f} matches (median)')
+        report('geohash lookup', lookups)
+        report('GET /api/events/nearby', requests_ms)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
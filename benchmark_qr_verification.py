@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark for signed ticket QR verification
+
+Reports how many scanned payloads per second verify_qr_code() checks for
+valid codes, codes signed with a rotated-out (but still accepted) key and
+forged codes, then times POST /api/tickets/scan for forged codes (rejected
+without a database read) against real check-ins, on a throwaway in-memory
+SQLite database.
+
+Usage: python benchmark_qr_verification.py [--codes 100000] [--scans 500]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['VIEW_COUNTER_BACKEND'] = 'memory'
+os.environ['RESERVATION_SWEEP_SECONDS'] = '0'
+os.environ['PDF_RENDER_PROCESSES'] = '0'
+os.environ['QR_SIGNING_KEYS'] = 'K2:benchmark-current-key,K1:benchmark-previous-key'
+os.environ.setdefault('MAIL_SUPPRESS_SEND', 'True')
+
+from flask_jwt_extended import create_access_token
+from app import create_app, db, limiter
+from app.models import Category, Partner, Event, TicketType, Booking, User
+from app.utils.qrcode_generator import sign_ticket, verify_qr_code
+from app.utils.ticket_issuance import issue_tickets
+
+
+def throughput(label, payloads):
+    started = time.perf_counter()
+    accepted = sum(1 for payload in payloads if verify_qr_code(payload))
+    elapsed = time.perf_counter() - started
+    print(f'{label:<28} {len(payloads) / elapsed:12,.0f} /s   {elapsed / len(payloads) * 1e6:6.2f} us each'
+          f'   ({accepted} accepted)')
+
+
+def percentiles(label, timings):
+    timings = sorted(timings)
+
+    def pick(fraction):
+        return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+    print(f'{label:<28} p50 {pick(0.50):8.3f} ms   p95 {pick(0.95):8.3f} ms   p99 {pick(0.99):8.3f} ms')
+
+
+def seed(count):
+    category = Category(name='Music', slug='music')
+    db.session.add(category)
+    db.session.flush()
+    partner = Partner(email='bench@nikofree.test', phone_number='0700000000', password_hash='x',
+                      business_name='Benchmark', category_id=category.id, status='approved')
+    user = User(email='bench-user@nikofree.test', first_name='Bench', last_name='User')
+    db.session.add_all([partner, user])
+    db.session.flush()
+    event = Event(title='Benchmark Gate', description='Benchmark event', partner_id=partner.id,
+                  category_id=category.id, start_date=datetime.utcnow() + timedelta(hours=2),
+                  status='approved', is_published=True)
+    db.session.add(event)
+    db.session.flush()
+    ticket_type = TicketType(event_id=event.id, name='Regular', price=0, quantity_total=count,
+                             quantity_available=count)
+    db.session.add(ticket_type)
+    db.session.flush()
+    booking = Booking(booking_number='BKGATE000001', user_id=user.id, event_id=event.id,
+                      ticket_type_id=ticket_type.id, quantity=count, total_amount=0,
+                      status='confirmed', confirmed_at=datetime.utcnow())
+    db.session.add(booking)
+    db.session.flush()
+    tickets = issue_tickets(booking, ticket_type.id)
+    db.session.commit()
+    return partner, event, [sign_ticket(ticket.id, event.id, ticket_type.id) for ticket in tickets]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--codes', type=int, default=100000)
+    parser.add_argument('--scans', type=int, default=500)
+    args = parser.parse_args()
+
+    app = create_app('development')
+    limiter.enabled = False
+
+    with app.app_context():
+        rng = random.Random(42)
+        ids = [(rng.randint(1, 10 ** 7), rng.randint(1, 10 ** 5), rng.randint(1, 10 ** 6)) for _ in range(args.codes)]
+        valid = [sign_ticket(*claims) for claims in ids]
+        print(f'Payload size: {len(valid[0])} characters, e.g. {valid[0]}')
+
+        # Codes signed before the last rotation still verify with the older key
+        app.extensions['qr_signing_keys'] = ('K1', app.extensions['qr_signing_keys'][1])
+        rotated = [sign_ticket(*claims) for claims in ids]
+        app.extensions.pop('qr_signing_keys')
+
+        forged = [payload[:-3] + ('AAA' if not payload.endswith('AAA') else 'BBB') for payload in valid]
+        foreign_key = [payload.replace(':K2:', ':K9:', 1) for payload in valid]
+
+        throughput('valid', valid)
+        throughput('valid, previous key', rotated)
+        throughput('forged signature', forged)
+        throughput('unknown key id', foreign_key)
+
+        db.create_all()
+        partner, event, codes = seed(args.scans)
+        token = create_access_token(identity=str(partner.id), additional_claims={'type': 'partner'})
+        headers = {'Authorization': f'Bearer {token}'}
+        client = app.test_client()
+
+        def scan(payload):
+            started = time.perf_counter()
+            response = client.post('/api/tickets/scan', json={'qr_data': payload, 'event_id': event.id}, headers=headers)
+            timings.append((time.perf_counter() - started) * 1000)
+            return response.status_code
+
+        timings = []
+        statuses = {scan(payload[:-3] + 'AAA') for payload in codes}
+        percentiles(f'scan forged {sorted(statuses)}', timings)
+        timings = []
+        statuses = {scan(payload) for payload in codes}
+        percentiles(f'scan check-in {sorted(statuses)}', timings)
+        timings = []
+        statuses = {scan(payload) for payload in codes}
+        percentiles(f'scan repeat {sorted(statuses)}', timings)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark for ticket PDF downloads
+
+Seeds a throwaway in-memory SQLite database with confirmed bookings of 1 and
+10 tickets, then reports latency percentiles for a cold render, a cold
+download rendered inline and in the render pool, and a warm (cached)
+download, plus throughput of cold renders across threads versus the pool.
+
+Usage: python benchmark_ticket_pdf.py [--runs 50] [--bookings 40] [--threads 8]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['VIEW_COUNTER_BACKEND'] = 'memory'
+os.environ['PDF_CACHE_BACKEND'] = 'memory'
+os.environ['RESERVATION_SWEEP_SECONDS'] = '0'
+os.environ.setdefault('MAIL_SUPPRESS_SEND', 'True')
+
+from app import create_app, db, limiter
+from app.models import Category, Partner, Event, TicketType, Booking, User
+from app.utils.ticket_issuance import issue_tickets
+from app.utils.ticket_pdf import (
+    ticket_pdf_document, render_ticket_pdf, invalidate_ticket_pdf, _executor
+)
+
+
+SIZES = (1, 10)
+
+
+def seed(bookings_per_size):
+    category = Category(name='Music', slug='music')
+    db.session.add(category)
+    db.session.flush()
+    partner = Partner(email='bench@nikofree.test', phone_number='0700000000', password_hash='x',
+                      business_name='Benchmark', category_id=category.id, status='approved')
+    user = User(email='bench-user@nikofree.test', first_name='Bench', last_name='User')
+    db.session.add_all([partner, user])
+    db.session.flush()
+    event = Event(title='Benchmark Jazz Night', description='Benchmark event', partner_id=partner.id,
+                  category_id=category.id, start_date=datetime.utcnow() + timedelta(days=7),
+                  venue_name='Carnivore Grounds', status='approved', is_published=True)
+    db.session.add(event)
+    db.session.flush()
+    ticket_type = TicketType(event_id=event.id, name='Regular', price=1500, quantity_total=100000,
+                             quantity_available=100000)
+    db.session.add(ticket_type)
+    db.session.flush()
+
+    bookings = {size: [] for size in SIZES}
+    for size in SIZES:
+        for i in range(bookings_per_size):
+            booking = Booking(booking_number=f'BK{size:02d}{i:06d}', user_id=user.id, event_id=event.id,
+                              ticket_type_id=ticket_type.id, quantity=size, total_amount=1500 * size,
+                              status='confirmed', confirmed_at=datetime.utcnow())
+            db.session.add(booking)
+            db.session.flush()
+            issue_tickets(booking, ticket_type.id)
+            bookings[size].append(booking)
+    db.session.commit()
+    return bookings
+
+
+def percentiles(label, timings):
+    timings = sorted(timings)
+
+    def pick(fraction):
+        return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+    print(f'{label:<28} p50 {pick(0.50):8.2f} ms   p95 {pick(0.95):8.2f} ms   p99 {pick(0.99):8.2f} ms')
+
+
+def timed(fn, items):
+    timings = []
+    for item in items:
+        started = time.perf_counter()
+        fn(item)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def download(client, booking):
+    response = client.get(f'/api/tickets/download/{booking.booking_number}')
+    assert response.status_code == 200 and response.data.startswith(b'%PDF'), response.status_code
+    return response
+
+
+def cold_download(app, client, processes):
+    def run(booking):
+        invalidate_ticket_pdf(booking.id)
+        download(client, booking)
+
+    app.config['PDF_RENDER_PROCESSES'] = processes
+    return run
+
+
+def throughput(label, documents, render_all):
+    started = time.perf_counter()
+    render_all(documents)
+    elapsed = time.perf_counter() - started
+    print(f'{label:<28} {len(documents) / elapsed:8.1f} PDFs/s ({elapsed * 1000:.0f} ms for {len(documents)})')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--bookings', type=int, default=40, help='Bookings per size for the throughput run')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    app = create_app('development')
+    app.config['PDF_RENDER_PROCESSES'] = args.processes
+    limiter.enabled = False
+
+    with app.app_context():
+        db.create_all()
+        bookings = seed(max(args.runs, args.bookings))
+        client = app.test_client()
+        pool = _executor(app)  # Start the pool before timing
+        pool.submit(int).result()
+
+        for size in SIZES:
+            sample = bookings[size][:args.runs]
+            documents = [ticket_pdf_document(booking, list(booking.tickets)) for booking in sample]
+            print(f'\n{size} ticket(s) per booking, {len(sample)} runs, '
+                  f'{len(render_ticket_pdf(documents[0])) / 1024:.0f} KB per PDF')
+
+            percentiles('render only', timed(render_ticket_pdf, documents))
+            percentiles('cold download (inline)', timed(cold_download(app, client, 0), sample))
+            percentiles('cold download (pool)', timed(cold_download(app, client, args.processes), sample))
+            percentiles('warm download (cached)', timed(lambda booking: download(client, booking), sample))
+
+            documents = [ticket_pdf_document(booking, list(booking.tickets)) for booking in bookings[size][:args.bookings]]
+            with ThreadPoolExecutor(max_workers=args.threads) as threads:
+                throughput(f'cold, {args.threads} threads', documents,
+                           lambda docs: list(threads.map(render_ticket_pdf, docs)))
+            throughput(f'cold, {args.processes} processes', documents,
+                       lambda docs: list(pool.map(render_ticket_pdf, docs)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
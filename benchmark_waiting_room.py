@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Simulation of a 10x on-sale traffic spike, with and without the waiting room
+
+Buyers arrive at --rate per second, then at ten times that for --spike
+seconds, then at --rate again. Each buyer books one ticket through
+POST /api/tickets/book. Without a waiting room every arrival books at once;
+with one, buyers join the queue, poll as told and book with their pass, so
+bookings reach the database at --admit per second. Reports latency
+percentiles of the booking requests before, during and after the spike,
+and how long buyers waited in the queue.
+
+Runs against a throwaway SQLite file. Set DATABASE_URL to an empty
+PostgreSQL database to test there.
+
+Usage: python benchmark_waiting_room.py [--rate 10] [--spike 5] [--admit 20] [--threads 64]
+"""
+
+import argparse
+import heapq
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'waiting_room.db')}"
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['VIEW_COUNTER_BACKEND'] = 'memory'
+os.environ['WAITING_ROOM_BACKEND'] = 'memory'
+os.environ['RESERVATION_SWEEP_SECONDS'] = '0'
+os.environ['PDF_RENDER_PROCESSES'] = '0'
+os.environ.setdefault('MAIL_SUPPRESS_SEND', 'True')
+os.environ.setdefault('SMS_SUPPRESS_SEND', 'True')
+
+from config import DevelopmentConfig
+if os.environ['DATABASE_URL'].startswith('sqlite'):
+    # Writers queue on SQLite's database lock instead of failing immediately
+    DevelopmentConfig.SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 60}}
+
+from flask_jwt_extended import create_access_token
+from app import create_app, db, limiter
+from app.models import Category, Partner, User, Event, TicketType
+from app.utils.waiting_room import open_waiting_room, close_waiting_room
+
+
+def seed(buyers):
+    category = Category(name='Music', slug='music')
+    db.session.add(category)
+    db.session.flush()
+    partner = Partner(email='onsale@nikofree.test', phone_number='0700000000', password_hash='x',
+                      business_name='On-sale', category_id=category.id, status='approved')
+    db.session.add(partner)
+    db.session.flush()
+    event_ids = []
+    for mode in ('direct', 'waiting room'):
+        event = Event(title=f'Headliner ({mode})', description='Spike simulation', partner_id=partner.id,
+                      category_id=category.id, start_date=datetime.utcnow() + timedelta(days=30),
+                      status='approved', is_published=True, is_free=False)
+        db.session.add(event)
+        db.session.flush()
+        db.session.add(TicketType(event_id=event.id, name='Regular', price=2500, quantity_total=buyers * 2,
+                                  quantity_available=buyers * 2, quantity_sold=0))
+        event_ids.append(event.id)
+    users = [User(email=f'buyer{i}@nikofree.test', first_name='Buyer', last_name=str(i)) for i in range(buyers)]
+    db.session.add_all(users)
+    db.session.commit()
+    ticket_types = {event_id: TicketType.query.filter_by(event_id=event_id).first().id for event_id in event_ids}
+    tokens = [create_access_token(identity=str(user.id), additional_claims={'type': 'user'}) for user in users]
+    return event_ids, ticket_types, tokens
+
+
+def arrivals(rate, spike_seconds, calm_seconds):
+    """Arrival offsets: calm, a 10x spike, calm again"""
+    offsets, t = [], 0.0
+    for phase_rate, seconds in ((rate, calm_seconds), (rate * 10, spike_seconds), (rate, calm_seconds)):
+        end = t + seconds
+        while t < end:
+            offsets.append(t)
+            t += 1 / phase_rate
+        t = end
+    return offsets
+
+
+def percentiles(label, timings):
+    if not timings:
+        print(f'{label:<34} -')
+        return
+    timings = sorted(timings)
+
+    def pick(fraction):
+        return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+    print(f'{label:<34} n {len(timings):5d}   p50 {pick(0.50):8.1f} ms   p99 {pick(0.99):8.1f} ms')
+
+
+def simulate(app, event_id, ticket_type_id, tokens, offsets, threads, use_queue, calm_seconds, spike_seconds):
+    """Run one scenario; returns {phase: [booking latency ms]}, queue waits and failures"""
+    local = threading.local()
+    heap, counter, lock = [], itertools.count(), threading.Lock()
+    latencies = {'before': [], 'during': [], 'after': []}
+    waits, failures, outstanding = [], [], [0]
+    started = time.monotonic()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return local.client
+
+    def schedule(due, action, buyer):
+        with lock:
+            heapq.heappush(heap, (due, next(counter), action, buyer))
+            outstanding[0] += 1
+
+    def phase(arrived):
+        if arrived < calm_seconds:
+            return 'before'
+        return 'during' if arrived < calm_seconds + spike_seconds else 'after'
+
+    def book(buyer, booking_pass=None):
+        headers = {'Authorization': f"Bearer {buyer['token']}"}
+        if booking_pass:
+            headers['X-Queue-Pass'] = booking_pass
+        began = time.perf_counter()
+        response = client().post('/api/tickets/book', json={
+            'event_id': event_id, 'ticket_type_id': ticket_type_id, 'quantity': 1, 'phone_number': '254712345678'
+        }, headers=headers)
+        elapsed = (time.perf_counter() - began) * 1000
+        with lock:
+            latencies[phase(buyer['arrived'])].append(elapsed)
+            if response.status_code != 201:
+                failures.append(response.status_code)
+
+    def run(action, buyer):
+        headers = {'Authorization': f"Bearer {buyer['token']}"}
+        try:
+            if action == 'arrive' and not use_queue:
+                book(buyer)
+            elif action == 'arrive':
+                status = client().post(f'/api/tickets/events/{event_id}/queue', headers=headers).get_json()
+                buyer['queue_token'] = status['token']
+                follow_up(buyer, status)
+            else:
+                status = client().get(f"/api/tickets/events/{event_id}/queue/{buyer['queue_token']}").get_json()
+                follow_up(buyer, status)
+        finally:
+            with lock:
+                outstanding[0] -= 1
+
+    def follow_up(buyer, status):
+        if status.get('pass'):
+            waits.append((time.monotonic() - started - buyer['arrived']) * 1000)
+            book(buyer, status['pass'])
+        else:
+            schedule(time.monotonic() - started + status['poll_after_seconds'], 'poll', buyer)
+
+    for offset, token in zip(offsets, tokens):
+        schedule(offset, 'arrive', {'token': token, 'arrived': offset})
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        while True:
+            with lock:
+                if not heap and not outstanding[0]:
+                    break
+                item = heap[0] if heap else None
+                if item and item[0] <= time.monotonic() - started:
+                    heapq.heappop(heap)
+                    # Still outstanding until run() finishes
+                    pool.submit(run, item[2], item[3])
+                    continue
+            time.sleep(0.002)
+    return latencies, waits, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rate', type=float, default=10, help='Arrivals per second outside the spike')
+    parser.add_argument('--spike', type=float, default=5, help='Seconds of 10x traffic')
+    parser.add_argument('--calm', type=float, default=5, help='Seconds of normal traffic before and after')
+    parser.add_argument('--admit', type=float, default=20, help='Waiting room passes per second')
+    parser.add_argument('--threads', type=int, default=64)
+    args = parser.parse_args()
+
+    app = create_app('development')
+    limiter.enabled = False
+    print(f"Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    offsets = arrivals(args.rate, args.spike, args.calm)
+
+    with app.app_context():
+        db.create_all()
+        (direct_event, queued_event), ticket_types, tokens = seed(len(offsets) * 2)
+        open_waiting_room(queued_event, rate=args.admit, burst=int(args.admit), duration_seconds=3600)
+
+    print(f'{len(offsets)} buyers: {args.rate:g}/s for {args.calm:g}s, {args.rate * 10:g}/s for {args.spike:g}s, '
+          f'{args.rate:g}/s for {args.calm:g}s')
+    for label, event_id, buyers, use_queue in (
+        ('direct', direct_event, tokens[:len(offsets)], False),
+        (f'waiting room, {args.admit:g} passes/s', queued_event, tokens[len(offsets):], True)
+    ):
+        began = time.monotonic()
+        latencies, waits, failures = simulate(app, event_id, ticket_types[event_id], buyers, offsets,
+                                              args.threads, use_queue, args.calm, args.spike)
+        print(f'\n{label} ({time.monotonic() - began:.1f}s, {len(failures)} failed bookings)')
+        for phase_name in ('before', 'during', 'after'):
+            percentiles(f'  book, arrived {phase_name} spike', latencies[phase_name])
+        if use_queue:
+            percentiles('  time in queue', waits)
+
+    with app.app_context():
+        close_waiting_room(queued_event)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
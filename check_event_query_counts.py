@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Query-count check for the event listing endpoints
+
+Every listing serializes its page through serialize_events(), which loads
+ticket types, hosts, interests, promo codes, organizers, categories and
+locations for the whole page in a fixed number of queries. This seeds a few
+events with all of those, counts the SQL statements each endpoint runs (with
+a before_cursor_execute listener), then grows every listing to a full page
+and counts again. An endpoint fails if it runs more than its fixed bound or
+if its count grows with the page - the sign of a lazy to_dict() relationship
+access creeping back in (N+1 queries).
+
+Runs against a throwaway SQLite file. Set DATABASE_URL to an empty
+PostgreSQL database to test there.
+
+Usage: python check_event_query_counts.py [--page 20]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'query_counts.db')}"
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['VIEW_COUNTER_BACKEND'] = 'memory'
+os.environ['RESERVATION_SWEEP_SECONDS'] = '0'
+os.environ['PDF_RENDER_PROCESSES'] = '0'
+os.environ.setdefault('MAIL_SUPPRESS_SEND', 'True')
+os.environ.setdefault('SMS_SUPPRESS_SEND', 'True')
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event as sa_event
+from app import create_app, db, limiter
+from app.models import Category, Location, Partner, User, Event, EventHost, EventInterest, EventPromotion, \
+    TicketType, PromoCode, Booking
+from app.models.user import bucketlist
+
+
+# Most statements each endpoint may run for one page, whatever the page size
+# (today's count plus one statement of headroom)
+BOUNDS = {
+    'get_events': 12,
+    'get_this_weekend_events': 11,
+    'get_category_events': 12,
+    'get_promoted_events': 11,
+    'admin get_events': 14,
+    'partner get_partner_events': 13,
+}
+
+# Early enough that every listing includes the events: upcoming, and on the
+# weekend /api/events/this-weekend reports
+def weekend_start():
+    today = datetime.utcnow()
+    saturday = (today + timedelta(days=(5 - today.weekday()) % 7)).replace(hour=0, minute=0, second=0)
+    return max(saturday + timedelta(hours=12), today + timedelta(hours=1))
+
+
+def seed_base(admin_email):
+    category = Category(name='Music', slug='music')
+    location = Location(name='Nairobi', slug='nairobi')
+    db.session.add_all([category, location])
+    db.session.flush()
+    partner = Partner(email='organizer@nikofree.test', phone_number='0700000000', password_hash='x',
+                      business_name='Organizer', category_id=category.id, status='approved')
+    admin = User(email=admin_email, first_name='Admin', last_name='User')
+    viewer = User(email='viewer@nikofree.test', first_name='Viewer', last_name='User')
+    hosts = [User(email=f'host{i}@nikofree.test', first_name='Host', last_name=str(i)) for i in range(2)]
+    db.session.add_all([partner, admin, viewer, *hosts])
+    db.session.commit()
+    return category.id, location.id, partner.id, admin.id, viewer.id, [host.id for host in hosts]
+
+
+def seed_events(count, start_index, category_id, location_id, partner_id, viewer_id, host_ids):
+    """Events with everything a serialized event shows"""
+    starts = weekend_start()
+    now = datetime.utcnow()
+    for i in range(start_index, start_index + count):
+        event = Event(title=f'Concert {i}', description='Query count check', partner_id=partner_id,
+                      category_id=category_id, location_id=location_id,
+                      start_date=starts + timedelta(minutes=i), status='approved', is_published=True)
+        db.session.add(event)
+        db.session.flush()
+        ticket_types = [
+            TicketType(event_id=event.id, name=name, price=price, quantity_total=100, quantity_available=100)
+            for name, price in (('Regular', 1000), ('VIP', 3000))
+        ]
+        db.session.add_all(ticket_types)
+        db.session.add_all([EventHost(event_id=event.id, user_id=user_id) for user_id in host_ids])
+        db.session.add_all([EventInterest(event_id=event.id, name=name) for name in ('Live music', 'Outdoors')])
+        db.session.add_all([
+            PromoCode(code=f'SAVE{i}X{n}', event_id=event.id, discount_type='percentage', discount_value=10,
+                      created_by=partner_id)
+            for n in range(2)
+        ])
+        db.session.add(EventPromotion(event_id=event.id, start_date=now - timedelta(days=1),
+                                      end_date=now + timedelta(days=7), days_count=8, total_cost=3200,
+                                      is_active=True, is_paid=True))
+        db.session.flush()
+        db.session.add(Booking(user_id=viewer_id, event_id=event.id, ticket_type_id=ticket_types[0].id,
+                               quantity=1, total_amount=1000, status='confirmed', confirmed_at=now))
+        db.session.execute(bucketlist.insert().values(user_id=viewer_id, event_id=event.id))
+    db.session.commit()
+
+
+def count_queries(app, requests):
+    """{endpoint: (status, events returned, statements run)}"""
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+
+    # Each request pushes its own app context, so its session starts with an empty identity map
+    client = app.test_client()
+    results = {}
+    with app.app_context():
+        engine = db.engine
+    for name, url, token in requests:
+        sa_event.listen(engine, 'before_cursor_execute', count)
+        try:
+            response = client.get(url, headers={'Authorization': f'Bearer {token}'})
+        finally:
+            sa_event.remove(engine, 'before_cursor_execute', count)
+        body = response.get_json() or {}
+        results[name] = (response.status_code, len(body.get('events') or []), len(statements))
+        statements.clear()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--page', type=int, default=20, help='Events in a full page')
+    args = parser.parse_args()
+    small = 3
+
+    app = create_app('development')
+    limiter.enabled = False
+    print(f"Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+
+    with app.app_context():
+        db.create_all()
+        category_id, location_id, partner_id, admin_id, viewer_id, host_ids = seed_base(app.config['ADMIN_EMAIL'])
+        # Logged-in requests, so listings skip the anonymous response cache
+        viewer_token = create_access_token(identity=str(viewer_id), additional_claims={'type': 'user'})
+        admin_token = create_access_token(identity=str(admin_id), additional_claims={'type': 'user'})
+        partner_token = create_access_token(identity=str(partner_id), additional_claims={'type': 'partner'})
+
+    requests = [
+        ('get_events', f'/api/events?per_page={args.page}', viewer_token),
+        ('get_this_weekend_events', '/api/events/this-weekend', viewer_token),
+        ('get_category_events', f'/api/events/categories/{category_id}/events', viewer_token),
+        ('get_promoted_events', '/api/events/promoted', viewer_token),
+        ('admin get_events', f'/api/admin/events?per_page={args.page}', admin_token),
+        ('partner get_partner_events', f'/api/partners/events?per_page={args.page}', partner_token),
+    ]
+
+    rounds = []
+    for total in (small, args.page):
+        with app.app_context():
+            seeded = Event.query.count()
+            seed_events(total - seeded, seeded, category_id, location_id, partner_id, viewer_id, host_ids)
+        rounds.append(count_queries(app, requests))
+
+    ok = True
+    print(f"{'endpoint':<28} {'events':>13} {'queries':>13} {'bound':>6}")
+    for name, _, _ in requests:
+        (status_a, events_a, queries_a), (status_b, events_b, queries_b) = rounds[0][name], rounds[1][name]
+        checks = [
+            (status_a == 200 and status_b == 200, f'HTTP {status_a}/{status_b}'),
+            (events_b > events_a, 'page did not grow'),
+            (max(queries_a, queries_b) <= BOUNDS[name], f'over the bound of {BOUNDS[name]}'),
+            (queries_b == queries_a, 'queries grow with the page (N+1)'),
+        ]
+        failures = [message for passed, message in checks if not passed]
+        ok = ok and not failures
+        print(f"{name:<28} {events_a:>5} -> {events_b:<5} {queries_a:>5} -> {queries_b:<5} {BOUNDS[name]:>6}  "
+              f"{'PASS' if not failures else 'FAIL: ' + ', '.join(failures)}")
+
+    print('OK - listing query counts are bounded' if ok else 'FAILED')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
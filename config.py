@@ -115,14 +115,41 @@ class Config:
     MPESA_BUSINESS_SHORTCODE = os.getenv('MPESA_BUSINESS_SHORTCODE', '4004285')
     MPESA_ENVIRONMENT = os.getenv('MPESA_ENVIRONMENT', 'production')
     MPESA_CALLBACK_URL = os.getenv('MPESA_CALLBACK_URL', 'https://nikofree-arhecnfueegrasf8.canadacentral-01.azurewebsites.net/api/payments/mpesa/callback')
+    MPESA_BASE_URL = os.getenv('MPESA_BASE_URL', '')  # Daraja host override, e.g. http://127.0.0.1:8089 for daraja_stub.py
+    MPESA_TOKEN_BACKEND = os.getenv('MPESA_TOKEN_BACKEND', 'auto')  # auto (Redis, else file), redis, file, memory
+    MPESA_TOKEN_DIR = os.getenv('MPESA_TOKEN_DIR', '')  # File store directory; defaults to the instance folder
+    MPESA_TOKEN_REFRESH_SECONDS = int(os.getenv('MPESA_TOKEN_REFRESH_SECONDS', '300'))  # Refresh the OAuth token this long before it expires
+    MPESA_TOKEN_WAIT_SECONDS = float(os.getenv('MPESA_TOKEN_WAIT_SECONDS', '10'))  # How long a request waits for another worker's refresh
     # B2C Payment Configuration (for partner payouts)
     # MPESA_INITIATOR_NAME = os.getenv('MPESA_INITIATOR_NAME')
     # MPESA_INITIATOR_PASSWORD = os.getenv('MPESA_INITIATOR_PASSWORD')
     # MPESA_SECURITY_CREDENTIAL = os.getenv('MPESA_SECURITY_CREDENTIAL')  # Encrypted credential for production
-    
+
+    # Outbound HTTP (M-Pesa, SMS, image downloads) - pooled per upstream, see app/utils/http_client.py
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '15'))
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))  # Kept-alive connections per host, per worker
+    HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))  # Extra attempts for idempotent calls
+    HTTP_RETRY_BACKOFF_SECONDS = float(os.getenv('HTTP_RETRY_BACKOFF_SECONDS', '0.2'))  # Jittered, doubled per attempt
+    HTTP_BREAKER_FAILURES = int(os.getenv('HTTP_BREAKER_FAILURES', '5'))  # Consecutive failures that open an upstream's circuit
+    HTTP_BREAKER_RESET_SECONDS = int(os.getenv('HTTP_BREAKER_RESET_SECONDS', '30'))  # Fail fast this long before a trial call
+
     # Redis
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     
+    # Public listing cache - 'auto' uses Redis when REDIS_URL is reachable, else in-process LRU
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'auto')  # auto, redis, memory
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1024'))
+    LISTING_CACHE_SECONDS = int(os.getenv('LISTING_CACHE_SECONDS', '60'))
+    CACHE_VERSION_DIR = os.getenv('CACHE_VERSION_DIR', '')  # In-process cache's shared version files; defaults to the instance folder
+    PROMO_CACHE_SECONDS = int(os.getenv('PROMO_CACHE_SECONDS', '30'))  # Promo code lookups; edits are invalidated, other workers' copies age out
+    
+    # Event view counting - views are buffered ('auto' uses Redis when reachable) and flushed in batches
+    VIEW_COUNTER_BACKEND = os.getenv('VIEW_COUNTER_BACKEND', 'auto')  # auto, redis, memory
+    VIEW_FLUSH_SECONDS = int(os.getenv('VIEW_FLUSH_SECONDS', '10'))  # 0 disables the flush thread
+    VIEW_DEDUP_SECONDS = int(os.getenv('VIEW_DEDUP_SECONDS', '1800'))  # Repeat views per user/IP ignored
+    VIEW_DEDUP_MAX_ENTRIES = int(os.getenv('VIEW_DEDUP_MAX_ENTRIES', '100000'))
+    
     # AWS S3
     AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
     AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
@@ -135,10 +162,46 @@ class Config:
     MAX_HOSTS_PER_EVENT = 2
     MAX_INTERESTS_PER_EVENT = 5
     PROMOTION_PRICE_PER_DAY = 400  # KES
+    BOOKING_HOLD_MINUTES = int(os.getenv('BOOKING_HOLD_MINUTES', '5'))  # Tickets held for unpaid bookings
+    CART_MAX_TICKET_TYPES = int(os.getenv('CART_MAX_TICKET_TYPES', '10'))  # Ticket types per checkout
+    RESERVATION_SWEEP_SECONDS = int(os.getenv('RESERVATION_SWEEP_SECONDS', '30'))  # Expired hold sweeper; 0 disables the thread
+    CATEGORY_COUNT_RECONCILE_SECONDS = int(os.getenv('CATEGORY_COUNT_RECONCILE_SECONDS', '300'))  # Sweeper leader recomputes category event counts; 0 disables
+    QR_CACHE_MAX_BYTES = int(os.getenv('QR_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))  # Rendered ticket QR images kept per worker
+    QR_SIGNING_KEYS = os.getenv('QR_SIGNING_KEYS', '')  # "K2:secret,K1:old-secret" - first signs, all verify; defaults to a key derived from SECRET_KEY
+    QR_ACCEPT_UNSIGNED = os.getenv('QR_ACCEPT_UNSIGNED', 'True') == 'True'  # Scan bare ticket numbers from codes issued before signing
+    CHECKIN_MANIFEST_OVERLAP_SECONDS = int(os.getenv('CHECKIN_MANIFEST_OVERLAP_SECONDS', '10'))  # Delta manifests re-send changes this far before the cursor
+    
+    # Waiting room for on-sales - 'auto' queues in Redis when reachable, else in-process
+    WAITING_ROOM_BACKEND = os.getenv('WAITING_ROOM_BACKEND', 'auto')  # auto, redis, memory
+    WAITING_ROOM_RATE = float(os.getenv('WAITING_ROOM_RATE', '10'))  # Booking passes issued per second
+    WAITING_ROOM_BURST = int(os.getenv('WAITING_ROOM_BURST', '50'))  # Admitted at once when the room opens
+    WAITING_ROOM_PASS_SECONDS = int(os.getenv('WAITING_ROOM_PASS_SECONDS', '600'))  # How long a pass lasts once admitted
+    WAITING_ROOM_DURATION_MINUTES = int(os.getenv('WAITING_ROOM_DURATION_MINUTES', '120'))
+    
+    # Idempotency-Key replay for booking and payment initiation
+    IDEMPOTENCY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_TTL_HOURS', '24'))  # How long a key's response is replayed
+    IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '60'))  # After this an unfinished request's key is taken over
+    IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '10'))  # How long a duplicate waits for the first request
+    
+    # Ticket PDFs - cached per booking ('auto' uses Redis when reachable) and rendered in a process pool
+    PDF_CACHE_BACKEND = os.getenv('PDF_CACHE_BACKEND', 'auto')  # auto, redis, memory
+    PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))  # In-process cache size per worker
+    PDF_CACHE_SECONDS = int(os.getenv('PDF_CACHE_SECONDS', '86400'))  # Redis entry lifetime
+    PDF_RENDER_PROCESSES = int(os.getenv('PDF_RENDER_PROCESSES', '2'))  # Render processes per worker; 0 renders inline
+    PDF_RENDER_TIMEOUT = int(os.getenv('PDF_RENDER_TIMEOUT', '30'))
     
     # Pagination
     ITEMS_PER_PAGE = 20
     MAX_ITEMS_PER_PAGE = 100
+    # How long approximate totals for cursor-paginated lists are cached
+    PAGINATION_COUNT_CACHE_SECONDS = int(os.getenv('PAGINATION_COUNT_CACHE_SECONDS', '60'))
+    
+    # Autocomplete prefix index - rebuilt when indexed names change, and at least this often
+    AUTOCOMPLETE_INDEX_MAX_AGE = int(os.getenv('AUTOCOMPLETE_INDEX_MAX_AGE', '300'))
+    AUTOCOMPLETE_MIN_REBUILD_SECONDS = int(os.getenv('AUTOCOMPLETE_MIN_REBUILD_SECONDS', '30'))  # Least time between index rebuilds after name changes
+    
+    # Nearby events search
+    NEARBY_MAX_RADIUS_KM = float(os.getenv('NEARBY_MAX_RADIUS_KM', '200'))
 
 
 class DevelopmentConfig(Config):
@@ -159,6 +222,14 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///test.db'
+    CACHE_BACKEND = 'memory'  # Never depend on a local Redis in tests
+    VIEW_COUNTER_BACKEND = 'memory'
+    VIEW_FLUSH_SECONDS = 0  # Tests call flush_views() directly
+    RESERVATION_SWEEP_SECONDS = 0  # Tests call sweep_expired() directly
+    PDF_CACHE_BACKEND = 'memory'
+    PDF_RENDER_PROCESSES = 0  # Render in the request thread
+    WAITING_ROOM_BACKEND = 'memory'
+    MPESA_TOKEN_BACKEND = 'memory'
     WTF_CSRF_ENABLED = False
 
 
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Safaricom Daraja API, for tests and benchmarks
+
+Implements the endpoints MPesaClient calls:
+
+- GET  /oauth/v1/generate               tokens lasting --token-seconds
+- POST /mpesa/stkpush/v1/processrequest accepted; with --callback, a paid
+                                        callback is posted to CallBackURL
+- POST /mpesa/stkpushquery/v1/query     reports the push as paid
+- POST /mpesa/b2c/v1/paymentrequest     accepted
+
+Payment calls need a bearer token the stub issued and that has not expired
+or been revoked, and get 401 otherwise, like Daraja. GET /stub/stats returns
+request counts, and POST /stub/revoke invalidates every issued token.
+
+Point the app at it with MPESA_BASE_URL=http://127.0.0.1:8089.
+
+Usage: python daraja_stub.py [--port 8089] [--latency-ms 0] [--token-seconds 3599] [--callback]
+"""
+
+import argparse
+import base64
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+import requests
+from flask import Flask, request, jsonify
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+
+def create_stub_app(latency_ms=0, token_seconds=3599, callback=False, callback_delay=1.0):
+    """The stub as a Flask app; app.config['STUB_STATE'] holds its tokens and counters"""
+    app = Flask('daraja_stub')
+    state = {'tokens': {}, 'counts': Counter(), 'lock': threading.Lock()}
+    app.config['STUB_STATE'] = state
+
+    def pause():
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+
+    def count(name):
+        with state['lock']:
+            state['counts'][name] += 1
+
+    def authorized():
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        expires_at = state['tokens'].get(token)
+        return expires_at is not None and expires_at > time.time()
+
+    def rejected():
+        return jsonify({
+            'requestId': uuid.uuid4().hex,
+            'errorCode': '404.001.03',
+            'errorMessage': 'Invalid Access Token'
+        }), 401
+
+    @app.get('/oauth/v1/generate')
+    def generate_token():
+        count('oauth')
+        pause()
+        try:
+            key, _, secret = base64.b64decode(request.headers.get('Authorization', '')[6:]).decode().partition(':')
+        except ValueError:
+            key = secret = ''
+        if not key or not secret:
+            return jsonify({'errorCode': '400.008.01', 'errorMessage': 'Invalid Authentication passed'}), 400
+        token = uuid.uuid4().hex
+        with state['lock']:
+            state['tokens'][token] = time.time() + token_seconds
+        return jsonify({'access_token': token, 'expires_in': str(token_seconds)})
+
+    @app.post('/mpesa/stkpush/v1/processrequest')
+    def stk_push():
+        count('stk_push')
+        pause()
+        if not authorized():
+            count('rejected')
+            return rejected()
+        payload = request.get_json()
+        merchant_request_id = f'stub-{uuid.uuid4().hex[:12]}'
+        checkout_request_id = f'ws_CO_{uuid.uuid4().hex[:20]}'
+        if callback and payload.get('CallBackURL'):
+            threading.Timer(callback_delay, _send_callback, args=(
+                payload, merchant_request_id, checkout_request_id
+            )).start()
+        return jsonify({
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing'
+        })
+
+    @app.post('/mpesa/stkpushquery/v1/query')
+    def stk_query():
+        count('stk_query')
+        pause()
+        if not authorized():
+            count('rejected')
+            return rejected()
+        payload = request.get_json()
+        return jsonify({
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'MerchantRequestID': f'stub-{uuid.uuid4().hex[:12]}',
+            'CheckoutRequestID': payload.get('CheckoutRequestID'),
+            'ResultCode': '0',
+            'ResultDesc': 'The service request is processed successfully.'
+        })
+
+    @app.post('/mpesa/b2c/v1/paymentrequest')
+    def b2c_payment():
+        count('b2c')
+        pause()
+        if not authorized():
+            count('rejected')
+            return rejected()
+        return jsonify({
+            'ConversationID': f'AG_{uuid.uuid4().hex[:20]}',
+            'OriginatorConversationID': uuid.uuid4().hex[:20],
+            'ResponseCode': '0',
+            'ResponseDescription': 'Accept the service request successfully.'
+        })
+
+    @app.get('/stub/stats')
+    def stats():
+        with state['lock']:
+            return jsonify(dict(state['counts'], tokens_issued=len(state['tokens'])))
+
+    @app.post('/stub/revoke')
+    def revoke():
+        with state['lock']:
+            state['tokens'].clear()
+        return jsonify({'revoked': True})
+
+    return app
+
+
+def _send_callback(payload, merchant_request_id, checkout_request_id):
+    """Post a successful payment callback, as Daraja does once the customer enters their PIN"""
+    body = {
+        'Body': {
+            'stkCallback': {
+                'MerchantRequestID': merchant_request_id,
+                'CheckoutRequestID': checkout_request_id,
+                'ResultCode': 0,
+                'ResultDesc': 'The service request is processed successfully.',
+                'CallbackMetadata': {
+                    'Item': [
+                        {'Name': 'Amount', 'Value': payload.get('Amount')},
+                        {'Name': 'MpesaReceiptNumber', 'Value': f'STB{uuid.uuid4().hex[:7].upper()}'},
+                        {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+                        {'Name': 'PhoneNumber', 'Value': int(payload.get('PhoneNumber') or 0)}
+                    ]
+                }
+            }
+        }
+    }
+    try:
+        requests.post(payload['CallBackURL'], json=body, timeout=10)
+    except requests.RequestException as e:
+        print(f'Callback to {payload["CallBackURL"]} failed: {e}')
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def start_stub(port=0, **options):
+    """Serve the stub from a background thread; returns (server, base_url, state)"""
+    app = create_stub_app(**options)
+    server = make_server('127.0.0.1', port, app, threaded=True, request_handler=_QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}', app.config['STUB_STATE']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=int, default=0, help='Delay added to every response')
+    parser.add_argument('--token-seconds', type=int, default=3599, help='Lifetime of issued tokens')
+    parser.add_argument('--callback', action='store_true', help='Post a paid callback after each STK push')
+    args = parser.parse_args()
+
+    app = create_stub_app(args.latency_ms, args.token_seconds, args.callback)
+    print(f'Daraja stub on http://127.0.0.1:{args.port} - set MPESA_BASE_URL to this')
+    app.run(port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
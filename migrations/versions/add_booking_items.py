@@ -0,0 +1,57 @@
+"""add booking_items for cart bookings and hold tickets per ticket type
+
+Revision ID: add_booking_items
+Revises: add_promo_code_redemptions
+Create Date: 2026-10-20 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_booking_items'
+down_revision = 'add_promo_code_redemptions'
+branch_labels = None
+depends_on = None
+
+# Names the unnamed booking_id constraint so batch mode can drop it on SQLite
+NAMING_CONVENTION = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if 'booking_items' not in inspector.get_table_names():
+        op.create_table(
+            'booking_items',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('booking_id', sa.Integer(), nullable=False),
+            sa.Column('ticket_type_id', sa.Integer(), nullable=False),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.Column('unit_price', sa.Numeric(precision=10, scale=2), nullable=False),
+            sa.ForeignKeyConstraint(['booking_id'], ['bookings.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['ticket_type_id'], ['ticket_types.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_booking_items_booking_id', 'booking_items', ['booking_id'], unique=False)
+
+    # A cart booking holds one ledger row per ticket type
+    unique_constraints = inspector.get_unique_constraints('ticket_reservations')
+    booking_only = next((uc for uc in unique_constraints if uc['column_names'] == ['booking_id']), None)
+    if booking_only is not None:
+        with op.batch_alter_table('ticket_reservations', naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(booking_only['name'] or 'uq_ticket_reservations_booking_id', type_='unique')
+            batch_op.create_unique_constraint(
+                'uq_ticket_reservations_booking_ticket_type', ['booking_id', 'ticket_type_id']
+            )
+
+
+def downgrade():
+    with op.batch_alter_table('ticket_reservations') as batch_op:
+        batch_op.drop_constraint('uq_ticket_reservations_booking_ticket_type', type_='unique')
+        batch_op.create_unique_constraint('uq_ticket_reservations_booking_id', ['booking_id'])
+    op.drop_index('ix_booking_items_booking_id', table_name='booking_items')
+    op.drop_table('booking_items')
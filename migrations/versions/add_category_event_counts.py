@@ -0,0 +1,45 @@
+"""add denormalized upcoming event count to categories
+
+Revision ID: add_category_event_counts
+Revises: add_keyset_pagination_indexes
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_category_event_counts'
+down_revision = 'add_keyset_pagination_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = inspect(op.get_bind())
+    categories_columns = [col['name'] for col in inspector.get_columns('categories')]
+    
+    if 'upcoming_event_count' not in categories_columns:
+        op.add_column('categories', sa.Column('upcoming_event_count', sa.Integer(), nullable=False, server_default='0'))
+    if 'event_count_updated_at' not in categories_columns:
+        op.add_column('categories', sa.Column('event_count_updated_at', sa.DateTime(), nullable=True))
+    
+    # Backfill from the events table
+    op.execute("""
+        UPDATE categories SET
+            upcoming_event_count = (
+                SELECT COUNT(events.id) FROM events
+                WHERE events.category_id = categories.id
+                  AND events.is_published = true
+                  AND events.status = 'approved'
+                  AND events.start_date > CURRENT_TIMESTAMP
+            ),
+            event_count_updated_at = CURRENT_TIMESTAMP
+    """)
+
+
+def downgrade():
+    op.drop_column('categories', 'event_count_updated_at')
+    op.drop_column('categories', 'upcoming_event_count')
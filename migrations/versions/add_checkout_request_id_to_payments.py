@@ -0,0 +1,75 @@
+"""add checkout_request_id and merchant_request_id to payments
+
+Revision ID: add_checkout_request_id
+Revises: add_withdrawal_fee
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+import json
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_checkout_request_id'
+down_revision = 'add_withdrawal_fee'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    payments_columns = [col['name'] for col in inspector.get_columns('payments')]
+    
+    if 'checkout_request_id' not in payments_columns:
+        op.add_column('payments', sa.Column('checkout_request_id', sa.String(length=100), nullable=True))
+    if 'merchant_request_id' not in payments_columns:
+        op.add_column('payments', sa.Column('merchant_request_id', sa.String(length=100), nullable=True))
+    
+    # Backfill from the JSON metadata written by earlier STK pushes
+    payments_table = sa.table('payments',
+        sa.column('id', sa.Integer),
+        sa.column('payment_metadata', sa.JSON),
+        sa.column('checkout_request_id', sa.String),
+        sa.column('merchant_request_id', sa.String)
+    )
+    rows = conn.execute(
+        sa.select(payments_table.c.id, payments_table.c.payment_metadata)
+        .where(payments_table.c.payment_metadata.isnot(None))
+        .where(payments_table.c.checkout_request_id.is_(None))
+    ).fetchall()
+    
+    seen = set()
+    for payment_id, metadata in rows:
+        if isinstance(metadata, str):
+            try:
+                metadata = json.loads(metadata)
+            except ValueError:
+                continue
+        if not isinstance(metadata, dict):
+            continue
+        checkout_request_id = metadata.get('CheckoutRequestID')
+        # Keep the first payment for a duplicated id so the unique index can be built
+        if not checkout_request_id or checkout_request_id in seen:
+            continue
+        seen.add(checkout_request_id)
+        conn.execute(
+            payments_table.update()
+            .where(payments_table.c.id == payment_id)
+            .values(
+                checkout_request_id=checkout_request_id,
+                merchant_request_id=metadata.get('MerchantRequestID')
+            )
+        )
+    
+    op.create_index('ix_payments_checkout_request_id', 'payments', ['checkout_request_id'], unique=True)
+    op.create_index('ix_payments_merchant_request_id', 'payments', ['merchant_request_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_payments_merchant_request_id', table_name='payments')
+    op.drop_index('ix_payments_checkout_request_id', table_name='payments')
+    op.drop_column('payments', 'merchant_request_id')
+    op.drop_column('payments', 'checkout_request_id')
@@ -0,0 +1,45 @@
+"""add geohash column to events for nearby search
+
+Revision ID: add_event_geohash
+Revises: add_event_view_buckets
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+from app.utils.geo import encode_geohash
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_event_geohash'
+down_revision = 'add_event_view_buckets'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    events_columns = [col['name'] for col in inspector.get_columns('events')]
+    
+    if 'geohash' not in events_columns:
+        op.add_column('events', sa.Column('geohash', sa.String(length=12), nullable=True))
+        op.create_index('ix_events_geohash', 'events', ['geohash'], unique=False)
+    
+    # Backfill existing events that have coordinates
+    rows = bind.execute(sa.text(
+        'SELECT id, latitude, longitude FROM events '
+        'WHERE latitude IS NOT NULL AND longitude IS NOT NULL'
+    )).fetchall()
+    if rows:
+        bind.execute(
+            sa.text('UPDATE events SET geohash = :geohash WHERE id = :id'),
+            [{'id': row.id, 'geohash': encode_geohash(row.latitude, row.longitude)} for row in rows]
+        )
+
+
+def downgrade():
+    op.drop_index('ix_events_geohash', table_name='events')
+    op.drop_column('events', 'geohash')
@@ -0,0 +1,45 @@
+"""add full-text search index for events
+
+Revision ID: add_event_search_index
+Revises: add_checkout_request_id
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import text
+from app.utils.search import POSTGRESQL_SCHEMA, SQLITE_SCHEMA
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_event_search_index'
+down_revision = 'add_checkout_request_id'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    
+    if conn.dialect.name == 'postgresql':
+        for statement in POSTGRESQL_SCHEMA:
+            conn.execute(text(statement))
+    else:
+        # FTS5 shadow tables, kept in sync by triggers
+        for statement in SQLITE_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO events_fts(events_fts) VALUES ('rebuild')"))
+        conn.execute(text("INSERT INTO events_trigram(events_trigram) VALUES ('rebuild')"))
+
+
+def downgrade():
+    conn = op.get_bind()
+    
+    if conn.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_events_title_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_events_search_vector')
+        op.execute('ALTER TABLE events DROP COLUMN IF EXISTS search_vector')
+    else:
+        for trigger in ('events_search_ai', 'events_search_ad', 'events_search_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS events_trigram')
+        op.execute('DROP TABLE IF EXISTS events_fts')
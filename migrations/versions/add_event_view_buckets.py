@@ -0,0 +1,42 @@
+"""add hourly event view buckets
+
+Revision ID: add_event_view_buckets
+Revises: add_category_event_counts
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_event_view_buckets'
+down_revision = 'add_category_event_counts'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = inspect(op.get_bind())
+    if 'event_view_buckets' in inspector.get_table_names():
+        return
+    
+    op.create_table(
+        'event_view_buckets',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('event_id', sa.Integer(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('views', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['event_id'], ['events.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('event_id', 'bucket_start', name='unique_event_view_bucket')
+    )
+    op.create_index('ix_event_view_buckets_event_id', 'event_view_buckets', ['event_id'], unique=False)
+    op.create_index('ix_event_view_buckets_bucket_start', 'event_view_buckets', ['bucket_start'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_event_view_buckets_bucket_start', table_name='event_view_buckets')
+    op.drop_index('ix_event_view_buckets_event_id', table_name='event_view_buckets')
+    op.drop_table('event_view_buckets')
@@ -0,0 +1,46 @@
+"""add idempotency_keys for replaying retried booking and payment requests
+
+Revision ID: add_idempotency_keys
+Revises: add_ticket_updated_at
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_idempotency_keys'
+down_revision = 'add_ticket_updated_at'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if 'idempotency_keys' not in inspector.get_table_names():
+        op.create_table(
+            'idempotency_keys',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('scope', sa.String(length=150), nullable=False),
+            sa.Column('key', sa.String(length=255), nullable=False),
+            sa.Column('fingerprint', sa.String(length=64), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('locked_until', sa.DateTime(), nullable=True),
+            sa.Column('response_code', sa.Integer(), nullable=True),
+            sa.Column('response_body', sa.Text(), nullable=True),
+            sa.Column('response_mimetype', sa.String(length=100), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('scope', 'key', name='uq_idempotency_keys_scope_key')
+        )
+        op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
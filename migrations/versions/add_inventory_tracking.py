@@ -0,0 +1,42 @@
+"""add booking ticket type and event seats held for atomic inventory
+
+Revision ID: add_inventory_tracking
+Revises: add_event_geohash
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_inventory_tracking'
+down_revision = 'add_event_geohash'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = inspect(op.get_bind())
+    bookings_columns = [col['name'] for col in inspector.get_columns('bookings')]
+    events_columns = [col['name'] for col in inspector.get_columns('events')]
+    
+    if 'ticket_type_id' not in bookings_columns:
+        with op.batch_alter_table('bookings', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('ticket_type_id', sa.Integer(), nullable=True))
+            batch_op.create_index('ix_bookings_ticket_type_id', ['ticket_type_id'], unique=False)
+            batch_op.create_foreign_key('fk_bookings_ticket_type_id', 'ticket_types', ['ticket_type_id'], ['id'])
+    
+    if 'seats_held' not in events_columns:
+        op.add_column('events', sa.Column('seats_held', sa.Integer(), nullable=False, server_default='0'))
+    
+    # Existing pending bookings never took stock, so they start with no ticket type and hold nothing
+
+
+def downgrade():
+    op.drop_column('events', 'seats_held')
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_bookings_ticket_type_id', type_='foreignkey')
+        batch_op.drop_index('ix_bookings_ticket_type_id')
+        batch_op.drop_column('ticket_type_id')
@@ -0,0 +1,40 @@
+"""add composite indexes for keyset pagination
+
+Revision ID: add_keyset_pagination_indexes
+Revises: add_event_search_index
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_keyset_pagination_indexes'
+down_revision = 'add_event_search_index'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_events_start_date_id', 'events', ['start_date', 'id']),
+    ('ix_events_created_at_id', 'events', ['created_at', 'id']),
+    ('ix_bookings_user_created_at_id', 'bookings', ['user_id', 'created_at', 'id']),
+    ('ix_notifications_user_created_at_id', 'notifications', ['user_id', 'created_at', 'id']),
+    ('ix_payments_user_created_at_id', 'payments', ['user_id', 'created_at', 'id']),
+    ('ix_users_created_at_id', 'users', ['created_at', 'id']),
+]
+
+
+def upgrade():
+    inspector = inspect(op.get_bind())
+    
+    for name, table, columns in INDEXES:
+        existing = [index['name'] for index in inspector.get_indexes(table)]
+        if name not in existing:
+            op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
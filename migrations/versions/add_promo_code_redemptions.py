@@ -0,0 +1,58 @@
+"""normalize promo codes and count per-user promo code uses in promo_code_redemptions
+
+Revision ID: add_promo_code_redemptions
+Revises: add_idempotency_keys
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_promo_code_redemptions'
+down_revision = 'add_idempotency_keys'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    # Codes are now looked up by exact match on the unique index; normalize
+    # older rows unless that would collide with another code
+    op.execute("""
+        UPDATE promo_codes SET code = UPPER(TRIM(code))
+        WHERE code <> UPPER(TRIM(code))
+        AND NOT EXISTS (
+            SELECT 1 FROM promo_codes AS other WHERE other.code = UPPER(TRIM(promo_codes.code))
+        )
+    """)
+
+    if 'promo_code_redemptions' not in inspector.get_table_names():
+        op.create_table(
+            'promo_code_redemptions',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('promo_code_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('uses', sa.Integer(), nullable=False, server_default='0'),
+            sa.ForeignKeyConstraint(['promo_code_id'], ['promo_codes.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('promo_code_id', 'user_id', name='uq_promo_code_redemptions_code_user')
+        )
+
+        # Existing uses: every booking that still counts towards current_uses
+        op.execute("""
+            INSERT INTO promo_code_redemptions (promo_code_id, user_id, uses)
+            SELECT promo_code_id, user_id, COUNT(*) FROM bookings
+            WHERE promo_code_id IS NOT NULL
+            AND (status <> 'cancelled' OR confirmed_at IS NOT NULL)
+            GROUP BY promo_code_id, user_id
+        """)
+
+
+def downgrade():
+    op.drop_table('promo_code_redemptions')
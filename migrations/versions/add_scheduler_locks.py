@@ -0,0 +1,34 @@
+"""add scheduler locks for background job leader election
+
+Revision ID: add_scheduler_locks
+Revises: add_ticket_reservations
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_scheduler_locks'
+down_revision = 'add_ticket_reservations'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = inspect(op.get_bind())
+    if 'scheduler_locks' not in inspector.get_table_names():
+        op.create_table(
+            'scheduler_locks',
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('owner', sa.String(length=200), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.Column('acquired_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+
+def downgrade():
+    op.drop_table('scheduler_locks')
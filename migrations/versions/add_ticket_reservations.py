@@ -0,0 +1,73 @@
+"""add ticket reservation ledger and ticket type held counts
+
+Revision ID: add_ticket_reservations
+Revises: add_inventory_tracking
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_ticket_reservations'
+down_revision = 'add_inventory_tracking'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = inspector.get_table_names()
+    ticket_types_columns = [col['name'] for col in inspector.get_columns('ticket_types')]
+
+    if 'quantity_held' not in ticket_types_columns:
+        op.add_column('ticket_types', sa.Column('quantity_held', sa.Integer(), nullable=False, server_default='0'))
+
+    if 'ticket_reservations' not in tables:
+        op.create_table(
+            'ticket_reservations',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('booking_id', sa.Integer(), nullable=False),
+            sa.Column('event_id', sa.Integer(), nullable=False),
+            sa.Column('ticket_type_id', sa.Integer(), nullable=False),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['booking_id'], ['bookings.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['event_id'], ['events.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['ticket_type_id'], ['ticket_types.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('booking_id')
+        )
+        op.create_index('ix_ticket_reservations_ticket_type_id', 'ticket_reservations', ['ticket_type_id'], unique=False)
+        op.create_index('ix_ticket_reservations_expires_at', 'ticket_reservations', ['expires_at'], unique=False)
+        op.create_index('ix_ticket_reservations_event_expires_at', 'ticket_reservations', ['event_id', 'expires_at'], unique=False)
+
+    # Pending bookings with a ticket type already hold stock; record their holds in the ledger
+    now = datetime.utcnow()
+    bind.execute(sa.text("""
+        INSERT INTO ticket_reservations (booking_id, event_id, ticket_type_id, quantity, expires_at, created_at)
+        SELECT b.id, b.event_id, b.ticket_type_id, COALESCE(b.quantity, 1), COALESCE(b.reserved_until, :now), :now
+        FROM bookings b
+        WHERE b.status = 'pending'
+        AND b.ticket_type_id IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM ticket_reservations r WHERE r.booking_id = b.id)
+    """), {'now': now})
+    op.execute("""
+        UPDATE ticket_types SET quantity_held = (
+            SELECT COALESCE(SUM(r.quantity), 0) FROM ticket_reservations r
+            WHERE r.ticket_type_id = ticket_types.id
+        )
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_ticket_reservations_event_expires_at', table_name='ticket_reservations')
+    op.drop_index('ix_ticket_reservations_expires_at', table_name='ticket_reservations')
+    op.drop_index('ix_ticket_reservations_ticket_type_id', table_name='ticket_reservations')
+    op.drop_table('ticket_reservations')
+    op.drop_column('ticket_types', 'quantity_held')
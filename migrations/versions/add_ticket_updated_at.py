@@ -0,0 +1,37 @@
+"""add tickets.updated_at as the change cursor for check-in manifests
+
+Revision ID: add_ticket_updated_at
+Revises: serve_ticket_qr_on_demand
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_ticket_updated_at'
+down_revision = 'serve_ticket_qr_on_demand'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tickets_columns = [col['name'] for col in inspector.get_columns('tickets')]
+
+    if 'updated_at' not in tickets_columns:
+        op.add_column('tickets', sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.create_index('ix_tickets_updated_at', 'tickets', ['updated_at'], unique=False)
+
+    op.execute("""
+        UPDATE tickets SET updated_at = COALESCE(scanned_at, created_at)
+        WHERE updated_at IS NULL
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_tickets_updated_at', table_name='tickets')
+    op.drop_column('tickets', 'updated_at')
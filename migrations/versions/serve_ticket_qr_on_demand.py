@@ -0,0 +1,33 @@
+"""point ticket qr_code at the on-demand QR endpoint instead of PNG files
+
+Revision ID: serve_ticket_qr_on_demand
+Revises: add_scheduler_locks
+Create Date: 2026-10-17 22:00:00.000000
+
+QR images are now rendered on request by /api/tickets/<ticket_number>/qr.png,
+so uploads/qrcodes/ is no longer read. Once this has run on every node the
+directory can be deleted.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'serve_ticket_qr_on_demand'
+down_revision = 'add_scheduler_locks'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        UPDATE tickets SET qr_code = '/api/tickets/' || ticket_number || '/qr.png'
+        WHERE qr_code IS NULL OR qr_code LIKE '/uploads/qrcodes/%'
+    """)
+
+
+def downgrade():
+    # The PNG files are only present if uploads/qrcodes/ was kept
+    op.execute("""
+        UPDATE tickets SET qr_code = '/uploads/qrcodes/' || ticket_number || '.png'
+        WHERE qr_code LIKE '/api/tickets/%/qr.png'
+    """)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Load test for gate check-in (POST /api/tickets/scan)
+
+Drives several events at a steady rate of scans per second each (50 by
+default), as a mix of signed and pre-signing bare-number codes. A share of
+tickets are presented at two gates at the same moment. Afterwards it checks
+that no ticket was admitted twice and that the tickets and bookings tables
+agree with what the gates were told, and reports scan latency.
+
+Runs against a throwaway SQLite file by default. Set DATABASE_URL to an empty
+PostgreSQL database to test there.
+
+Usage: python stress_test_checkin.py [--events 4] [--rate 50] [--seconds 10] [--threads 32]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stress.db')}"
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['VIEW_COUNTER_BACKEND'] = 'memory'
+os.environ['RESERVATION_SWEEP_SECONDS'] = '0'
+os.environ['PDF_RENDER_PROCESSES'] = '0'
+os.environ.setdefault('MAIL_SUPPRESS_SEND', 'True')
+
+from config import DevelopmentConfig
+if os.environ['DATABASE_URL'].startswith('sqlite'):
+    # Writers queue on SQLite's database lock instead of failing immediately
+    DevelopmentConfig.SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 60}}
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import func
+from app import create_app, db, limiter
+from app.models import Category, Partner, User, Event, TicketType, Booking, Ticket
+from app.utils.qrcode_generator import sign_ticket
+from app.utils.ticket_issuance import issue_tickets
+
+
+TICKETS_PER_BOOKING = 4
+
+
+def seed(events, tickets_per_event):
+    category = Category(name='Music', slug='music')
+    db.session.add(category)
+    db.session.flush()
+    partner = Partner(email='gate@nikofree.test', phone_number='0700000000', password_hash='x',
+                      business_name='Gate Test', category_id=category.id, status='approved')
+    user = User(email='attendee@nikofree.test', first_name='Gate', last_name='Attendee')
+    db.session.add_all([partner, user])
+    db.session.flush()
+    event_tickets = {}
+    for i in range(events):
+        event = Event(title=f'Doors open {i}', description='Load test', partner_id=partner.id,
+                      category_id=category.id, start_date=datetime.utcnow() + timedelta(hours=1),
+                      status='approved', is_published=True)
+        db.session.add(event)
+        db.session.flush()
+        ticket_type = TicketType(event_id=event.id, name='Regular', price=0, quantity_total=tickets_per_event,
+                                 quantity_available=tickets_per_event)
+        db.session.add(ticket_type)
+        db.session.flush()
+        codes = []
+        for _ in range(0, tickets_per_event, TICKETS_PER_BOOKING):
+            booking = Booking(user_id=user.id, event_id=event.id, ticket_type_id=ticket_type.id,
+                              quantity=TICKETS_PER_BOOKING, total_amount=0, status='confirmed',
+                              confirmed_at=datetime.utcnow())
+            db.session.add(booking)
+            db.session.flush()
+            for ticket in issue_tickets(booking, ticket_type.id):
+                codes.append((ticket.id, sign_ticket(ticket.id, event.id, ticket_type.id), ticket.ticket_number))
+        event_tickets[event.id] = codes
+    db.session.commit()
+    return partner.id, event_tickets
+
+
+def percentiles(label, timings):
+    timings = sorted(timings)
+
+    def pick(fraction):
+        return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+    print(f'{label:<24} p50 {pick(0.50):8.2f} ms   p95 {pick(0.95):8.2f} ms   p99 {pick(0.99):8.2f} ms')
+
+
+def check(event_tickets, admitted):
+    ok = True
+    twice = [ticket_id for ticket_id, count in admitted.items() if count > 1]
+    if twice:
+        print(f'FAIL: {len(twice)} tickets admitted more than once, e.g. {twice[:5]}')
+        ok = False
+    for event_id in event_tickets:
+        scanned = db.session.query(func.count(Ticket.id)).join(Booking, Ticket.booking_id == Booking.id).filter(
+            Booking.event_id == event_id, Ticket.is_scanned == True
+        ).scalar()
+        told = sum(1 for ticket_id, _, _ in event_tickets[event_id] if admitted.get(ticket_id))
+        if scanned != told:
+            print(f'FAIL: event {event_id} has {scanned} scanned tickets but gates admitted {told}')
+            ok = False
+        missing = db.session.query(func.count(Booking.id)).filter(
+            Booking.event_id == event_id,
+            func.coalesce(Booking.is_checked_in, False) == False,
+            Booking.tickets.any(Ticket.is_scanned == True)
+        ).scalar()
+        if missing:
+            print(f'FAIL: event {event_id} has {missing} bookings with scanned tickets not marked checked in')
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=50, help='Scans per second per event')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--double-scan', type=float, default=0.1, help='Share of tickets presented at two gates at once')
+    args = parser.parse_args()
+
+    app = create_app('development')
+    limiter.enabled = False
+    print(f"Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    scans_per_event = int(args.rate * args.seconds)
+    rng = random.Random(1)
+
+    with app.app_context():
+        db.create_all()
+        partner_id, event_tickets = seed(args.events, scans_per_event + TICKETS_PER_BOOKING)
+        token = create_access_token(identity=str(partner_id), additional_claims={'type': 'partner'})
+    headers = {'Authorization': f'Bearer {token}'}
+
+    # (due offset, event id, ticket id, qr data), the same ticket twice for double scans
+    schedule = []
+    for event_id, codes in event_tickets.items():
+        for i, (ticket_id, signed, ticket_number) in enumerate(codes[:scans_per_event]):
+            due = i / args.rate
+            qr_data = signed if rng.random() < 0.7 else ticket_number
+            schedule.append((due, event_id, ticket_id, qr_data))
+            if rng.random() < args.double_scan:
+                schedule.append((due, event_id, ticket_id, qr_data))
+    schedule.sort(key=lambda scan: scan[0])
+
+    local = threading.local()
+    admitted = Counter()
+    statuses = Counter()
+    timings = []
+    lock = threading.Lock()
+
+    def scan(item):
+        _, event_id, ticket_id, qr_data = item
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        started = time.perf_counter()
+        response = local.client.post('/api/tickets/scan', json={'qr_data': qr_data, 'event_id': event_id},
+                                     headers=headers)
+        elapsed = (time.perf_counter() - started) * 1000
+        body = response.get_json() or {}
+        with lock:
+            timings.append(elapsed)
+            statuses[body.get('error') or body.get('message') or response.status_code] += 1
+            if body.get('success'):
+                admitted[ticket_id] += 1
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for item in schedule:
+            delay = started + item[0] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(scan, item)
+    elapsed = time.monotonic() - started
+
+    print(f'{len(schedule)} scans across {args.events} events in {elapsed:.1f}s '
+          f'({len(schedule) / elapsed / args.events:.1f}/s per event, target {args.rate:g})')
+    for status, count in statuses.most_common():
+        print(f'  {count:6d}  {status}')
+    percentiles('scan latency', timings)
+
+    with app.app_context():
+        ok = check(event_tickets, admitted)
+    print('OK - every ticket admitted at most once' if ok else 'FAILED')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
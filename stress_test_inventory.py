@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for the ticket inventory (app/utils/inventory.py)
+
+Fires hundreds of parallel bookings at one event whose ticket stock, attendee
+capacity and promo code limit are all smaller than the demand, then races
+duplicate payment confirmations against cancellations. Afterwards it checks
+that nothing was oversold and every counter matches the bookings table.
+
+Runs against a throwaway SQLite file by default. Set DATABASE_URL to an empty
+PostgreSQL database to test row-lock behaviour there.
+
+Usage: python stress_test_inventory.py [--bookings 400] [--threads 64] [--stock 150]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stress.db')}"
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['VIEW_COUNTER_BACKEND'] = 'memory'
+os.environ.setdefault('MAIL_SUPPRESS_SEND', 'True')
+
+from config import DevelopmentConfig
+if os.environ['DATABASE_URL'].startswith('sqlite'):
+    # Writers queue on SQLite's database lock instead of failing immediately
+    DevelopmentConfig.SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 60}}
+
+from sqlalchemy import func
+from app import create_app, db
+from app.models import Category, Partner, User, Event, TicketType, Booking, PromoCode, TicketReservation
+from app.utils.inventory import InventoryError, reserve, confirm_booking, release_booking
+
+
+def seed(stock, capacity, promo_limit, users):
+    category = Category(name='Music', slug='music')
+    db.session.add(category)
+    db.session.flush()
+    partner = Partner(email='stress@nikofree.test', phone_number='0700000000', password_hash='x',
+                      business_name='Stress Test', category_id=category.id, status='approved')
+    db.session.add(partner)
+    db.session.flush()
+    event = Event(title='Flash sale', description='Stress test', partner_id=partner.id, category_id=category.id,
+                  start_date=datetime.utcnow() + timedelta(days=7), status='approved', is_published=True,
+                  is_free=False, attendee_capacity=capacity)
+    db.session.add(event)
+    db.session.flush()
+    ticket_type = TicketType(event_id=event.id, name='Regular', price=500, quantity_total=stock,
+                             quantity_available=stock, quantity_sold=0, max_per_order=4)
+    promo = PromoCode(event_id=event.id, code='FLASH', discount_type='percentage', discount_value=10,
+                      max_uses=promo_limit, current_uses=0, created_by=partner.id)
+    db.session.add_all([ticket_type, promo])
+    db.session.add_all([
+        User(email=f'user{i}@nikofree.test', first_name='Stress', last_name=str(i)) for i in range(users)
+    ])
+    db.session.commit()
+    return event.id, ticket_type.id, promo.id
+
+
+def book(app, event_id, ticket_type_id, promo_id, user_id, quantity, use_promo):
+    with app.app_context():
+        booking = Booking(user_id=user_id, event_id=event_id, ticket_type_id=ticket_type_id, quantity=quantity,
+                          total_amount=500 * quantity, promo_code_id=promo_id if use_promo else None,
+                          status='pending', payment_status='unpaid',
+                          reserved_until=datetime.utcnow() + timedelta(minutes=5))
+        db.session.add(booking)
+        try:
+            db.session.flush()
+            reserve(booking, hold=True)
+            db.session.commit()
+            return booking.id
+        except InventoryError:
+            db.session.rollback()
+            return None
+
+
+def settle(app, booking_id, action):
+    with app.app_context():
+        booking = db.session.get(Booking, booking_id)
+        changed = confirm_booking(booking) if action == 'confirm' else release_booking(booking)
+        db.session.commit()
+        return action, changed
+
+
+def check(event_id, ticket_type_id, promo_id, stock, capacity, promo_limit):
+    event = db.session.get(Event, event_id)
+    ticket_type = db.session.get(TicketType, ticket_type_id)
+    promo = db.session.get(PromoCode, promo_id)
+
+    def booked(status, **filters):
+        return db.session.query(func.coalesce(func.sum(Booking.quantity), 0)).filter(
+            Booking.status == status, *[getattr(Booking, k) == v for k, v in filters.items()]
+        ).scalar()
+
+    held, sold = booked('pending'), booked('confirmed')
+    ledger = db.session.query(func.coalesce(func.sum(TicketReservation.quantity), 0)).scalar()
+    # Cancelling a paid booking keeps its promo use
+    promo_uses = Booking.query.filter(
+        Booking.promo_code_id == promo_id,
+        (Booking.status != 'cancelled') | (Booking.payment_status == 'paid')
+    ).count()
+
+    results = [
+        ('stock never negative', ticket_type.quantity_available >= 0),
+        ('stock + held + sold == total', ticket_type.quantity_available + held + sold == stock),
+        ('quantity_sold matches confirmed bookings', ticket_type.quantity_sold == sold),
+        ('quantity_held matches pending bookings', ticket_type.quantity_held == held),
+        ('reservation ledger matches pending bookings', ledger == held),
+        ('seats_held matches pending bookings', event.seats_held == held),
+        ('attendee_count matches confirmed bookings', event.attendee_count == sold),
+        ('attendee_capacity respected', event.attendee_count + event.seats_held <= capacity),
+        ('promo uses match live bookings', promo.current_uses == promo_uses),
+        ('promo limit respected', promo.current_uses <= promo_limit),
+    ]
+    print(f'stock {stock}: available {ticket_type.quantity_available}, held {held}, sold {sold}; '
+          f'capacity {capacity}: taken {event.attendee_count + event.seats_held}; '
+          f'promo {promo.current_uses}/{promo_limit}')
+    for label, ok in results:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    return all(ok for _, ok in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bookings', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--stock', type=int, default=150)
+    args = parser.parse_args()
+    capacity = args.stock - 10  # Capacity binds before stock does
+    promo_limit = 25
+
+    app = create_app('development')
+    print(f"Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    rng = random.Random(1)
+
+    with app.app_context():
+        db.create_all()
+        event_id, ticket_type_id, promo_id = seed(args.stock, capacity, promo_limit, args.bookings)
+        user_ids = [user.id for user in User.query.order_by(User.id)]
+
+    start = threading.Barrier(args.threads)
+
+    def book_task(i):
+        if i < args.threads:
+            start.wait()  # Release the first wave of bookings together
+        return book(app, event_id, ticket_type_id, promo_id, user_ids[i], rng.randint(1, 4), i % 3 == 0)
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        booking_ids = [booking_id for booking_id in pool.map(book_task, range(args.bookings)) if booking_id]
+    print(f'{args.bookings} parallel booking attempts, {len(booking_ids)} reserved')
+    with app.app_context():
+        ok = check(event_id, ticket_type_id, promo_id, args.stock, capacity, promo_limit)
+
+    # Each booking gets two confirmations (a repeated callback) racing a cancellation
+    actions = [(booking_id, action) for booking_id in booking_ids for action in ('confirm', 'confirm', 'cancel')]
+    rng.shuffle(actions)
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        outcomes = list(pool.map(lambda item: settle(app, *item), actions))
+    confirmed = sum(1 for action, changed in outcomes if action == 'confirm' and changed)
+    cancelled = sum(1 for action, changed in outcomes if action == 'cancel' and changed)
+    print(f'{len(actions)} racing confirm/cancel calls: {confirmed} confirmations and {cancelled} cancellations applied')
+
+    with app.app_context():
+        ok = check(event_id, ticket_type_id, promo_id, args.stock, capacity, promo_limit) and ok
+    print('OK - no oversell' if ok else 'FAILED')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())